@@ -93,8 +93,28 @@ class _Measurer:
         )
 
 
+class Counters:
+    """Named counters of events (e.g. hits and misses of caches)."""
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+
+    def increment(self, name: str, value: int = 1):
+        self._counts[name] += value
+
+    def __getitem__(self, name: str) -> int:
+        return self._counts.get(name, 0)
+
+    def as_dict(self) -> dict:
+        return dict(self._counts)
+
+    def reset(self):
+        self._counts.clear()
+
+
 DEFAULT_CONTEXT = DiagnosticContext()
 DEFAULT_CONTEXT_TOTAL = DiagnosticContextTotal()
+DEFAULT_COUNTERS = Counters()
 
 
 def measured(
@@ -127,6 +147,9 @@ def measured_total(_func=None):
     return measured(_func, diagnostic_context=DEFAULT_CONTEXT_TOTAL)
 
 
+count = DEFAULT_COUNTERS.increment
+
+
 if __name__ == '__main__':
     from restrictions import SegmentsNormal, SegmentsSpotsJoint
     from project import CADProject
@@ -0,0 +1,114 @@
+"""Benchmark of solving of full system at once and by blocks of
+block-triangular decomposition: chain of joined segments with fixed lengths
+and angles, the first segment is fixed, so every segment is determined by
+the previous one.
+
+Run from the root of repository: python experiments/benchmark_blocks.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import diagnostic_context  # noqa: E402
+from restrictions import (  # noqa: E402
+    SegmentFixed,
+    SegmentLengthFixed,
+    SegmentAngleFixed,
+    SegmentsSpotsJoint,
+)
+from solve import EquationsSystem  # noqa: E402
+
+LENGTH = 10.0
+ANGLE = np.pi / 6
+
+
+def make_chain(n_segments: int):
+    """System of chain and values of its symbols (a straight line along x
+    axis, so the chain must be rotated).
+    """
+    system = EquationsSystem()
+    names = [f'segment_{i}' for i in range(n_segments)]
+    symbols = []
+    for name in names:
+        system.add_figure_symbols(name, ['x1', 'y1', 'x2', 'y2'])
+        symbols.append(system.get_symbols(name))
+
+    restrictions = [('fixed', SegmentFixed(0, 0, LENGTH, 0), [0])]
+    for i in range(1, n_segments):
+        restrictions.append((f'length_{i}', SegmentLengthFixed(LENGTH), [i]))
+        restrictions.append((f'angle_{i}', SegmentAngleFixed(ANGLE), [i]))
+        restrictions.append(
+            (f'joint_{i}', SegmentsSpotsJoint('end', 'start'), [i - 1, i])
+        )
+    for name, restriction, ids in restrictions:
+        system.add_restriction_equations(
+            name,
+            restriction.get_equations(*[symbols[i] for i in ids]),
+            restriction,
+            [names[i] for i in ids],
+        )
+
+    values = {
+        name: {
+            'x1': LENGTH * i,
+            'y1': 0.0,
+            'x2': LENGTH * (i + 1),
+            'y2': 0.0,
+        }
+        for i, name in enumerate(names)
+    }
+    return system, values
+
+
+def solve_at_once(system: EquationsSystem, values: dict):
+    """Solve all equations of system as one system."""
+    equations = list(system._equations.values())
+    desired_values = {
+        f'{figure_name}___{name}': value
+        for figure_name, figure_values in values.items()
+        for name, value in figure_values.items()
+    }
+    return system._solve_system(
+        equations, dict(system._symbols), desired_values
+    )
+
+
+def main():
+    diagnostic_context.VERBOSE = False
+    print(
+        f'{"symbols":>8} {"at once, s":>10} {"blocks, s":>10} '
+        f'{"again, s":>9}'
+    )
+    for n_segments in (3, 10, 25, 50):
+        system, values = make_chain(n_segments)
+
+        start = timer()
+        solve_at_once(system, values)
+        at_once_time = timer() - start
+
+        start = timer()
+        result = system.solve(values)
+        blocks_time = timer() - start
+
+        last = result[f'segment_{n_segments - 1}']
+        angle = np.arctan2(last['y2'] - last['y1'], last['x2'] - last['x1'])
+        assert np.isclose(angle, ANGLE)
+
+        # E.g. after addition of restriction to other figures
+        start = timer()
+        system.solve(result)
+        again_time = timer() - start
+
+        print(
+            f'{4 * n_segments:>8} {at_once_time:>10.3f} {blocks_time:>10.3f} '
+            f'{again_time:>9.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
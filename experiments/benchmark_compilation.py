@@ -0,0 +1,106 @@
+"""Micro-benchmark of compiled systems: one vectorized residual function
+(with common subexpressions elimination) against a list of lambdified
+functions (one per equation).
+
+Run from the root of repository: python experiments/benchmark_compilation.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from sympy import Symbol, lambdify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from restrictions import (  # noqa: E402
+    SegmentsAngleBetweenFixed,
+    SegmentsNormal,
+    SegmentsParallel,
+    SegmentsSpotsJoint,
+    SegmentFixed,
+    SegmentLengthFixed,
+)
+from solve import EquationsSystem  # noqa: E402
+
+N_CALLS = 2000
+
+
+def make_chain(n_segments: int):
+    """Square system: chain of joined segments with alternating
+    restrictions, first segment is fixed, lengths of others are fixed.
+    """
+    segments = [
+        {
+            name: Symbol(f'segment_{i}___{name}')
+            for name in ('x1', 'y1', 'x2', 'y2')
+        }
+        for i in range(n_segments)
+    ]
+    restrictions = [
+        SegmentsNormal(),
+        SegmentsParallel(),
+        SegmentsAngleBetweenFixed(np.pi / 3),
+    ]
+
+    system = SegmentFixed(0, 0, 10, 0).get_equations(segments[0])
+    for segment in segments[1:]:
+        system.extend(SegmentLengthFixed(10).get_equations(segment))
+    for i, (s1, s2) in enumerate(zip(segments[:-1], segments[1:])):
+        system.extend(SegmentsSpotsJoint('end', 'start').get_equations(s1, s2))
+        restriction = restrictions[i % len(restrictions)]
+        system.extend(restriction.get_equations(s1, s2))
+
+    symbols = [sym for segment in segments for sym in segment.values()]
+    canonical = [eq.lhs - eq.rhs for eq in system]
+    return canonical, symbols
+
+
+def list_of_functions(system: list, symbols: list):
+    """Previous implementation: one lambdified function per equation."""
+    functions = [lambdify(symbols, f, dummify=False) for f in system]
+
+    def fun(x, params=()):
+        return np.array([f(*x, *params) for f in functions])
+
+    return fun
+
+
+def measure(fun, x):
+    start = timer()
+    for _ in range(N_CALLS):
+        fun(x)
+    return (timer() - start) / N_CALLS
+
+
+def main():
+    print(
+        f'{"segments":>8} {"equations":>9} {"compile, s":>22} '
+        f'{"call, us":>20} {"speedup":>7}'
+    )
+    for n_segments in (2, 5, 10, 25, 50):
+        system, symbols = make_chain(n_segments)
+        x = np.random.RandomState(0).random_sample(len(symbols)) * 100
+
+        start = timer()
+        old_fun = list_of_functions(system, symbols)
+        old_compile = timer() - start
+
+        start = timer()
+        new_fun = EquationsSystem._system_to_function(system, symbols, [])
+        new_compile = timer() - start
+
+        assert np.allclose(old_fun(x), new_fun(x))
+
+        old_call, new_call = measure(old_fun, x), measure(new_fun, x)
+        print(
+            f'{n_segments:>8} {len(system):>9} '
+            f'{old_compile:>10.4f} {new_compile:>11.4f} '
+            f'{old_call * 1e6:>9.1f} {new_call * 1e6:>10.1f} '
+            f'{old_call / new_call:>7.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
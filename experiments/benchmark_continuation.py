@@ -0,0 +1,137 @@
+"""Benchmark of sub-steps of large motions of figure moving (see
+solve.DragSession) against solving of every frame from solution of the
+previous one in one step.
+
+System is a chain of joined segments with fixed lengths, the start of the
+first segment is fixed. The end of the last segment is dragged along spiral
+(turn by 120 degrees around the start, distance to it decreases by 50%) by
+two frames (fast cursor). Reference is the same moving by many frames (slow
+cursor): solution of fast moving should be close to it, not jump to other
+branch of solutions. Evaluations of residuals of equations are counted for
+all frames and final polishing.
+
+Run from the root of repository: python experiments/benchmark_continuation.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import diagnostic_context  # noqa: E402
+import solve  # noqa: E402
+from bindings import choose_best_bindings  # noqa: E402
+from figures import Segment  # noqa: E402
+from kernels import KernelSystem  # noqa: E402
+from project import CADProject  # noqa: E402
+from restrictions import (  # noqa: E402
+    SegmentLengthFixed,
+    SegmentSpotFixed,
+    SegmentsSpotsJoint,
+)
+
+LENGTH = 10.0
+N_FRAMES = 2
+N_REFERENCE_FRAMES = 200
+
+
+def make_chain(n_segments: int):
+    """Project with zigzag chain of segments and coordinates of its end."""
+    project = CADProject()
+    names, x, y = [], 0.0, 0.0
+    for i in range(n_segments):
+        angle = np.pi / 6 if i % 2 == 0 else -np.pi / 6
+        x2, y2 = x + LENGTH * np.cos(angle), y + LENGTH * np.sin(angle)
+        segment = Segment.from_coordinates(x, y, x2, y2)
+        names.append(project.add_figure(segment))
+        x, y = x2, y2
+    project.add_restriction(SegmentSpotFixed(0, 0, 'start'), (names[0],))
+    for i, name in enumerate(names):
+        project.add_restriction(SegmentLengthFixed(LENGTH), (name,))
+        if i:
+            project.add_restriction(
+                SegmentsSpotsJoint('end', 'start'), (names[i - 1], name)
+            )
+    return project, (x, y)
+
+
+def drag(n_segments: int, n_frames: int, max_substeps: int):
+    """Drag end of chain, return time of solving of frame (without updating
+    of figures), number of evaluations of residuals, number of failed
+    frames and final figures.
+    """
+    project, (x, y) = make_chain(n_segments)
+    binding = choose_best_bindings(project.bindings, x, y)[0]
+    radius, start_angle = np.hypot(x, y), np.arctan2(y, x)
+
+    drag_solve = solve.DragSession.solve
+    residuals = KernelSystem.residuals
+    solving_time, n_evaluations, n_failed = 0.0, 0, 0
+
+    def timed_solve(*args, **kwargs):
+        nonlocal solving_time
+        start = timer()
+        result = drag_solve(*args, **kwargs)
+        solving_time += timer() - start
+        return result
+
+    def counted_residuals(*args, **kwargs):
+        nonlocal n_evaluations
+        n_evaluations += 1
+        return residuals(*args, **kwargs)
+
+    default_max_substeps = solve.CONTINUATION_MAX_SUBSTEPS
+    solve.DragSession.solve = timed_solve
+    KernelSystem.residuals = counted_residuals
+    solve.CONTINUATION_MAX_SUBSTEPS = max_substeps
+    try:
+        project.begin_drag(binding)
+        for t in np.linspace(0, 1, n_frames + 1)[1:]:
+            angle = start_angle + t * 2 * np.pi / 3
+            try:
+                project.drag_to(
+                    (1 - 0.5 * t) * radius * np.cos(angle),
+                    (1 - 0.5 * t) * radius * np.sin(angle),
+                )
+            except solve.CannotSolveSystemError:
+                n_failed += 1
+        project.end_drag()
+    finally:
+        solve.DragSession.solve = drag_solve
+        KernelSystem.residuals = residuals
+        solve.CONTINUATION_MAX_SUBSTEPS = default_max_substeps
+    figures = np.array(
+        [
+            figure.get_base_representation()
+            for figure in project.figures.values()
+        ]
+    )
+    return solving_time / (n_frames + 1), n_evaluations, n_failed, figures
+
+
+def main():
+    diagnostic_context.VERBOSE = False
+    print(
+        f'{"segments":>8} | {"one step: ms, evals, failed, deviation":>40} | '
+        f'{"sub-steps: ms, evals, failed, deviation":>40}'
+    )
+    for n_segments in (2, 3, 5, 10):
+        *_, reference = drag(n_segments, N_REFERENCE_FRAMES, 1)
+        row = [f'{n_segments:>8}']
+        for max_substeps in (1, solve.CONTINUATION_MAX_SUBSTEPS):
+            frame_time, n_evaluations, n_failed, figures = drag(
+                n_segments, N_FRAMES, max_substeps
+            )
+            deviation = np.abs(figures - reference).max()
+            row.append(
+                f'{frame_time * 1e3:>11.2f} {n_evaluations:>8} '
+                f'{n_failed:>8} {deviation:>10.3f}'
+            )
+        print(' | '.join(row))
+
+
+if __name__ == '__main__':
+    main()
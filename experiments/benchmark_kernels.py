@@ -0,0 +1,122 @@
+"""Micro-benchmark of numeric kernels of restrictions: evaluation grouped
+by restriction types (one call of kernel for all restrictions of a type)
+against evaluation of every restriction separately.
+
+System is a grid of segments: neighbours in a row are parallel, neighbours
+in a column are normal, lengths of all segments are fixed.
+
+Run from the root of repository: python experiments/benchmark_kernels.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from kernels import KernelSystem  # noqa: E402
+from restrictions import (  # noqa: E402
+    SegmentLengthFixed,
+    SegmentsNormal,
+    SegmentsParallel,
+)
+
+N_CALLS = 50
+
+
+def make_grid(n: int):
+    """Kernels of grid of n x n segments and names of symbols."""
+    segments = [
+        [
+            [f'segment_{i}_{j}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+            for j in range(n)
+        ]
+        for i in range(n)
+    ]
+    kernels = []
+    for i in range(n):
+        for j in range(n):
+            kernels.append((SegmentLengthFixed(10), segments[i][j]))
+            if j + 1 < n:
+                kernels.append(
+                    (SegmentsParallel(), segments[i][j] + segments[i][j + 1])
+                )
+            if i + 1 < n:
+                kernels.append(
+                    (SegmentsNormal(), segments[i][j] + segments[i + 1][j])
+                )
+    symbols_names = [name for row in segments for s in row for name in s]
+    return kernels, symbols_names
+
+
+class SeparateKernels:
+    """Previous implementation: kernels are called for every restriction."""
+
+    def __init__(self, kernels: list, symbols_names: list):
+        ids = {name: i for i, name in enumerate(symbols_names)}
+        self._kernels = []
+        n_equations = 0
+        for restriction, names in kernels:
+            rows = np.arange(
+                n_equations, n_equations + restriction.n_equations
+            )
+            self._kernels.append(
+                (
+                    restriction,
+                    np.array([ids[name] for name in names]),
+                    np.array(restriction.get_parameters(), dtype=float),
+                    rows[:, None],
+                )
+            )
+            n_equations += restriction.n_equations
+        self.shape = n_equations, len(symbols_names)
+
+    def residuals(self, x):
+        return np.concatenate(
+            [r.residuals(x[idx], p) for r, idx, p, _ in self._kernels]
+        )
+
+    def jacobian(self, x):
+        result = np.zeros(self.shape)
+        for r, idx, p, rows in self._kernels:
+            np.add.at(result, (rows, idx), r.jacobian(x[idx], p))
+        return result
+
+
+def measure(system, x):
+    start = timer()
+    for _ in range(N_CALLS):
+        system.residuals(x)
+        system.jacobian(x)
+    return (timer() - start) / N_CALLS
+
+
+def main():
+    print(
+        f'{"grid":>6} {"restrictions":>12} {"separate, ms":>13} '
+        f'{"grouped, ms":>12} {"speedup":>7}'
+    )
+    for n in (3, 5, 10, 20, 30):
+        kernels, symbols_names = make_grid(n)
+        x = np.random.RandomState(0).random_sample(len(symbols_names)) * 100
+
+        separate = SeparateKernels(kernels, symbols_names)
+        grouped = KernelSystem(kernels, symbols_names)
+        assert np.allclose(separate.residuals(x), grouped.residuals(x))
+        assert np.allclose(separate.jacobian(x), grouped.jacobian(x))
+
+        separate_time, grouped_time = (
+            measure(separate, x),
+            measure(grouped, x),
+        )
+        print(
+            f'{n:>3}x{n:<2} {len(kernels):>12} '
+            f'{separate_time * 1e3:>13.2f} {grouped_time * 1e3:>12.2f} '
+            f'{separate_time / grouped_time:>7.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
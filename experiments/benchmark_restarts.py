@@ -0,0 +1,110 @@
+"""Benchmark of concurrent restarts (see strategies.MultiStart) against
+restarts one by one: time of solving, evaluations of residuals and
+jacobians, and evaluations of abandoned starts after solving is returned
+(they must be stopped, so pool of threads is free for the next solving).
+
+Problem is Freudenstein and Roth function: default strategies fail from
+initial values (they converge to local minimum of residuals), and some of
+perturbed starts find root. Every evaluation takes additional time in
+Python (like residuals of large compiled systems), so it holds GIL.
+
+Run from the root of repository: python experiments/benchmark_restarts.py
+"""
+
+import os
+import sys
+import time
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from strategies import (  # noqa: E402
+    MultiStart,
+    RootProblem,
+    StrategyFailed,
+    StrategySelector,
+)
+
+INIT = np.array([0.5, -2.0])
+EVALUATION_WORK = 2000  # Iterations of loop in Python in every evaluation
+N_REPEATS = 5
+
+
+def make_problem(counter: list) -> RootProblem:
+    def work():
+        counter[0] += 1
+        total = 0
+        for i in range(EVALUATION_WORK):
+            total += i
+        return total
+
+    def fun(x, params=()):
+        work()
+        return np.array(
+            [
+                -13 + x[0] + ((5 - x[1]) * x[1] - 2) * x[1],
+                -29 + x[0] + ((x[1] + 1) * x[1] - 14) * x[1],
+            ]
+        )
+
+    def jac(x, params=()):
+        work()
+        return np.array(
+            [
+                [1, 10 * x[1] - 3 * x[1] ** 2 - 2],
+                [1, 3 * x[1] ** 2 + 2 * x[1] - 14],
+            ]
+        )
+
+    return RootProblem(fun, jac=jac)
+
+
+def run(n_starts: int, n_workers: int, scale: float):
+    """Solve problem N_REPEATS times, return mean time, mean number of
+    evaluations, number of failures and evaluations after return.
+    """
+    counter = [0]
+    problem = make_problem(counter)
+    selector = StrategySelector(
+        multi_start=MultiStart(n_starts, scale, n_workers=n_workers)
+    )
+    elapsed, n_failed, late_evaluations = 0.0, 0, 0
+    for _ in range(N_REPEATS):
+        start = timer()
+        try:
+            selector.solve(problem, INIT)
+        except StrategyFailed:
+            n_failed += 1
+        elapsed += timer() - start
+        n_evaluations = counter[0]
+        time.sleep(0.05)  # Abandoned starts would evaluate meanwhile
+        late_evaluations += counter[0] - n_evaluations
+    return (
+        elapsed / N_REPEATS,
+        (counter[0] - late_evaluations) / N_REPEATS,
+        n_failed,
+        late_evaluations,
+    )
+
+
+def main():
+    print(
+        f'{"starts":>6} {"scale":>5} | {"workers":>7} {"ms":>8} '
+        f'{"evals":>7} {"failed":>6} {"late evals":>10}'
+    )
+    for n_starts, scale in [(4, 1.0), (8, 1.0), (8, 2.0)]:
+        for n_workers in (0, 2, 4):
+            elapsed, n_evaluations, n_failed, late_evaluations = run(
+                n_starts, n_workers, scale
+            )
+            print(
+                f'{n_starts:>6} {scale:>5} | {n_workers:>7} '
+                f'{elapsed * 1e3:>8.2f} {n_evaluations:>7.0f} '
+                f'{n_failed:>6} {late_evaluations:>10}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark of moving of rigid cluster as one body against solving of
+Lagrange system for all symbols: staircase of joined segments with fixed
+lengths, neighbours are normal, so the whole staircase is rigid. The end of
+the last segment is dragged along arc, every frame starts from solution of
+the previous one.
+
+Run from the root of repository: python experiments/benchmark_rigid.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import diagnostic_context  # noqa: E402
+from kernels import KernelSystem  # noqa: E402
+from restrictions import (  # noqa: E402
+    SegmentLengthFixed,
+    SegmentsNormal,
+    SegmentsSpotsJoint,
+)
+from solve import (  # noqa: E402
+    EquationsSystem,
+    HIGH_PRIORITY_WEIGHT,
+    SPARSE_SOLVER_MIN_SIZE,
+)
+
+LENGTH = 10.0
+N_FRAMES = 20
+
+
+def make_staircase(n_segments: int):
+    """Kernel system of staircase and values of its symbols."""
+    segments = [
+        [f'segment_{i}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+        for i in range(n_segments)
+    ]
+    kernels = [(SegmentLengthFixed(LENGTH), segments[0])]
+    values, x, y = [], 0.0, 0.0
+    for i in range(n_segments):
+        dx, dy = (LENGTH, 0.0) if i % 2 == 0 else (0.0, LENGTH)
+        values.extend([x, y, x + dx, y + dy])
+        x, y = x + dx, y + dy
+        if i:
+            kernels.append((SegmentLengthFixed(LENGTH), segments[i]))
+            kernels.append(
+                (
+                    SegmentsSpotsJoint('end', 'start'),
+                    segments[i - 1] + segments[i],
+                )
+            )
+            kernels.append((SegmentsNormal(), segments[i - 1] + segments[i]))
+    symbols_names = [name for segment in segments for name in segment]
+    return KernelSystem(kernels, symbols_names), np.array(values)
+
+
+def drag(system: KernelSystem, values, rigid: bool):
+    """Drag end of the last segment, return time of frame and solution."""
+    weights = np.ones(len(values))
+    weights[-2:] = HIGH_PRIORITY_WEIGHT
+    end = values[-2:].copy()
+    # Rigid solving is chosen automatically, full one is forced
+    sparse = None if rigid else sum(system.shape) >= SPARSE_SOLVER_MIN_SIZE
+    x, multipliers = values, None
+    start = timer()
+    for angle in np.linspace(0, np.pi / 4, N_FRAMES + 1)[1:]:
+        target = x.copy()
+        target[-2:] = end + 5 * np.array([np.cos(angle), np.sin(angle)]) - 5
+        x, multipliers = EquationsSystem._solve_closest(
+            system, target, weights, x, multipliers, sparse
+        )
+    return (timer() - start) / N_FRAMES, x
+
+
+def main():
+    diagnostic_context.VERBOSE = False
+    print(
+        f'{"segments":>8} {"symbols":>7} {"reduced":>7} {"full, ms":>9} '
+        f'{"rigid, ms":>9} {"speedup":>7}'
+    )
+    for n_segments in (4, 10, 20, 50, 100):
+        system, values = make_staircase(n_segments)
+        reduced, _ = system.rigid_parameterization(values)
+        full_time, full_x = drag(system, values, rigid=False)
+        rigid_time, rigid_x = drag(system, values, rigid=True)
+        assert np.allclose(full_x, rigid_x, atol=1e-6)
+        print(
+            f'{n_segments:>8} {system.shape[1]:>7} {reduced.shape[1]:>7} '
+            f'{full_time * 1e3:>9.2f} {rigid_time * 1e3:>9.2f} '
+            f'{full_time / rigid_time:>7.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Scaling benchmark of dense and sparse solvers of kernels systems (one
+frame of moving): chain of joined segments with fixed lengths, start of the
+first segment is fixed, end of the last segment is moved.
+
+Run from the root of repository: python experiments/benchmark_sparse.py
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import diagnostic_context  # noqa: E402
+from kernels import KernelSystem  # noqa: E402
+from restrictions import (  # noqa: E402
+    SegmentLengthFixed,
+    SegmentSpotFixed,
+    SegmentsSpotsJoint,
+)
+from solve import EquationsSystem  # noqa: E402
+
+MAX_DENSE_SYMBOLS = 2000
+LENGTH = 10
+
+
+def make_chain(n_segments: int):
+    """Kernel system of chain and values of its symbols (a straight line
+    along x axis).
+    """
+    segments = [
+        [f'segment_{i}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+        for i in range(n_segments)
+    ]
+    kernels = [(SegmentSpotFixed(0, 0, 'start'), segments[0])]
+    for segment in segments:
+        kernels.append((SegmentLengthFixed(LENGTH), segment))
+    for s1, s2 in zip(segments[:-1], segments[1:]):
+        kernels.append((SegmentsSpotsJoint('end', 'start'), s1 + s2))
+
+    symbols_names = [name for segment in segments for name in segment]
+    values = np.array(
+        [[LENGTH * i, 0, LENGTH * (i + 1), 0] for i in range(n_segments)],
+        dtype=float,
+    ).ravel()
+    return KernelSystem(kernels, symbols_names), values
+
+
+def measure(system, values, sparse: bool):
+    """Time of moving of the end of chain a bit up."""
+    target = values.copy()
+    target[-1] += LENGTH
+    weights = np.ones(len(values))
+    weights[-2:] = 1000
+
+    start = timer()
+    x, _ = EquationsSystem._solve_closest(
+        system, target, weights, values, sparse=sparse
+    )
+    duration = timer() - start
+    assert np.abs(system.residuals(x)).max() < 1e-6
+    return duration, x
+
+
+def main():
+    diagnostic_context.VERBOSE = False
+    print(f'{"symbols":>8} {"equations":>9} {"dense, s":>9} {"sparse, s":>9}')
+    for n_segments in (3, 25, 250, 2500):
+        system, values = make_chain(n_segments)
+        n_equations, n_symbols = system.shape
+
+        sparse_time, sparse_x = measure(system, values, sparse=True)
+        if n_symbols <= MAX_DENSE_SYMBOLS:
+            dense_time, dense_x = measure(system, values, sparse=False)
+            assert np.allclose(dense_x, sparse_x, atol=1e-6)
+            dense = f'{dense_time:>9.3f}'
+        else:
+            dense = f'{"-":>9}'
+        print(f'{n_symbols:>8} {n_equations:>9} {dense} {sparse_time:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
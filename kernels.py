@@ -0,0 +1,487 @@
+"""Module with numeric systems assembled from kernels of restrictions."""
+
+from numpy import (
+    array as np_array,
+    zeros as np_zeros,
+    add as np_add,
+    einsum as np_einsum,
+    broadcast_to as np_broadcast_to,
+    concatenate as np_concatenate,
+    arange as np_arange,
+    linalg as np_linalg,
+)
+from scipy.linalg import null_space
+from scipy.sparse import coo_matrix
+
+from utils import UnionFind
+
+
+class KernelsGroup:
+    """Restrictions of one type: kernels are evaluated once for all of them
+    (values are gathered by array of indexes).
+    """
+
+    def __init__(self, restriction_type: type):
+        self.restriction_type = restriction_type
+        self.indexes = []  # n_restrictions x n_symbols of restriction
+        self.parameters = []  # n_restrictions x n_parameters
+        self.rows = []  # n_restrictions x n_equations of restriction
+
+    def append(self, indexes: list, parameters: tuple, rows: list):
+        self.indexes.append(indexes)
+        self.parameters.append(parameters)
+        self.rows.append(rows)
+
+    def freeze(self):
+        """Convert lists to arrays (after all restrictions are added)."""
+        n = len(self.indexes)
+        self.indexes = np_array(self.indexes, dtype=int).reshape(n, -1)
+        self.parameters = np_array(self.parameters, dtype=float).reshape(n, -1)
+        self.rows = np_array(self.rows, dtype=int).reshape(n, -1)
+
+        # Positions of elements of kernels results in matrices of system
+        n_equations, n_symbols = self.rows.shape[1], self.indexes.shape[1]
+        jacobian_shape = (n, n_equations, n_symbols)
+        self.jacobian_rows = np_broadcast_to(
+            self.rows[:, :, None], jacobian_shape
+        ).ravel()
+        self.jacobian_cols = np_broadcast_to(
+            self.indexes[:, None, :], jacobian_shape
+        ).ravel()
+        hessian_shape = (n, n_symbols, n_symbols)
+        self.hessian_rows = np_broadcast_to(
+            self.indexes[:, :, None], hessian_shape
+        ).ravel()
+        self.hessian_cols = np_broadcast_to(
+            self.indexes[:, None, :], hessian_shape
+        ).ravel()
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+class RigidCluster:
+    """Figures that are fixed relative to each other by restrictions, so
+    they can move only as one body.
+    """
+
+    def __init__(
+        self,
+        coordinates: list,
+        kernels_ids: list,
+        anchor_id: int,
+        rows: list,
+        anchor_rows: list,
+    ):
+        """
+        Parameters
+        ----------
+        coordinates: list[tuple(int, int)]
+            Indexes of symbols x and y of points of figures.
+        kernels_ids: list[int]
+            Indexes of kernels between figures of cluster (except anchor).
+        anchor_id: int
+            Index of kernel of length of figure of cluster, it's kept in
+            system to fix scale of rotation (see rigid_parameterization).
+        rows: list[int]
+            Equations of kernels between figures of cluster (except anchor).
+        anchor_rows: list[int]
+            Equations of anchor.
+        """
+        self.coordinates = coordinates
+        self.kernels_ids = kernels_ids
+        self.anchor_id = anchor_id
+        self.rows = rows
+        self.anchor_rows = anchor_rows
+
+
+class KernelSystem:
+    """System of equations assembled from numeric kernels of restrictions
+    (see Restriction.residuals and Restriction.jacobian) without SymPy.
+
+    Restrictions are grouped by types, kernels of every group are evaluated
+    with one call for values gathered from flat vector of values of all
+    symbols of system, so Python overhead is per type, not per restriction.
+    """
+
+    def __init__(self, kernels: list, symbols_names: list):
+        """
+        Parameters
+        ----------
+        kernels: list[tuple(Restriction, list[str])]
+            Restrictions and names of their symbols (base parameters of
+            objects in order of object_types).
+        symbols_names: list[str]
+            Names of all symbols of system (order of values vector).
+        """
+        self.symbols_names = list(symbols_names)
+        self._kernels = list(kernels)
+        symbols_ids = {name: i for i, name in enumerate(self.symbols_names)}
+
+        # Equations are ordered as restrictions in kernels
+        groups = dict()  # restriction type -> KernelsGroup
+        n_equations = 0
+        for restriction, names in kernels:
+            type_ = type(restriction)
+            if type_ not in groups:
+                groups[type_] = KernelsGroup(type_)
+            groups[type_].append(
+                [symbols_ids[name] for name in names],
+                restriction.get_parameters(),
+                list(range(n_equations, n_equations + type_.n_equations)),
+            )
+            n_equations += type_.n_equations
+
+        for group in groups.values():
+            group.freeze()
+        self._groups = list(groups.values())
+        self.n_equations = n_equations
+        self._parts = None  # (linear, nonlinear), see split
+        self._subspace = None  # (origin, basis), see solutions_subspace
+        self._rigid = None  # (clusters, external system), see rigid_clusters
+
+    @property
+    def shape(self):
+        return self.n_equations, len(self.symbols_names)
+
+    @property
+    def is_linear(self) -> bool:
+        return all(group.restriction_type.is_linear for group in self._groups)
+
+    def split(self) -> tuple:
+        """Split system to linear and nonlinear parts (with the same
+        symbols).
+        """
+        if self._parts is None:
+            linear, nonlinear = [], []
+            for kernel in self._kernels:
+                if type(kernel[0]).is_linear:
+                    linear.append(kernel)
+                else:
+                    nonlinear.append(kernel)
+            self._parts = (
+                KernelSystem(linear, self.symbols_names),
+                KernelSystem(nonlinear, self.symbols_names),
+            )
+        return self._parts
+
+    def linear_form(self, sparse: bool = False) -> tuple:
+        """Matrix A and vector b of linear system: A x = b.
+        System must be linear.
+        """
+        zeros = np_zeros(len(self.symbols_names))
+        if sparse:
+            return self.sparse_jacobian(zeros), -self.residuals(zeros)
+        return self.jacobian(zeros), -self.residuals(zeros)
+
+    def solutions_subspace(self) -> tuple:
+        """Affine subspace x = origin + basis y of least squares solutions
+        of linear system (dense): origin is the solution with minimal norm,
+        columns of basis are orthonormal basis of null space of matrix.
+        System must be linear.
+        """
+        if self._subspace is None:
+            matrix, rhs = self.linear_form()
+            origin = np_linalg.lstsq(matrix, rhs, rcond=None)[0]
+            self._subspace = origin, null_space(matrix)
+        return self._subspace
+
+    def rigid_clusters(self) -> list:
+        """Rigid clusters of figures (of at least two figures).
+
+        Figures with fixed length are rigid, two rigid clusters are merged
+        if they are joined and have fixed angle between them (e.g. sides of
+        rectangle), points attached to rigid cluster join it. Restrictions
+        are classified by their rigidity (see Restriction.rigidity).
+        """
+        if self._rigid is None:
+            clusters = self._find_rigid_clusters()
+            internal = {i for c in clusters for i in c.kernels_ids}
+            external = KernelSystem(
+                [k for i, k in enumerate(self._kernels) if i not in internal],
+                self.symbols_names,
+            )
+            self._rigid = clusters, external
+        return self._rigid[0]
+
+    def _find_rigid_clusters(self) -> list:
+        symbols_ids = {name: i for i, name in enumerate(self.symbols_names)}
+        objects = []  # For every kernel: tuples of indexes of its figures
+        for restriction, names in self._kernels:
+            ids, kernel_objects = [symbols_ids[name] for name in names], []
+            for object_type in restriction.object_types:
+                n = len(object_type.base_parameters)
+                kernel_objects.append(tuple(ids[:n]))
+                ids = ids[n:]
+            objects.append(kernel_objects)
+
+        clusters = UnionFind()
+        for (restriction, _), kernel_objects in zip(self._kernels, objects):
+            if restriction.rigidity == 'length':
+                clusters.add(kernel_objects[0])
+
+        changed = True
+        while changed:
+            changed = False
+            links = dict()  # pair of roots of clusters -> rigidities
+            for (restriction, _), kernel_objects in zip(
+                self._kernels, objects
+            ):
+                rigidity = restriction.rigidity
+                inside = [o for o in kernel_objects if o in clusters]
+                if rigidity in ('joint', 'angle') and len(inside) == 2:
+                    roots = frozenset(clusters.find(o) for o in inside)
+                    if len(roots) == 2:
+                        links.setdefault(roots, set()).add(rigidity)
+                elif rigidity == 'attachment' and len(inside) == 1:
+                    (outside,) = set(kernel_objects) - set(inside)
+                    if len(outside) == 2:  # Point
+                        clusters.add(outside)
+                        clusters.union(inside[0], outside)
+                        changed = True
+            for roots, rigidities in links.items():
+                if rigidities == {'joint', 'angle'}:
+                    root1, root2 = roots
+                    if clusters.find(root1) != clusters.find(root2):
+                        clusters.union(root1, root2)
+                        changed = True
+
+        rows = []  # Equations of every kernel
+        n_equations = 0
+        for restriction, _ in self._kernels:
+            rows.append(
+                list(range(n_equations, n_equations + restriction.n_equations))
+            )
+            n_equations += restriction.n_equations
+
+        result = []
+        for group in clusters.groups().values():
+            if len(group) < 2:
+                continue
+            group_objects = set(group)
+            # Relative restrictions, others (e.g. fixed or horizontal figure)
+            # restrict movement of cluster
+            kernels_ids = [
+                i
+                for i, kernel_objects in enumerate(objects)
+                if self._kernels[i][0].rigidity is not None
+                and all(o in group_objects for o in kernel_objects)
+            ]
+            anchor_id = next(
+                i
+                for i in kernels_ids
+                if self._kernels[i][0].rigidity == 'length'
+            )
+            kernels_ids.remove(anchor_id)
+            result.append(
+                RigidCluster(
+                    [
+                        (o[i], o[i + 1])
+                        for o in group
+                        for i in range(0, len(o), 2)
+                    ],
+                    kernels_ids,
+                    anchor_id,
+                    [row for i in kernels_ids for row in rows[i]],
+                    rows[anchor_id],
+                )
+            )
+        return result
+
+    def rigid_parameterization(self, x):
+        """System in coordinates of rigid bodies of clusters at positions x:
+        every cluster is moved by translation (tx, ty) and rotation with
+        scale (c, s), other symbols are not changed. Coordinates of points
+        of clusters are linear in them:
+        x = center_x + tx + c (x0 - center_x) - s (y0 - center_y),
+        y = center_y + ty + s (x0 - center_x) + c (y0 - center_y),
+        so rotation with scale is 3 DOF of rigid body and the kernel of
+        length of anchor fixes c ** 2 + s ** 2 = 1. Other kernels between
+        figures of clusters are removed: they are satisfied by any
+        coordinates, if they are satisfied at x (equations of the reduced
+        system are the rest ones in the same order).
+
+        Returns
+        -------
+        system: ReducedKernelSystem or None
+            None if there are no clusters or points of cluster coincide.
+        y: np.ndarray
+            Coordinates of x.
+        """
+        clusters = self.rigid_clusters()
+        if not clusters:
+            return None, None
+        in_clusters = {i for c in clusters for xy in c.coordinates for i in xy}
+        free = [i for i in range(len(x)) if i not in in_clusters]
+        origin = np_zeros(len(x))
+        basis = np_zeros((len(x), len(free) + 4 * len(clusters)))
+        y = np_zeros(basis.shape[1])
+        basis[free, np_arange(len(free))] = 1
+        y[: len(free)] = x[free]
+
+        column = len(free)
+        for cluster in clusters:
+            xs, ys = np_array(cluster.coordinates).T
+            center_x, center_y = x[xs].mean(), x[ys].mean()
+            dx, dy = x[xs] - center_x, x[ys] - center_y
+            if not (dx ** 2 + dy ** 2).any():
+                return None, None
+            origin[xs], origin[ys] = center_x, center_y
+            basis[xs, column], basis[ys, column + 1] = 1, 1
+            basis[xs, column + 2], basis[ys, column + 2] = dx, dy
+            basis[xs, column + 3], basis[ys, column + 3] = -dy, dx
+            y[column + 2] = 1
+            column += 4
+        return ReducedKernelSystem(self._rigid[1], origin, basis), y
+
+    def invariances(self) -> tuple:
+        """Motions of all symbols (as coordinates of points) that keep all
+        equations satisfied: common invariances of restrictions (see
+        Restriction.invariances).
+        """
+        result = ('translation', 'rotation')
+        for restriction, _ in self._kernels:
+            result = tuple(m for m in result if m in restriction.invariances)
+        return result
+
+    def is_rigid(self) -> bool:
+        """All symbols are coordinates of one rigid body: of one rigid
+        cluster (see rigid_clusters) or of one segment with fixed length.
+        """
+        n_symbols = len(self.symbols_names)
+        clusters = self.rigid_clusters()
+        if len(clusters) == 1:
+            return 2 * len(clusters[0].coordinates) == n_symbols
+        return n_symbols == 4 and any(
+            restriction.rigidity == 'length'
+            for restriction, _ in self._kernels
+        )
+
+    def residuals(self, x):
+        """Residuals of all equations for values of symbols x."""
+        result = np_zeros(self.n_equations)
+        for group in self._groups:
+            result[group.rows] = group.restriction_type.residuals(
+                x[group.indexes], group.parameters
+            )
+        return result
+
+    def jacobian(self, x):
+        """Dense jacobian (n_equations x n_symbols) for values of symbols."""
+        result = np_zeros(self.shape)
+        for group, values in self._jacobian_blocks(x):
+            # Object can be used by restriction twice, so add.at
+            np_add.at(
+                result, (group.jacobian_rows, group.jacobian_cols), values
+            )
+        return result
+
+    def sparse_jacobian(self, x):
+        """Sparse (CSR) jacobian for values of symbols."""
+        return self._sparse_matrix(
+            self._jacobian_blocks(x),
+            'jacobian_rows',
+            'jacobian_cols',
+            self.shape,
+        )
+
+    def lagrangian_hessian(self, x, multipliers):
+        """Second derivatives of sum(multipliers * residuals) by symbols
+        (n_symbols x n_symbols) for values of symbols x.
+        """
+        n_symbols = len(self.symbols_names)
+        result = np_zeros((n_symbols, n_symbols))
+        for group, values in self._hessian_blocks(x, multipliers):
+            np_add.at(result, (group.hessian_rows, group.hessian_cols), values)
+        return result
+
+    def sparse_lagrangian_hessian(self, x, multipliers):
+        """Sparse (CSR) version of lagrangian_hessian."""
+        n_symbols = len(self.symbols_names)
+        return self._sparse_matrix(
+            self._hessian_blocks(x, multipliers),
+            'hessian_rows',
+            'hessian_cols',
+            (n_symbols, n_symbols),
+        )
+
+    def _jacobian_blocks(self, x):
+        """Pairs (group, flat jacobians of its restrictions)."""
+        for group in self._groups:
+            values = group.restriction_type.jacobian(
+                x[group.indexes], group.parameters
+            )
+            yield group, values.ravel()
+
+    def _hessian_blocks(self, x, multipliers):
+        """Pairs (group, flat weighted sums of hessians of equations of its
+        restrictions), linear restrictions are skipped.
+        """
+        for group in self._groups:
+            if group.restriction_type.is_linear:
+                continue
+            hessian = group.restriction_type.hessian(
+                x[group.indexes], group.parameters
+            )
+            values = np_einsum(
+                're,rekl->rkl', multipliers[group.rows], hessian
+            )
+            yield group, values.ravel()
+
+    @staticmethod
+    def _sparse_matrix(blocks, rows_name: str, cols_name: str, shape: tuple):
+        """CSR matrix from blocks (duplicates are summed)."""
+        data, rows, cols = (
+            [np_zeros(0)],
+            [np_zeros(0, int)],
+            [np_zeros(0, int)],
+        )
+        for group, values in blocks:
+            data.append(values)
+            rows.append(getattr(group, rows_name))
+            cols.append(getattr(group, cols_name))
+        return coo_matrix(
+            (
+                np_concatenate(data),
+                (np_concatenate(rows), np_concatenate(cols)),
+            ),
+            shape=shape,
+        ).tocsr()
+
+
+class ReducedKernelSystem:
+    """Kernel system in coordinates y of affine subspace of values of
+    symbols: x = origin + basis y (e.g. solutions of linear equations or
+    positions of rigid clusters). It has interface of KernelSystem (dense
+    only).
+    """
+
+    def __init__(self, system: KernelSystem, origin, basis):
+        self.system = system
+        self.origin = origin
+        self.basis = basis
+        self.n_equations = system.n_equations
+
+    @property
+    def shape(self):
+        return self.n_equations, self.basis.shape[1]
+
+    def to_full(self, y):
+        """Values of symbols of system."""
+        return self.origin + self.basis.dot(y)
+
+    def to_reduced(self, x):
+        """Coordinates of projection of x to subspace (if basis is
+        orthonormal).
+        """
+        return self.basis.T.dot(x - self.origin)
+
+    def residuals(self, y):
+        return self.system.residuals(self.to_full(y))
+
+    def jacobian(self, y):
+        return self.system.jacobian(self.to_full(y)).dot(self.basis)
+
+    def lagrangian_hessian(self, y, multipliers):
+        hessian = self.system.lagrangian_hessian(self.to_full(y), multipliers)
+        return self.basis.T.dot(hessian).dot(self.basis)
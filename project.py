@@ -28,6 +28,21 @@ from diagnostic_context import measured
 CIRCLE_BINDING_RADIUS = 12
 SEGMENT_BINDING_MARGIN = 6
 
+# Figures are moved with numeric kernels of restrictions (see solve.py)
+SOLVER_MODE = 'kernels'
+# Processes to solve independent components of large projects in parallel
+# and threads to try restarts concurrently (0 - serial solving, see solve.py)
+SOLVER_WORKERS = 0
+# Quantum of memoization of solutions of moving (None - no memoization)
+SOLUTIONS_MEMOIZATION_QUANTUM = None
+# Initial multipliers of Lagrange systems (see strategies.INITIAL_GUESSES)
+SOLVER_INITIAL_GUESS = 'zeros'
+# Seeded perturbed starts that are tried if solving failed
+SOLVER_RESTARTS = 2
+# Precisions of frames of moving and of its final position (see strategies.py)
+DRAG_PRECISION = 'interactive'
+FINAL_PRECISION = 'polish'
+
 
 class IncorrectName(IncorrectParamValue):
     pass
@@ -53,7 +68,13 @@ class ProjectState:
         # It's not necessary to save bindings and system to state
         # But it's done for convenience and speed
         self.bindings = []
-        self.system = EquationsSystem()
+        self.system = EquationsSystem(
+            mode=SOLVER_MODE,
+            n_workers=SOLVER_WORKERS,
+            memoization_quantum=SOLUTIONS_MEMOIZATION_QUANTUM,
+            initial_guess=SOLVER_INITIAL_GUESS,
+            n_restarts=SOLVER_RESTARTS,
+        )
 
 
 class ChangesStack(Stack):
@@ -66,6 +87,11 @@ class CADProject:
         self._history = ChangesStack()  # All changes (for undo)
         self._cancelled = ChangesStack()  # Cancelled changes (for redo)
 
+        # It's not a part of state: must survive rollbacks of failed frames
+        self._drag_binding = None
+        self._drag_session = None
+        self._drag_target = None  # Optimizing values of the last frame
+
         self._commit()
 
     @property
@@ -170,10 +196,7 @@ class CADProject:
         equations = figure.get_setter_equations(figure_symbols, param, value)
 
         current_values = self._get_values()
-        try:
-            new_values = self._system.solve_new(equations, current_values)
-        except CannotSolveSystemError as e:
-            raise e
+        new_values = self._system.solve_new(equations, current_values)
 
         try:
             self._set_values(new_values)
@@ -183,12 +206,85 @@ class CADProject:
         else:
             self._commit()
 
+    def begin_drag(self, binding: PointBinding):
+        """Start moving of figure (e.g. on mouse press).
+
+        Optimization tasks are prepared on the first frame of moving and
+        reused by next frames (see drag_to), solution of every frame is used
+        as initial values for the next one. Frames are solved with coarse
+        precision, final position is polished by end_drag.
+
+        Parameters
+        ----------
+        binding: Binding instance
+            Binding that will be moved.
+        """
+        self._check_binding(binding)
+        self._drag_binding = binding
+        self._drag_session = None
+        self._drag_target = None
+
+    @measured
+    @contract(cursor_x='number', cursor_y='number')
+    def drag_to(self, cursor_x: float, cursor_y: float):
+        """Move figure that was bound by begin_drag.
+
+        Parameters
+        ----------
+        cursor_x, cursor_y: int or float
+            Coordinates of cursor.
+        """
+        if self._drag_binding is None:
+            raise ActionImpossible('Moving of figure is not started.')
+
+        optimizing_values = self._get_optimizing_values(
+            self._drag_binding, float(cursor_x), float(cursor_y)
+        )
+        if optimizing_values is None:
+            return
+
+        if self._drag_session is None:
+            self._drag_session = self._system.create_drag_session(
+                {
+                    name: list(values.keys())
+                    for name, values in optimizing_values.items()
+                }
+            )
+
+        current_values = self._get_values(self._drag_session.figures_names)
+        new_values = self._drag_session.solve(
+            optimizing_values, current_values, DRAG_PRECISION
+        )
+        self._set_values(new_values)
+        self._drag_target = optimizing_values
+
+    def end_drag(self):
+        """Finish moving of figure (e.g. on mouse release): position of the
+        last frame is solved again with final precision.
+
+        Raises
+        ------
+        CannotSolveSystemError
+            If final position can't be found, position of the last frame is
+            kept then.
+        """
+        session, target = self._drag_session, self._drag_target
+        self._drag_binding = None
+        self._drag_session = None
+        self._drag_target = None
+        if session is None or target is None:
+            return
+
+        current_values = self._get_values(session.figures_names)
+        new_values = session.solve(target, current_values, FINAL_PRECISION)
+        self._set_values(new_values)
+
     @measured
     @contract(cursor_x='number', cursor_y='number')
     def move_figure(
         self, binding: PointBinding, cursor_x: float, cursor_y: float
     ):
-        """Move figure.
+        """Move figure once (without preparing of moving, see begin_drag).
 
         Parameters
         ----------
@@ -197,31 +293,49 @@ class CADProject:
         cursor_x, cursor_y: int or float
             Coordinates of cursor.
         """
+        self._check_binding(binding)
+
+        optimizing_values = self._get_optimizing_values(
+            binding, float(cursor_x), float(cursor_y)
+        )
+        if optimizing_values is None:
+            return
 
+        current_values = self._get_values()
+        new_values = self._system.solve_optimization_task(
+            optimizing_values, current_values
+        )
+
+        self._set_values(new_values)
+
+    def _check_binding(self, binding):
         obj_name = binding.get_object_names()[0]
         if obj_name not in self._figures:
             raise RuntimeError(
                 'Binding references to figure that does not exist.'
             )
 
-        cursor_x, cursor_y = float(cursor_x), float(cursor_y)
+    def _get_optimizing_values(
+        self, binding, cursor_x: float, cursor_y: float
+    ) -> dict:
+        """Desired values of figure parameters when binding is moved to
+        cursor: figure_name -> (variable_name -> value).
+        None if binding can't be moved.
+        """
+        obj_name = binding.get_object_names()[0]
 
         if isinstance(binding, PointBinding):
-            optimizing_values = {obj_name: {'x': cursor_x, 'y': cursor_y}}
+            return {obj_name: {'x': cursor_x, 'y': cursor_y}}
         elif isinstance(binding, SegmentSpotBinding):
             spot_type = binding.spot_type
             if spot_type == 'start':
-                optimizing_values = {
-                    obj_name: {'x1': cursor_x, 'y1': cursor_y}
-                }
+                return {obj_name: {'x1': cursor_x, 'y1': cursor_y}}
             elif spot_type == 'end':
-                optimizing_values = {
-                    obj_name: {'x2': cursor_x, 'y2': cursor_y}
-                }
+                return {obj_name: {'x2': cursor_x, 'y2': cursor_y}}
             else:  # center
                 params = self._figures[obj_name].get_params()
                 length, angle = params['length'], params['angle']
-                optimizing_values = {
+                return {
                     obj_name: {
                         'x1': cursor_x - length * np.cos(angle) / 2,
                         'y1': cursor_y - length * np.sin(angle) / 2,
@@ -230,20 +344,10 @@ class CADProject:
                     }
                 }
         elif isinstance(binding, FullSegmentBinding):
-            return
+            return None
         else:
             raise IncorrectParamType(f"Incorrect type {type(binding)}")
 
-        current_values = self._get_values()
-        try:
-            new_values = self._system.solve_optimization_task(
-                optimizing_values, current_values
-            )
-        except CannotSolveSystemError as e:
-            raise e
-
-        self._set_values(new_values)
-
     @contract(figure_name='str')
     def remove_figure(self, figure_name: str):
         """Remove figure.
@@ -337,7 +441,13 @@ class CADProject:
         current_values = self._get_values()
 
         try:
-            self._system.add_restriction_equations(name, equations)
+            self._system.add_restriction_equations(
+                name,
+                equations,
+                restriction,
+                list(figures_names),
+                current_values,
+            )
 
             # Try solve
             try:
@@ -489,16 +599,26 @@ class CADProject:
         else:
             raise ValueError(f'Incorrect type_ {type_}')
 
-    def _get_values(self) -> Dict[str, Dict[str, float]]:
+    def _get_values(
+        self, figures_names: list = None
+    ) -> Dict[str, Dict[str, float]]:
         """
+        Parameters
+        -------
+        figures_names: list[str] or None, optional, default None
+            Names of figures. If None, values of all figures are returned.
 
         Returns
         -------
         current_values: dict(str -> dict(str -> float))
             figure_name -> (variable_name -> value)
         """
+        if figures_names is None:
+            figures_names = self._figures.keys()
+
         values = dict()
-        for name, figure in self._figures.items():
+        for name in figures_names:
+            figure = self._figures[name]
             repr_ = figure.get_base_representation()
             if isinstance(figure, Point):
                 values[name] = dict(zip(['x', 'y'], repr_))
@@ -533,4 +653,8 @@ class CADProject:
     def _rollback(self):
         """Load last state from history."""
         self._state = deepcopy(self._history.get_head())
+        # Position and solutions of the last frame are lost with state
+        self._drag_target = None
+        if self._drag_session is not None:
+            self._drag_session.reset()
         # self._cancelled.clear()  # ???
@@ -1,7 +1,19 @@
 """Module with classes of geometry restrictions."""
 
 # noinspection PyUnresolvedReferences
-from numpy import pi as np_pi, sign as np_sign, tan as np_tan, cos as np_cos
+from numpy import (
+    pi as np_pi,
+    sign as np_sign,
+    tan as np_tan,
+    cos as np_cos,
+    sqrt as np_sqrt,
+    stack as np_stack,
+    broadcast_to as np_broadcast_to,
+    abs as np_abs,
+    zeros as np_zeros,
+    array as np_array,
+    outer as np_outer,
+)
 from sympy import Eq, sqrt as sp_sqrt
 from contracts import contract
 
@@ -9,10 +21,68 @@ from utils import ReferencedToObjects, IncorrectParamValue
 from figures import Point, Segment
 
 
+HESSIAN_STEP = 1e-5
+
+
+def _spot_weights(spot_type: str) -> tuple:
+    """Weights of start and end of segment for spot."""
+    if spot_type == 'start':
+        return 1.0, 0.0
+    elif spot_type == 'end':
+        return 0.0, 1.0
+    else:  # center
+        return 0.5, 0.5
+
+
+def _bilinear_hessian(products: list):
+    """Constant hessian of one equation that is sum of products of linear
+    forms: list of tuples (a, b) for a.dot(values) * b.dot(values).
+    Returns array with shape (1, n_symbols, n_symbols).
+    """
+    result = sum(
+        np_outer(a, b) + np_outer(b, a)
+        for a, b in ((np_array(a), np_array(b)) for a, b in products)
+    )
+    return result[None]
+
+
+def _stack_residuals(residuals: list, shape: tuple):
+    """Stack residuals (numbers or arrays of given shape) to array with
+    shape (*shape, n_equations).
+    """
+    return np_stack([np_broadcast_to(r, shape) for r in residuals], axis=-1)
+
+
+def _stack_jacobian(rows: list, shape: tuple):
+    """Stack rows of jacobian (lists of numbers or arrays of given shape)
+    to array with shape (*shape, n_equations, n_symbols).
+    """
+    return np_stack([_stack_residuals(row, shape) for row in rows], axis=-2)
+
+
 class Restriction:
-    """Base restriction class."""
+    """Base restriction class.
+
+    Besides symbolic equations (get_equations), restriction provides numeric
+    kernels: residuals, jacobian and hessian of the same equations. Kernels are
+    static, get values of symbols (base parameters of objects in order of
+    object_types) and parameters of restrictions (get_parameters) as arrays
+    with any leading dimensions, so many restrictions of one type can be
+    evaluated at once.
+    """
 
     object_types = []
+    n_equations = 0
+    is_linear = False  # Equations are linear (hessian is zero)
+    # Role in search of rigid clusters (see KernelSystem.rigid_clusters):
+    # 'length' - fixes shape of figure, 'joint' - joins spots of figures,
+    # 'angle' - fixes angle between figures, 'attachment' - fixes point
+    # relative to other figure, None - other.
+    rigidity = None
+    # Motions of all objects that keep equations satisfied: 'translation'
+    # and 'rotation' (e.g. fixed figures have no invariances, horizontal
+    # segment can be only translated).
+    invariances = ()
 
     def __init__(self):
         pass
@@ -24,12 +94,87 @@ class Restriction:
     def get_equations(self, *args) -> list:
         raise NotImplementedError
 
+    def get_parameters(self) -> tuple:
+        """Numeric parameters of restriction for kernels."""
+        return ()
+
+    @staticmethod
+    def residuals(values, parameters):
+        """Residuals of equations (left part minus right part).
+
+        Parameters
+        ----------
+        values: np.ndarray with shape (..., n_symbols)
+            Values of base parameters of objects.
+        parameters: np.ndarray with shape (..., n_parameters)
+            Parameters of restrictions (see get_parameters).
+
+        Returns
+        -------
+        residuals: np.ndarray with shape (..., n_equations)
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def jacobian(values, parameters):
+        """Jacobian of residuals by values.
+
+        Parameters
+        ----------
+        values: np.ndarray with shape (..., n_symbols)
+            Values of base parameters of objects.
+        parameters: np.ndarray with shape (..., n_parameters)
+            Parameters of restrictions (see get_parameters).
+
+        Returns
+        -------
+        jacobian: np.ndarray with shape (..., n_equations, n_symbols)
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def hessian(cls, values, parameters):
+        """Second derivatives of residuals by values. By default they are
+        computed by central differences of jacobian (exactly for linear
+        equations).
+
+        Parameters
+        ----------
+        values: np.ndarray with shape (..., n_symbols)
+            Values of base parameters of objects.
+        parameters: np.ndarray with shape (..., n_parameters)
+            Parameters of restrictions (see get_parameters).
+
+        Returns
+        -------
+        hessian: np.ndarray with shape
+        (..., n_equations, n_symbols, n_symbols)
+        """
+        n_symbols = values.shape[-1]
+        result = np_zeros(
+            values.shape[:-1] + (cls.n_equations, n_symbols, n_symbols)
+        )
+        if cls.is_linear:
+            return result
+
+        step = HESSIAN_STEP * (1 + np_abs(values))
+        for i in range(n_symbols):
+            shift = np_zeros(values.shape)
+            shift[..., i] = step[..., i]
+            diff = cls.jacobian(values + shift, parameters) - cls.jacobian(
+                values - shift, parameters
+            )
+            result[..., i] = diff / (2 * step[..., i, None, None])
+        return result
+
 
 # Point
 
 
 class PointFixed(Restriction, ReferencedToObjects):
     object_types = [Point]
+    n_equations = 2
+    is_linear = True
 
     @contract(x='number', y='number')
     def __init__(self, x, y):
@@ -43,12 +188,28 @@ class PointFixed(Restriction, ReferencedToObjects):
         equations = [Eq(x, self._x), Eq(y, self._y)]
         return equations
 
+    def get_parameters(self):
+        return self._x, self._y
+
+    @staticmethod
+    def residuals(values, parameters):
+        return values - parameters
+
+    @staticmethod
+    def jacobian(values, parameters):
+        shape = values.shape[:-1]
+        return _stack_jacobian([[1, 0], [0, 1]], shape)
+
 
 # Two points
 
 
 class PointsJoint(Restriction, ReferencedToObjects):
     object_types = [Point, Point]
+    n_equations = 2
+    is_linear = True
+    rigidity = 'attachment'
+    invariances = ('translation', 'rotation')
 
     @contract(symbols_point_1='dict[2]', symbols_point_2='dict[2]')
     def get_equations(self, symbols_point_1: dict, symbols_point_2: dict):
@@ -57,12 +218,23 @@ class PointsJoint(Restriction, ReferencedToObjects):
         equations = [Eq(x1, x2), Eq(y1, y2)]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        return values[..., 0:2] - values[..., 2:4]
+
+    @staticmethod
+    def jacobian(values, parameters):
+        shape = values.shape[:-1]
+        return _stack_jacobian([[1, 0, -1, 0], [0, 1, 0, -1]], shape)
+
 
 # Segment
 
 
 class SegmentFixed(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 4
+    is_linear = True
 
     @contract(x1='number', y1='number', x2='number', y2='number')
     def __init__(self, x1, y1, x2, y2):
@@ -84,9 +256,25 @@ class SegmentFixed(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    def get_parameters(self):
+        return self._x1, self._y1, self._x2, self._y2
+
+    @staticmethod
+    def residuals(values, parameters):
+        return values - parameters
+
+    @staticmethod
+    def jacobian(values, parameters):
+        shape = values.shape[:-1]
+        return _stack_jacobian(
+            [[int(i == j) for j in range(4)] for i in range(4)], shape
+        )
+
 
 class SegmentSpotFixed(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 2
+    is_linear = True
 
     @contract(x='number', y='number', spot_type='str')
     def __init__(self, x, y, spot_type):
@@ -115,9 +303,33 @@ class SegmentSpotFixed(Restriction, ReferencedToObjects):
 
         return equations
 
+    def get_parameters(self):
+        return (self._x, self._y) + _spot_weights(self._spot_type)
+
+    @staticmethod
+    def residuals(values, parameters):
+        x1, y1, x2, y2 = (values[..., i] for i in range(4))
+        x, y, w1, w2 = (parameters[..., i] for i in range(4))
+        return _stack_residuals(
+            [w1 * x1 + w2 * x2 - x, w1 * y1 + w2 * y2 - y], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        w1, w2 = parameters[..., 2], parameters[..., 3]
+        return _stack_jacobian(
+            [[w1, 0, w2, 0], [0, w1, 0, w2]], values.shape[:-1]
+        )
+
 
 class SegmentLengthFixed(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 1
+    rigidity = 'length'
+    invariances = ('translation', 'rotation')
+    _hessian = _bilinear_hessian(
+        [([-1, 0, 1, 0], [-1, 0, 1, 0]), ([0, -1, 0, 1], [0, -1, 0, 1])]
+    )
 
     @contract(length='number, >0')
     def __init__(self, length):
@@ -131,9 +343,36 @@ class SegmentLengthFixed(Restriction, ReferencedToObjects):
         equations = [Eq((x2 - x1) ** 2 + (y2 - y1) ** 2, self._length ** 2)]
         return equations
 
+    def get_parameters(self):
+        return (self._length,)
+
+    @staticmethod
+    def residuals(values, parameters):
+        dx = values[..., 2] - values[..., 0]
+        dy = values[..., 3] - values[..., 1]
+        length = parameters[..., 0]
+        return _stack_residuals(
+            [dx ** 2 + dy ** 2 - length ** 2], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        dx = values[..., 2] - values[..., 0]
+        dy = values[..., 3] - values[..., 1]
+        return _stack_jacobian(
+            [[-2 * dx, -2 * dy, 2 * dx, 2 * dy]], values.shape[:-1]
+        )
+
+    @classmethod
+    def hessian(cls, values, parameters):
+        return np_broadcast_to(cls._hessian, values.shape[:-1] + (1, 4, 4))
+
 
 class SegmentAngleFixed(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 1
+    is_linear = True
+    invariances = ('translation',)
 
     @contract(angle='number, > 0, < 2 * $np_pi')
     def __init__(self, angle):
@@ -152,9 +391,27 @@ class SegmentAngleFixed(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    def get_parameters(self):
+        return (np_tan(self._angle),)
+
+    @staticmethod
+    def residuals(values, parameters):
+        dx = values[..., 2] - values[..., 0]
+        dy = values[..., 3] - values[..., 1]
+        tan = parameters[..., 0]
+        return _stack_residuals([dy - dx * tan], values.shape[:-1])
+
+    @staticmethod
+    def jacobian(values, parameters):
+        tan = parameters[..., 0]
+        return _stack_jacobian([[tan, -1, -tan, 1]], values.shape[:-1])
+
 
 class SegmentHorizontal(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 1
+    is_linear = True
+    invariances = ('translation',)
 
     @contract(symbols='dict[4]')
     def get_equations(self, symbols: dict):
@@ -163,9 +420,20 @@ class SegmentHorizontal(Restriction, ReferencedToObjects):
         equations = [Eq(y1, y2)]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        return values[..., 1:2] - values[..., 3:4]
+
+    @staticmethod
+    def jacobian(values, parameters):
+        return _stack_jacobian([[0, 1, 0, -1]], values.shape[:-1])
+
 
 class SegmentVertical(Restriction, ReferencedToObjects):
     object_types = [Segment]
+    n_equations = 1
+    is_linear = True
+    invariances = ('translation',)
 
     @contract(symbols='dict[4]')
     def get_equations(self, symbols: dict):
@@ -174,12 +442,54 @@ class SegmentVertical(Restriction, ReferencedToObjects):
         equations = [Eq(x1, x2)]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        return values[..., 0:1] - values[..., 2:3]
+
+    @staticmethod
+    def jacobian(values, parameters):
+        return _stack_jacobian([[1, 0, -1, 0]], values.shape[:-1])
+
 
 # Segments
 
 
+def _segments_deltas(values) -> tuple:
+    """Projections of two segments: s1_dx, s1_dy, s2_dx, s2_dy."""
+    return (
+        values[..., 2] - values[..., 0],
+        values[..., 3] - values[..., 1],
+        values[..., 6] - values[..., 4],
+        values[..., 7] - values[..., 5],
+    )
+
+
+def _segments_jacobian(d_s1_dx, d_s1_dy, d_s2_dx, d_s2_dy, shape) -> tuple:
+    """Jacobian of one equation of two segments by their coordinates
+    from derivatives by projections.
+    """
+    return _stack_jacobian(
+        [
+            [
+                -d_s1_dx,
+                -d_s1_dy,
+                d_s1_dx,
+                d_s1_dy,
+                -d_s2_dx,
+                -d_s2_dy,
+                d_s2_dx,
+                d_s2_dy,
+            ]
+        ],
+        shape,
+    )
+
+
 class SegmentsAngleBetweenFixed(Restriction, ReferencedToObjects):
     object_types = [Segment, Segment]
+    n_equations = 1
+    rigidity = 'angle'
+    invariances = ('translation', 'rotation')
 
     @contract(angle='number, > 0, < 2 * $np_pi')
     def __init__(self, angle):
@@ -205,9 +515,46 @@ class SegmentsAngleBetweenFixed(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    def get_parameters(self):
+        return (np_cos(self._angle),)
+
+    @staticmethod
+    def residuals(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        cos = parameters[..., 0]
+        scalar_prod = s1_dx * s2_dx + s1_dy * s2_dy
+        l1 = np_sqrt(s1_dx ** 2 + s1_dy ** 2)
+        l2 = np_sqrt(s2_dx ** 2 + s2_dy ** 2)
+        return _stack_residuals(
+            [scalar_prod - l1 * l2 * cos], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        cos = parameters[..., 0]
+        l1 = np_sqrt(s1_dx ** 2 + s1_dy ** 2)
+        l2 = np_sqrt(s2_dx ** 2 + s2_dy ** 2)
+        return _segments_jacobian(
+            s2_dx - cos * l2 * s1_dx / l1,
+            s2_dy - cos * l2 * s1_dy / l1,
+            s1_dx - cos * l1 * s2_dx / l2,
+            s1_dy - cos * l1 * s2_dy / l2,
+            values.shape[:-1],
+        )
+
 
 class SegmentsParallel(Restriction, ReferencedToObjects):
     object_types = [Segment, Segment]
+    n_equations = 1
+    rigidity = 'angle'
+    invariances = ('translation', 'rotation')
+    _hessian = _bilinear_hessian(
+        [
+            ([0, -1, 0, 1, 0, 0, 0, 0], [0, 0, 0, 0, -1, 0, 1, 0]),
+            ([0, 0, 0, 0, 0, 1, 0, -1], [-1, 0, 1, 0, 0, 0, 0, 0]),
+        ]
+    )
 
     @contract(symbols_segment_1='dict[4]', symbols_segment_2='dict[4]')
     def get_equations(self, symbols_segment_1: dict, symbols_segment_2: dict):
@@ -223,9 +570,36 @@ class SegmentsParallel(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        return _stack_residuals(
+            [s1_dy * s2_dx - s2_dy * s1_dx], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        return _segments_jacobian(
+            -s2_dy, s2_dx, s1_dy, -s1_dx, values.shape[:-1]
+        )
+
+    @classmethod
+    def hessian(cls, values, parameters):
+        return np_broadcast_to(cls._hessian, values.shape[:-1] + (1, 8, 8))
+
 
 class SegmentsNormal(Restriction, ReferencedToObjects):
     object_types = [Segment, Segment]
+    n_equations = 1
+    rigidity = 'angle'
+    invariances = ('translation', 'rotation')
+    _hessian = _bilinear_hessian(
+        [
+            ([-1, 0, 1, 0, 0, 0, 0, 0], [0, 0, 0, 0, -1, 0, 1, 0]),
+            ([0, -1, 0, 1, 0, 0, 0, 0], [0, 0, 0, 0, 0, -1, 0, 1]),
+        ]
+    )
 
     @contract(symbols_segment_1='dict[4]', symbols_segment_2='dict[4]')
     def get_equations(self, symbols_segment_1: dict, symbols_segment_2: dict):
@@ -241,9 +615,31 @@ class SegmentsNormal(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        return _stack_residuals(
+            [s1_dx * s2_dx + s1_dy * s2_dy], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        s1_dx, s1_dy, s2_dx, s2_dy = _segments_deltas(values)
+        return _segments_jacobian(
+            s2_dx, s2_dy, s1_dx, s1_dy, values.shape[:-1]
+        )
+
+    @classmethod
+    def hessian(cls, values, parameters):
+        return np_broadcast_to(cls._hessian, values.shape[:-1] + (1, 8, 8))
+
 
 class SegmentsSpotsJoint(Restriction, ReferencedToObjects):
     object_types = [Segment, Segment]
+    n_equations = 2
+    is_linear = True
+    rigidity = 'joint'
+    invariances = ('translation', 'rotation')
 
     @contract(spot1_type='str', spot2_type='str')
     def __init__(self, spot1_type, spot2_type):
@@ -285,12 +681,49 @@ class SegmentsSpotsJoint(Restriction, ReferencedToObjects):
 
         return equations
 
+    def get_parameters(self):
+        return _spot_weights(self._spot1_type) + _spot_weights(
+            self._spot2_type
+        )
+
+    @staticmethod
+    def residuals(values, parameters):
+        a1, a2, b1, b2 = (parameters[..., i] for i in range(4))
+        return _stack_residuals(
+            [
+                a1 * values[..., 0]
+                + a2 * values[..., 2]
+                - b1 * values[..., 4]
+                - b2 * values[..., 6],
+                a1 * values[..., 1]
+                + a2 * values[..., 3]
+                - b1 * values[..., 5]
+                - b2 * values[..., 7],
+            ],
+            values.shape[:-1],
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        a1, a2, b1, b2 = (parameters[..., i] for i in range(4))
+        return _stack_jacobian(
+            [
+                [a1, 0, a2, 0, -b1, 0, -b2, 0],
+                [0, a1, 0, a2, 0, -b1, 0, -b2],
+            ],
+            values.shape[:-1],
+        )
+
 
 # Point and Segment
 
 
 class PointOnSegmentFixed(Restriction, ReferencedToObjects):
     object_types = [Point, Segment]
+    n_equations = 2
+    is_linear = True
+    rigidity = 'attachment'
+    invariances = ('translation', 'rotation')
 
     @contract(ratio='number, >0, <1')
     def __init__(self, ratio: float):
@@ -309,9 +742,40 @@ class PointOnSegmentFixed(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    def get_parameters(self):
+        return (self._ratio,)
+
+    @staticmethod
+    def residuals(values, parameters):
+        ratio = parameters[..., 0]
+        x, y, x1, y1, x2, y2 = (values[..., i] for i in range(6))
+        return _stack_residuals(
+            [x - x1 - (x2 - x1) * ratio, y - y1 - (y2 - y1) * ratio],
+            values.shape[:-1],
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        ratio = parameters[..., 0]
+        return _stack_jacobian(
+            [
+                [1, 0, ratio - 1, 0, -ratio, 0],
+                [0, 1, 0, ratio - 1, 0, -ratio],
+            ],
+            values.shape[:-1],
+        )
+
 
 class PointOnSegmentLine(Restriction, ReferencedToObjects):
     object_types = [Point, Segment]
+    n_equations = 1
+    invariances = ('translation', 'rotation')
+    _hessian = _bilinear_hessian(
+        [
+            ([0, 0, -1, 0, 1, 0], [0, 1, 0, -1, 0, 0]),
+            ([-1, 0, 1, 0, 0, 0], [0, 0, 0, -1, 0, 1]),
+        ]
+    )
 
     @contract(symbols_point='dict[2]', symbols_segment='dict[4]')
     def get_equations(self, symbols_point: dict, symbols_segment: dict):
@@ -326,9 +790,32 @@ class PointOnSegmentLine(Restriction, ReferencedToObjects):
         ]
         return equations
 
+    @staticmethod
+    def residuals(values, parameters):
+        x, y, x1, y1, x2, y2 = (values[..., i] for i in range(6))
+        return _stack_residuals(
+            [(x2 - x1) * (y - y1) - (x - x1) * (y2 - y1)], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        x, y, x1, y1, x2, y2 = (values[..., i] for i in range(6))
+        return _stack_jacobian(
+            [[y1 - y2, x2 - x1, y2 - y, x - x2, y - y1, x1 - x]],
+            values.shape[:-1],
+        )
+
+    @classmethod
+    def hessian(cls, values, parameters):
+        return np_broadcast_to(cls._hessian, values.shape[:-1] + (1, 6, 6))
+
 
 class PointAndSegmentSpotJoint(Restriction, ReferencedToObjects):
     object_types = [Point, Segment]
+    n_equations = 2
+    is_linear = True
+    rigidity = 'attachment'
+    invariances = ('translation', 'rotation')
 
     @contract(spot_type='str')
     def __init__(self, spot_type):
@@ -352,9 +839,32 @@ class PointAndSegmentSpotJoint(Restriction, ReferencedToObjects):
 
         return equations
 
+    def get_parameters(self):
+        return _spot_weights(self._spot_type)
+
+    @staticmethod
+    def residuals(values, parameters):
+        w1, w2 = parameters[..., 0], parameters[..., 1]
+        x, y, x1, y1, x2, y2 = (values[..., i] for i in range(6))
+        return _stack_residuals(
+            [x - w1 * x1 - w2 * x2, y - w1 * y1 - w2 * y2], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        w1, w2 = parameters[..., 0], parameters[..., 1]
+        return _stack_jacobian(
+            [[1, 0, -w1, 0, -w2, 0], [0, 1, 0, -w1, 0, -w2]],
+            values.shape[:-1],
+        )
+
 
 class SegmentSpotAndPointJoint(Restriction, ReferencedToObjects):
     object_types = [Segment, Point]
+    n_equations = 2
+    is_linear = True
+    rigidity = 'attachment'
+    invariances = ('translation', 'rotation')
 
     @contract(spot_type='str')
     def __init__(self, spot_type):
@@ -377,3 +887,22 @@ class SegmentSpotAndPointJoint(Restriction, ReferencedToObjects):
             equations = [Eq(x, (x1 + x2) / 2), Eq(y, (y1 + y2) / 2)]
 
         return equations
+
+    def get_parameters(self):
+        return _spot_weights(self._spot_type)
+
+    @staticmethod
+    def residuals(values, parameters):
+        w1, w2 = parameters[..., 0], parameters[..., 1]
+        x1, y1, x2, y2, x, y = (values[..., i] for i in range(6))
+        return _stack_residuals(
+            [x - w1 * x1 - w2 * x2, y - w1 * y1 - w2 * y2], values.shape[:-1]
+        )
+
+    @staticmethod
+    def jacobian(values, parameters):
+        w1, w2 = parameters[..., 0], parameters[..., 1]
+        return _stack_jacobian(
+            [[-w1, 0, -w2, 0, 1, 0], [0, -w1, 0, -w2, 0, 1]],
+            values.shape[:-1],
+        )
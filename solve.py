@@ -1,25 +1,62 @@
 """Module that provides the means to save and solve systems of equations."""
 
-from numpy import array as np_array, ndarray as np_ndarray, random
+from numpy import (
+    array as np_array,
+    ndarray as np_ndarray,
+    zeros as np_zeros,
+    ones as np_ones,
+    concatenate as np_concatenate,
+    diag as np_diag,
+    block as np_block,
+    linalg as np_linalg,
+    abs as np_abs,
+    arctan2 as np_arctan2,
+    cos as np_cos,
+    sin as np_sin,
+    vstack as np_vstack,
+    column_stack as np_column_stack,
+    flatnonzero as np_flatnonzero,
+    linspace as np_linspace,
+    isfinite as np_isfinite,
+    random as np_random,
+)
 from sympy import (
     Eq,
     Symbol,
+    Matrix,
     lambdify,
     true as sympy_true,
     false as sympy_false,
     Integer as sympy_Integer,
+    Float as sympy_Float,
+    linear_eq_to_matrix,
 )
+from sympy.solvers.solveset import NonlinearError
 
-import networkx as nx
-import scipy.optimize as sp_optimize
+from scipy.linalg import qr as sp_qr, null_space
+from scipy.sparse import bmat as sp_bmat, diags as sp_diags
+from scipy.sparse.linalg import splu
 
 from contracts import contract, new_contract
-from itertools import combinations
 from collections import defaultdict
-import re
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import types
-
-from utils import IncorrectParamValue
+import atexit
+from math import ceil
+
+from utils import IncorrectParamValue, LRUCache, UnionFind
+from structure import Incidence
+from kernels import KernelSystem, ReducedKernelSystem
+from strategies import (
+    RootProblem,
+    StrategySelector,
+    StrategyFailed,
+    MultiStart,
+    FTOL,
+    PRECISIONS,
+    INITIAL_GUESSES,
+)
 
 # noinspection PyUnresolvedReferences,PyPep8Naming
 from diagnostic_context import (
@@ -27,22 +64,61 @@ from diagnostic_context import (
     measured,
     measured_total,
     measure_total,
+    count,
     DEFAULT_CONTEXT_TOTAL as context_total,
 )
 
 
 DELIMITER = '___'
-SPECIAL_NAME = 'special_name'
-GROWTH_NODE_NAME = 'growth_node'
+PARAMETER_NAME = 'parameter'
+
+COMPILED_CACHE_SIZE = 128
+BLOCKS_CACHE_SIZE = 1024
+SOLUTIONS_MEMO_SIZE = 1024
+
+# Modes of solving of optimization tasks (figures moving):
+# symbolic - Lagrange method with SymPy equations,
+# kernels - numeric kernels of restrictions (SymPy is not used, components
+# with restrictions without kernels are solved symbolically).
+SOLVER_MODES = ('symbolic', 'kernels')
+
+HIGH_PRIORITY_WEIGHT = 1000
+
+# Systems with at least this number of unknowns (symbols and multipliers)
+# are solved with sparse jacobians: dense ones take O(N^2) memory and
+# O(N^3) time to factor.
+SPARSE_SOLVER_MIN_SIZE = 200
+# Regularization of sparse Lagrange system (for redundant equations)
+SPARSE_SOLVER_REGULARIZATION = 1e-10
+
+# Components are solved in parallel (if system has workers) only if they
+# have at least this number of equations in total: otherwise transfer of
+# systems to processes takes more time than solving.
+PARALLEL_SOLVING_MIN_EQUATIONS = 100
+# Row of jacobian depends on other rows if its distance to their span is
+# less than this part of its norm (see ComponentRank)
+RANK_TOLERANCE = 1e-8
+# Restriction that depends on others at degenerate values (e.g. angle of
+# zero length segment) is checked again at values that are perturbed by
+# this part of their scale and projected to solutions of other restrictions
+# in at most this number of Gauss-Newton iterations (see ComponentRank)
+RANK_PERTURBATION = 1e-3
+RANK_PROJECTION_ITERATIONS = 20
+RANK_PERTURBATION_SEED = 0
+# Motion of frame of figure moving is split in sub-steps that are at most
+# this part of size of the smallest figure of component (see DragSession),
+# but in at most this number of sub-steps
+CONTINUATION_MAX_STEP = 0.25
+CONTINUATION_MAX_SUBSTEPS = 8
 
 figures_values_contract = new_contract(
     'figures_values', 'dict(str: dict(str: float))'
 )
 
-number_pattern = re.compile(r'-?[ ]?\d+\.?\d*')
-
 empty_dict = types.MappingProxyType({})
 
+_executors = dict()  # number of workers -> ProcessPoolExecutor
+
 
 @contract(base_name='str', object_name='str', returns='str')
 def compose_full_name(base_name: str, object_name: str) -> str:
@@ -97,12 +173,45 @@ def unroll_values_dict(hierarchical_dict: dict) -> dict:
     return result
 
 
-@contract(symbols_names='list(str)')
-def get_equation_symbols_names(equation: Eq, symbols_names: list) -> set:
-    # res =  set([w for w in symbols_names if w in str(equation)])
-    str_atoms = [str(a) for a in equation.atoms()]
-    res = set([w for w in symbols_names if w in str_atoms])
-    return res
+def get_executor(n_workers: int) -> ProcessPoolExecutor:
+    """Pool of processes shared by all systems (copies of systems in
+    project history don't start their own pools). Pools are shut down on
+    exit of interpreter.
+    """
+    executor = _executors.get(n_workers)
+    if executor is None:
+        executor = ProcessPoolExecutor(n_workers)
+        _executors[n_workers] = executor
+    return executor
+
+
+@atexit.register
+def shutdown_executors():
+    """Shut down pools of processes (they are started again on demand)."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown()
+
+
+def _solve_components(
+    system, desired_values: dict, blocks_solutions: list
+) -> tuple:
+    """Solve all components of system (in process of pool).
+
+    Solutions of blocks of parent system are used (they aren't pickled
+    with system), solutions of blocks are returned to be remembered by it.
+    """
+    for key, value in blocks_solutions:
+        system._blocks_solutions.put(key, value)
+    result = dict()
+    for component in system._get_components():
+        result.update(
+            system._solve_component(
+                component,
+                {name: desired_values[name] for name in component.symbols},
+            )
+        )
+    return result, system._blocks_solutions.items()
 
 
 class CannotSolveSystemError(Exception):
@@ -136,6 +245,37 @@ class SystemIncompatibleError(SystemOverfittedError):
     pass
 
 
+class OverconstrainedError(SystemOverfittedError):
+    """
+    Equations of new restriction depend on equations of existing ones
+    (see EquationsSystem.add_restriction_equations).
+    """
+
+    def __init__(self, message: str, restrictions_names: list):
+        super().__init__(message)
+        self.restrictions_names = restrictions_names
+
+
+class RedundantRestrictionError(OverconstrainedError):
+    """
+    New restriction is satisfied by existing ones,
+    e.g. the fourth right angle of rectangle.
+    """
+
+    pass
+
+
+class ConflictingRestrictionError(
+    OverconstrainedError, SystemIncompatibleError
+):
+    """
+    New restriction conflicts with existing ones,
+    e.g. other length of side of rigid rectangle.
+    """
+
+    pass
+
+
 class SubstitutionError(Exception):
     pass
 
@@ -147,6 +287,7 @@ class Substitutor:
 
     def __init__(self):
         self._subs = dict()  # str -> Union[Symbol, float]
+        self._replacements = dict()  # Symbol -> Union[Symbol, Float]
         self._symbols_dict = None  # str -> Symbol
 
     @property
@@ -173,75 +314,61 @@ class Substitutor:
         # At first, go through all simple equations,
         # swap if, e.g. 5 = 'x',
         # if value is number, save it to self._subs
-        # else save to symbols dict
-        sym2sym_dict = dict()
+        # else join symbols to sets of equal symbols
+        equal_symbols = UnionFind()
+        pairs = set()
         for eq in system:
-            if self._is_simple_equation(eq):
-                key = str(eq.lhs)
-                value = str(eq.rhs)
-
-                if re.fullmatch(number_pattern, key):
-                    if value in self._subs:
-                        raise SubstitutionError('Two same keys.')
-                    self._subs[value] = float(key)
-                elif re.fullmatch(number_pattern, value):
-                    if key in self._subs:
-                        raise SubstitutionError('Two same keys.')
-                    self._subs[key] = float(value)
-                else:
-                    if key in sym2sym_dict and sym2sym_dict[key] == value:
-                        # Case when value in keys() and key in values() will
-                        # be treated later
-                        raise SubstitutionError('Two same equations.')
-                    sym2sym_dict[key] = value
-
-        # Then treat cases with 2 values
-        # So much code to treat different cases
-        # E.g. x=y, y=z, y=5 -> x: 5, y: 5, z: 5
-
-        # Graph to find connected_components and cycles
-        graph = nx.Graph()
-        for key, value in sym2sym_dict.items():
-            if (key, value) in graph.edges:  # order is not important
-                raise SubstitutionError('Two same equations.')
-            if key not in graph.nodes:
-                graph.add_node(key)
-            if value not in graph.nodes:
-                graph.add_node(value)
-            graph.add_edge(key, value)
+            if not self._is_simple_equation(eq):
+                continue
+            lhs, rhs = eq.lhs, eq.rhs
+            if lhs.is_Number:
+                lhs, rhs = rhs, lhs
+            key = lhs.name
+
+            if rhs.is_Number:
+                if key in self._subs:
+                    raise SubstitutionError('Two same keys.')
+                self._subs[key] = float(rhs)
+                continue
 
-        # If there is cycle in graph, system is underfited (a=b, b=c, c=a)
-        try:
-            nx.find_cycle(graph)
-        except nx.NetworkXNoCycle:
-            pass
-        else:
-            raise SubstitutionError('Cycle in equations graph.')
+            # Then treat cases with 2 values
+            # E.g. x=y, y=z, y=5 -> x: 5, y: 5, z: 5
+            value = rhs.name
+            pair = frozenset((key, value))
+            if pair in pairs:  # order is not important
+                raise SubstitutionError('Two same equations.')
+            pairs.add(pair)
+            equal_symbols.add(key)
+            equal_symbols.add(value)
+            if equal_symbols.find(key) == equal_symbols.find(value):
+                # System is underfitted (a=b, b=c, c=a)
+                raise SubstitutionError('Cycle in equations graph.')
+            equal_symbols.union(key, value)
 
-        subgraphs = [
-            graph.subgraph(c).copy() for c in nx.connected_components(graph)
-        ]
-        for subgraph in subgraphs:
-            nodes_in_subs = [
-                node for node in subgraph.nodes if node in self._subs
-            ]
+        for group in equal_symbols.groups().values():
+            nodes_in_subs = [node for node in group if node in self._subs]
 
             if len(nodes_in_subs) > 1:  # overfitted
                 raise SubstitutionError('Substitutor get two same keys.')
 
             elif len(nodes_in_subs) == 1:  # has value for all nodes
                 key_node = nodes_in_subs[0]
-                for node in subgraph.nodes:
+                for node in group:
                     if node != key_node:
                         self._subs[node] = self._subs[key_node]
 
-            else:  # len == 0 (no value for nodes)
-                iter_ = iter(subgraph.nodes)
-                key_node = next(iter_)
-                for node in iter_:
-                    if node != key_node:
-                        self._subs[node] = self._symbols_dict[key_node]
+            else:  # len == 0 (no value for nodes), the first one is kept
+                key_node = group[0]
+                for node in group[1:]:
+                    self._subs[node] = self._symbols_dict[key_node]
 
+        # Symbols are replaced at once by one xreplace, names are not parsed
+        self._replacements = {
+            self._symbols_dict[name]: (
+                sympy_Float(value) if isinstance(value, float) else value
+            )
+            for name, value in self._subs.items()
+        }
         return self
 
     @contract(system='list', returns='list')
@@ -258,19 +385,11 @@ class Substitutor:
         new_system: list[sympy.Eq]
             System with substitutions.
         """
-        new_system = []
-
-        for eq in system:
-            if not self._is_simple_equation(eq):
-                new_eq = eq.subs(
-                    [
-                        (sym_name, value)
-                        for sym_name, value in self._subs.items()
-                    ]
-                )
-                new_system.append(new_eq)
-
-        return new_system
+        return [
+            eq.xreplace(self._replacements)
+            for eq in system
+            if not self._is_simple_equation(eq)
+        ]
 
     @contract(solution='dict', returns='dict')
     def restore(self, solution: dict) -> dict:
@@ -291,250 +410,1463 @@ class Substitutor:
 
         try:
             for k, v in self._subs.items():
-                if not isinstance(v, float):
-                    self._subs[k] = solution[str(v)]  # v must be in solution
+                if isinstance(v, float):
+                    full_solution[k] = v
+                else:
+                    full_solution[k] = solution[str(v)]  # must be in solution
         except KeyError:
             raise RuntimeError(f'Symbol {v} not in solution')
 
-        full_solution.update(self._subs)
         return full_solution
 
-    def _is_simple_equation(self, eq):
+    def _is_simple_equation(self, eq) -> bool:
         """Check if equation is simple (looks like x = y or x = 5)."""
-        l_str, r_str = str(eq.lhs), str(eq.rhs)
+        lhs, rhs = eq.lhs, eq.rhs
+        if self._is_known_symbol(lhs):
+            return self._is_known_symbol(rhs) or rhs.is_Number
+        return lhs.is_Number and self._is_known_symbol(rhs)
 
-        if l_str in self._symbols_dict:
-            ltype = 'sym'
-        elif re.fullmatch(number_pattern, l_str):
-            ltype = 'num'
-        else:
-            return False
+    def _is_known_symbol(self, expr) -> bool:
+        return expr.is_Symbol and expr.name in self._symbols_dict
 
-        if r_str in self._symbols_dict:
-            return True
-        elif re.fullmatch(number_pattern, r_str) and ltype == 'sym':
-            return True
-        else:
-            return False
 
+class CompiledSystem:
+    """Numeric representation of canonical system of equations.
 
-class EquationsSystem:
-    def __init__(self):
-        self._symbols = dict()
-        self._equations = dict()
-        self._graph = nx.MultiGraph()
+    Function and jacobian take values of symbols and values of parameters
+    (constants that can change from one solve to another, e.g. desired
+    values). Large systems have no jacobian, but have sparsity structure
+    of it (scipy.sparse matrix) instead.
+    """
 
-    @property
-    def _figures_names(self):
-        return list(set([split_full_name(name)[0] for name in self._symbols]))
+    def __init__(
+        self, function: callable, jacobian: callable = None, sparsity=None
+    ):
+        self.function = function
+        self.jacobian = jacobian
+        self.sparsity = sparsity
 
-    @property
-    def _restrictions_names(self):
-        return list(set([split_full_name(nam)[0] for nam in self._equations]))
 
-    @contract(figure_name='str', symbols_names='list(str)')
-    def add_figure_symbols(self, figure_name: str, symbols_names: list):
-        """
-        Add symbols for one figure.
-        Cannot add symbols for existing figure.
+class OptimizationTask:
+    """Optimization task for one component: find values of symbols that
+    satisfy equations and are the closest to desired values (high priority
+    desired values are much more important than others).
 
+    Task is prepared (simplified, differentiated and compiled) once and can
+    be solved many times with other desired values, e.g. on every frame of
+    figure moving.
+    """
+
+    def __init__(
+        self,
+        symbols_names: list,
+        unknowns_names: list,
+        n_multipliers: int,
+        parameters_sources: list,
+        high_priority_names: dict,
+        substitutor: Substitutor,
+        compiled: CompiledSystem = None,
+        solver: StrategySelector = None,
+        solver_key=None,
+        linear_system: tuple = None,
+    ):
+        """
         Parameters
         ----------
-        figure_name: str
-            Name of figure.
         symbols_names: list[str]
-            Names f symbols for figure.
+            Names of all symbols of task (including substituted).
+        unknowns_names: list[str]
+            Names of unknowns of compiled system: Lagrange multipliers, then
+            symbols.
+        n_multipliers: int
+            Number of Lagrange multipliers.
+        parameters_sources: list[tuple(str, bool)]
+            For every parameter of compiled system: name of symbol whose
+            desired value it is and if this value is high priority.
+        high_priority_names: dict (str -> str)
+            Names of symbols that can have high priority desired values ->
+            names of unknowns that get these values (they differ if symbol
+            was substituted).
+        substitutor: Substitutor
+            Fitted substitutor to restore substituted symbols.
+        compiled: CompiledSystem or None
+            None if there are no unknowns.
+        solver: StrategySelector or None, optional, default None
+            Selector of numeric strategies. If None, new one is used.
+        solver_key: hashable or None, optional, default None
+            Key to remember successful strategy (e.g. component).
+        linear_system: tuple(np.ndarray, np.ndarray) or None, optional
+            Matrix and right hand side of linear system of unknowns (without
+            multipliers), then it's solved directly and nothing is compiled.
+        """
+        self.symbols_names = symbols_names
+        self.unknowns_names = unknowns_names
+        self._n_multipliers = n_multipliers
+        self._parameters_sources = parameters_sources
+        self._high_priority_names = high_priority_names
+        self._substitutor = substitutor
+        self.compiled = compiled
+        self.solver = solver or StrategySelector()
+        self.solver_key = solver_key
+        self.linear_system = linear_system
+
+    def solve(
+        self,
+        desired_values: dict,
+        high_priority_desired_values: dict = empty_dict,
+        initial_values: np_ndarray = None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Solve task numerically.
 
-        Raises
-        ------
-        IncorrectParamValue: if given figure has already exist.
+        Parameters
+        ----------
+        desired_values: dict (str -> float)
+            Desired values of symbols (e.g. current values).
+        high_priority_desired_values: dict (str -> float)
+            Desired values of optimizing symbols.
+        initial_values: np.ndarray or None, optional, default None
+            Initial values of all unknowns (e.g. previous solution). If None,
+            desired values are used for symbols and multipliers are guessed
+            by initial guess of solver. Linear systems don't need them.
+        precision: str, optional, default 'polish'
+            Name of precision of numeric solving (see strategies.PRECISIONS).
+
+        Returns
+        -------
+        solution: dict (str -> float)
+            Values of all symbols of task.
+        unknowns_values: np.ndarray
+            Values of all unknowns (including Lagrange multipliers).
         """
-        if figure_name in self._figures_names:
-            raise IncorrectParamValue(
-                f'Figure {figure_name} has already exist.'
+        high_priority_values = {}
+        for name, value in high_priority_desired_values.items():
+            unknown_name = self._high_priority_names.get(name)
+            if unknown_name is not None:
+                high_priority_values[unknown_name] = value
+
+        if self.linear_system is not None:
+            target = np_array(
+                [
+                    high_priority_values.get(name, desired_values[name])
+                    for name in self.unknowns_names
+                ],
+                dtype=float,
+            )
+            weights = np_array(
+                [
+                    HIGH_PRIORITY_WEIGHT if name in high_priority_values else 1
+                    for name in self.unknowns_names
+                ],
+                dtype=float,
+            )
+            matrix, rhs = self.linear_system
+            unknowns_values, _ = EquationsSystem._solve_linear_closest(
+                matrix, rhs, weights, target, allow_redundant=False
+            )
+        elif self.compiled is None:
+            unknowns_values = np_array([])
+        else:
+            parameters_values = np_array(
+                [
+                    high_priority_values[name]
+                    if is_high_priority
+                    else desired_values[name]
+                    for name, is_high_priority in self._parameters_sources
+                ],
+                dtype=float,
             )
 
-        symbols_names = [
-            compose_full_name(figure_name, sym) for sym in symbols_names
+            problem = RootProblem(
+                self.compiled.function,
+                parameters_values,
+                self.compiled.jacobian,
+                self.compiled.sparsity,
+                scaled=slice(self._n_multipliers, None),
+            )
+            if initial_values is None:
+                initial_values = self._guess_initial_values(
+                    problem, desired_values
+                )
+            unknowns_values = EquationsSystem._solve_problem(
+                problem,
+                initial_values,
+                self.solver,
+                self.solver_key,
+                precision,
+            )
+
+        solution = dict(
+            zip(
+                self.unknowns_names[self._n_multipliers :],
+                unknowns_values[self._n_multipliers :].tolist(),
+            )
+        )
+        return self._substitutor.restore(solution), unknowns_values
+
+    def _guess_initial_values(
+        self, problem: RootProblem, desired_values: dict
+    ) -> np_ndarray:
+        """Desired values of symbols and guessed multipliers.
+
+        Equations of compiled system are derivatives of Lagrange function
+        by symbols, then equations of task, so for zero multipliers its
+        first residuals are gradient of objective and its jacobian has J.T
+        in the top left block.
+        """
+        n = self._n_multipliers
+        symbols_values = [
+            desired_values[name] for name in self.unknowns_names[n:]
         ]
-        new_symbols = {
-            name: Symbol(name) for name in symbols_names
-        }
-        self._symbols.update(new_symbols)
-        self._update_graph()
+        initial_values = np_concatenate([np_zeros(n), symbols_values])
+        if n == 0:
+            return initial_values
+
+        n_symbols = len(symbols_values)
+        gradient = problem.fun(initial_values, problem.params)[:n_symbols]
+        jacobian_t = None
+        if problem.jac is not None:
+            jacobian = problem.jac(initial_values, problem.params)
+            jacobian_t = jacobian[:n_symbols, :n]
+        initial_values[:n] = self.solver.initial_guess.multipliers(
+            n, gradient, jacobian_t
+        )
+        return initial_values
 
-    @contract(figure_name='str', symbol_name='str | None')
-    def get_symbols(self, figure_name: str, symbol_name: str = None):
+
+class KernelTask:
+    """Optimization task for one component that is solved with numeric
+    kernels of restrictions, without SymPy.
+
+    Newton iterations for Lagrange method, so solutions are the same as in
+    symbolic method.
+    """
+
+    def __init__(
+        self,
+        system: KernelSystem,
+        high_priority_names: list,
+        solver: StrategySelector = None,
+        solver_key=None,
+    ):
         """
-        Return symbols for one figure.
+        Parameters
+        ----------
+        system: KernelSystem
+            Equations of component.
+        high_priority_names: list[str]
+            Names of symbols that can have high priority desired values.
+        solver: StrategySelector or None, optional, default None
+            Selector of numeric strategies. If None, new one is used.
+        solver_key: hashable or None, optional, default None
+            Key to remember successful strategy (e.g. component).
+        """
+        self.system = system
+        self.solver = solver or StrategySelector()
+        self.solver_key = solver_key
+        self.symbols_names = system.symbols_names
+        symbols_ids = {name: i for i, name in enumerate(self.symbols_names)}
+        self._high_priority_ids = {
+            name: symbols_ids[name] for name in high_priority_names
+        }
+
+    def solve(
+        self,
+        desired_values: dict,
+        high_priority_desired_values: dict = empty_dict,
+        initial_values: np_ndarray = None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Solve task numerically.
 
         Parameters
         ----------
-        figure_name: str
-            Name of figure.
-        symbol_name: str or None, optional, default None
-            If string, returns symbol with this name.
-            If None, returns dictionary with all symbols of given figure.
+        desired_values: dict (str -> float)
+            Desired values of symbols (e.g. current values).
+        high_priority_desired_values: dict (str -> float)
+            Desired values of optimizing symbols.
+        initial_values: np.ndarray or None, optional, default None
+            Initial values of symbols and Lagrange multipliers (e.g.
+            previous solution). If None, desired values (current geometry,
+            without high priority ones) are used for symbols and multipliers
+            are guessed.
+        precision: str, optional, default 'polish'
+            Name of precision of numeric solving (see strategies.PRECISIONS).
 
         Returns
         -------
-            symbols or symbol: dict(str -> sympy.Symbol) or sympy.Symbol
-
-        Raises
-        ------
-            IncorrectParamValue: if there is no such figure or if symbol name
-            is given, but such symbol for such figure does not exist.
+        solution: dict (str -> float)
+            Values of all symbols of task.
+        unknowns_values: np.ndarray
+            Values of all symbols and Lagrange multipliers.
         """
-        if figure_name not in self._figures_names:
-            raise IncorrectParamValue(f'Figure {figure_name} does not exist.')
-
-        if symbol_name is not None:
-            symbol_name = compose_full_name(figure_name, symbol_name)
-            if symbol_name not in self._symbols:
-                raise IncorrectParamValue('No such symbol.')
-            return self._symbols[symbol_name]
+        current = np_array(
+            [desired_values[name] for name in self.symbols_names],
+            dtype=float,
+        )
+        target = current.copy()
+        weights = np_ones(len(target))
+        for name, value in high_priority_desired_values.items():
+            i = self._high_priority_ids.get(name)
+            if i is not None:
+                target[i] = value
+                weights[i] = HIGH_PRIORITY_WEIGHT
+
+        if initial_values is None:
+            x, multipliers = EquationsSystem._solve_closest(
+                self.system,
+                target,
+                weights,
+                current,
+                solver=self.solver,
+                solver_key=self.solver_key,
+                precision=precision,
+            )
         else:
-            result = dict()
-            for name, sym in self._symbols.items():
-                base_name, object_name = split_full_name(name)
-                if base_name == figure_name:
-                    result[object_name] = sym
-            return result
+            n_symbols = len(self.symbols_names)
+            x, multipliers = EquationsSystem._solve_closest(
+                self.system,
+                target,
+                weights,
+                initial_values[:n_symbols],
+                initial_values[n_symbols:],
+                solver=self.solver,
+                solver_key=self.solver_key,
+                precision=precision,
+            )
+        solution = dict(zip(self.symbols_names, x.tolist()))
+        return solution, np_concatenate([x, multipliers])
 
-    @contract(figure_name='str')
-    def remove_figure_symbols(self, figure_name: str):
-        """
-        Remove all symbols for given figure.
 
+class SolutionsMemo:
+    """Memoization of solutions of optimization tasks of components.
+
+    Keys are components (solver keys of tasks) and desired values rounded
+    to multiples of quantum, so the same positions (e.g. when figure is
+    moved back and forth) are not solved again. Hits and misses are counted
+    in diagnostic_context counters.
+    """
+
+    def __init__(self, quantum: float, maxsize: int = SOLUTIONS_MEMO_SIZE):
+        """
         Parameters
         ----------
-        figure_name: str
-            Name of figure.
+        quantum: float
+            Desired values that differ less than quantum can have the same
+            solution.
+        maxsize: int, optional, default SOLUTIONS_MEMO_SIZE
+            Max number of solutions, least recently used are evicted.
+        """
+        self.quantum = quantum
+        self._cache = LRUCache(maxsize)
 
-        Raises
-        -------
-        IncorrectParamValue: if there is no figure with such name.
+    def solve(
+        self,
+        solver_key,
+        symbols_names: list,
+        solve: callable,
+        desired_values: dict,
+        high_priority_desired_values: dict = empty_dict,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Return memoized solution of component (solver_key) with given
+        symbols or solve() (e.g. solution of task, see OptimizationTask.solve)
+        that is memoized. Components without solver keys are not memoized.
         """
-        if figure_name not in self._figures_names:
-            raise IncorrectParamValue(f'Figure {figure_name} does not exist.')
+        if solver_key is None:
+            return solve()
+
+        key = self.get_key(
+            solver_key,
+            symbols_names,
+            desired_values,
+            high_priority_desired_values,
+            precision,
+        )
+        result = self.get(key)
+        if result is None:
+            result = solve()
+            self.put(key, result)
+        return result
 
-        symbols_to_delete = [
-            name
-            for name in self._symbols.keys()
-            if split_full_name(name)[0] == figure_name
-        ]
+    def get_key(
+        self,
+        solver_key,
+        symbols_names: list,
+        desired_values: dict,
+        high_priority_desired_values: dict,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Key of solution of component (solver_key) with given symbols."""
+        quantum = self.quantum
+        return (
+            solver_key,
+            precision,
+            tuple(
+                round(desired_values[name] / quantum)
+                for name in symbols_names
+            ),
+            tuple(
+                (name, round(high_priority_desired_values[name] / quantum))
+                for name in symbols_names
+                if name in high_priority_desired_values
+            ),
+        )
 
-        for symbol_name in symbols_to_delete:
-            self._symbols.pop(symbol_name)
-        self._update_graph()
+    def get(self, key):
+        """Memoized result for key or None, hits and misses are counted."""
+        result = self._cache.get(key)
+        count(
+            'solutions_memo_hits'
+            if result is not None
+            else 'solutions_memo_misses'
+        )
+        return result
 
-    @contract(restriction_name='str', equations='list')
-    def add_restriction_equations(
-        self, restriction_name: str, equations: list
-    ):
+    def put(self, key, result):
+        self._cache.put(key, result)
+
+    def forget(self, condition: callable):
+        """Remove solutions of components (solver keys) that satisfy
+        condition.
         """
-        Add equations for one restriction.
+        self._cache.remove_if(lambda key: condition(key[0]))
 
-        Parameters
-        ----------
-        restriction_name: str
+    def __len__(self):
+        return len(self._cache)
 
-        equations: list[sympy.Eq]
-            List of equations.
 
-        Raises
-        ------
-        IncorrectParamValue: if given restriction has already exist.
-        """
-        if restriction_name in self._restrictions_names:
-            raise IncorrectParamValue(
-                f'Restriction {restriction_name} has already exist.'
-            )
+class DragSession:
+    """Figure moving (e.g. from mouse press to mouse release).
 
-        equations_names = [
-            compose_full_name(restriction_name, str(i))
-            for i in range(len(equations))
-        ]
-        new_equations = {
-            name: eq for name, eq in zip(equations_names, equations)
-        }
-        self._equations.update(new_equations)
-        self._update_graph()
+    Optimization tasks are prepared once per moving, so every frame is solved
+    numerically only. Solution of previous frame (including Lagrange
+    multipliers) is used as initial values for the next frame: Lagrange
+    system is linear in desired values, so the first Newton step from it is
+    linear predictor of solution. Large motions (see CONTINUATION_MAX_STEP)
+    are split in sub-steps, every one starts from solution of the previous
+    one, so solution follows cursor continuously and doesn't jump to other
+    branch (e.g. other side of elbow of joined segments).
+    """
 
-    @contract(restriction_name='str')
-    def remove_restriction_equations(self, restriction_name: str):
+    def __init__(self, tasks: list, memo: SolutionsMemo = None):
         """
-        Remove all equations for given restriction.
-
         Parameters
         ----------
-        restriction_name: str
-            Name of restriction.
-
-        Raises
-        -------
-        IncorrectParamValue: if there is no such restriction.
+        tasks: list[OptimizationTask or KernelTask or MotionTask]
+            Tasks of components with optimizing symbols.
+        memo: SolutionsMemo or None, optional, default None
+            Memoization of solutions, if it's used.
         """
-
-        if restriction_name not in self._restrictions_names:
-            raise IncorrectParamValue(
-                f'Restriction {restriction_name} does not exists.'
+        self._tasks = tasks
+        self._memo = memo
+        self._solutions = [None] * len(tasks)
+        # Current values and optimizing values of the previous frame
+        self._targets = None
+        self.figures_names = sorted(
+            set(
+                split_full_name(name)[0]
+                for task in tasks
+                for name in task.symbols_names
             )
+        )
 
-        equations_to_delete = [
-            name
-            for name in self._equations.keys()
-            if split_full_name(name)[0] == restriction_name
-        ]
-
-        for equation_name in equations_to_delete:
-            self._equations.pop(equation_name)
-        self._update_graph()
+    def reset(self):
+        """Forget solutions of previous frames (e.g. after rollback of
+        project), tasks are kept.
+        """
+        self._solutions = [None] * len(self._tasks)
+        self._targets = None
 
-    @contract(current_values='figures_values', returns='figures_values')
-    def solve(self, current_values: dict) -> dict:
-        """Solve full system in a current state.
+    def solve(
+        self,
+        optimizing_values: dict,
+        current_values: dict,
+        precision: str = 'polish',
+    ) -> dict:
+        """Solve frame of moving.
 
         Parameters
         ----------
+        optimizing_values: str -> (str -> number)
+            Desired values of optimizing variables:
+            figure_name -> (symbol_name -> value).
         current_values: str -> (str -> number)
-            Current values of variables: figure_name -> (symbol_name -> value).
+            Current values of variables (at least of figures_names):
+            figure_name -> (symbol_name -> value).
+        precision: str, optional, default 'polish'
+            Name of precision of numeric solving (see strategies.PRECISIONS),
+            e.g. 'interactive' for frames and 'polish' for the final one.
 
         Returns
         ----------
         new_values: str -> (str -> number)
             New values of variables: figure_name -> (symbol_name -> value).
         """
+        targets = (
+            unroll_values_dict(current_values),
+            unroll_values_dict(optimizing_values),
+        )
 
-        current_values = unroll_values_dict(current_values)
+        result = dict()
+        for i, task in enumerate(self._tasks):
+            if self._memo is None:
+                solution = self._solve_task(i, targets, precision)
+            else:
+                solution = self._memo.solve(
+                    task.solver_key,
+                    task.symbols_names,
+                    lambda: self._solve_task(i, targets, precision),
+                    *targets,
+                    precision,
+                )
+            res, self._solutions[i] = solution
+            result.update(res)
 
-        result = {}
-        subgraphs = [
-            self._graph.subgraph(c).copy()
-            for c in nx.connected_components(self._graph)
-        ]
-        for subgraph in subgraphs:
-            equations_names = set(
-                [
-                    edge[2]['equation_name']
-                    for edge in subgraph.edges(data=True)
-                ]
+        self._targets = targets
+        return roll_up_values_dict(result)
+
+    def _solve_task(self, i: int, targets: tuple, precision: str) -> tuple:
+        """Solve i-th task from solution of the previous frame, by sub-steps
+        if motion is large.
+        """
+        task, unknowns_values = self._tasks[i], self._solutions[i]
+        previous_targets = self._targets
+        if previous_targets is None:  # Motion starts from current values
+            current_values, optimizing_values = targets
+            previous_targets = (
+                current_values,
+                {name: current_values[name] for name in optimizing_values},
             )
-            equations = [self._equations[name] for name in equations_names]
+        n_steps = self._get_steps_number(task, previous_targets, targets)
+        count('continuation_substeps', n_steps - 1)
 
-            symbols = {
-                name: sym
-                for name, sym in self._symbols.items()
-                if name in subgraph.nodes()
-            }
+        try:
+            for fraction in np_linspace(0, 1, n_steps + 1)[1:]:
+                solution = task.solve(
+                    *self._interpolate(previous_targets, targets, fraction),
+                    unknowns_values,
+                    precision,
+                )
+                unknowns_values = solution[1]
+            return solution
+        except CannotSolveSystemError:
+            if n_steps == 1:
+                raise
+        # Target is solved directly, as if there were no sub-steps
+        count('continuation_failures')
+        return task.solve(*targets, self._solutions[i], precision)
 
-            desired_values = {
-                symbol_name: current_values[symbol_name]
-                for symbol_name in symbols
+    @staticmethod
+    def _get_steps_number(
+        task, previous_targets: tuple, targets: tuple
+    ) -> int:
+        """Number of sub-steps of motion of optimizing symbols of task: every
+        one is at most CONTINUATION_MAX_STEP of size of the smallest figure.
+        Size of figure is diagonal of its bounding box (length of segment),
+        points have no size.
+        """
+        previous_optimizing = previous_targets[1]
+        values, optimizing = targets
+        symbols_names = set(task.symbols_names)
+        motion = max(
+            (
+                abs(value - previous_optimizing.get(name, value))
+                for name, value in optimizing.items()
+                if name in symbols_names
+            ),
+            default=0,
+        )
+
+        # Figure name -> coordinate ('x' or 'y') -> values
+        figures_values = defaultdict(lambda: defaultdict(list))
+        for name in task.symbols_names:
+            figure_name, symbol_name = split_full_name(name)
+            figures_values[figure_name][symbol_name[0]].append(values[name])
+        sizes = [
+            np_linalg.norm([max(v) - min(v) for v in coordinates.values()])
+            for coordinates in figures_values.values()
+        ]
+        size = min((size for size in sizes if size > 0), default=0)
+        if size == 0:
+            return 1
+        n_steps = ceil(motion / (CONTINUATION_MAX_STEP * size))
+        return int(min(max(n_steps, 1), CONTINUATION_MAX_SUBSTEPS))
+
+    @staticmethod
+    def _interpolate(
+        previous_targets: tuple, targets: tuple, fraction: float
+    ) -> tuple:
+        """Desired values on the given fraction of way from previous ones."""
+        if fraction == 1:
+            return targets
+        return tuple(
+            {
+                name: previous.get(name, value)
+                + fraction * (value - previous.get(name, value))
+                for name, value in values.items()
             }
+            for previous, values in zip(previous_targets, targets)
+        )
+
+
+class Component:
+    """Connected component of system: symbols that are linked by equations.
+
+    Symbols and equations names are stored as keys of dicts (ordered sets).
+    Block decomposition of component (see Incidence.block_triangular) is
+    kept until equations are added to component.
+    """
+
+    def __init__(self, symbols: dict, equations: dict):
+        self.symbols = symbols
+        self.equations = equations
+        self.decomposition = None
+
+
+class ComponentsIndex:
+    """Connected components of system.
+
+    Components are merged by union-find when equations are added. Union-find
+    cannot split sets, so after removing of equations or symbols index is
+    invalidated and must be rebuilt.
+    """
+
+    def __init__(self):
+        self._union_find = UnionFind()
+        self._components = dict()  # root symbol name -> Component
+        self._is_valid = True
+
+    @property
+    def is_valid(self):
+        return self._is_valid
+
+    def invalidate(self):
+        self._is_valid = False
+
+    def rebuild(self, incidence: Incidence):
+        """Build index from scratch by connected components of incidence."""
+        self._union_find = UnionFind()
+        self._components = dict()
+        for symbols_names, equations_names in incidence.connected_components():
+            if not symbols_names:  # equations without symbols are not solved
+                continue
+            root = symbols_names[0]
+            for name in symbols_names:
+                self._union_find.add(name)
+                root = self._union_find.union(root, name)
+            self._components[root] = Component(
+                dict.fromkeys(symbols_names), dict.fromkeys(equations_names)
+            )
+        self._is_valid = True
+
+    def add_symbols(self, symbols_names):
+        for name in symbols_names:
+            self._union_find.add(name)
+            self._components[name] = Component({name: None}, {})
+
+    def add_equation(self, equation_name: str, eq_symbols: dict):
+        """Merge components of all symbols of equation."""
+        symbols_iter = iter(eq_symbols)
+        root = self._union_find.find(next(symbols_iter))
+        for symbol_name in symbols_iter:
+            other_root = self._union_find.find(symbol_name)
+            if other_root == root:
+                continue
+            new_root = self._union_find.union(root, other_root)
+            merged = self._components.pop(
+                other_root if new_root == root else root
+            )
+            component = self._components[new_root]
+            component.symbols.update(merged.symbols)
+            component.equations.update(merged.equations)
+            root = new_root
+        component = self._components[root]
+        component.equations[equation_name] = None
+        component.decomposition = None
+
+    def component_id(self, symbol_name: str) -> str:
+        """Return id of component that contains symbol."""
+        return self._union_find.find(symbol_name)
+
+    def __getitem__(self, component_id: str) -> Component:
+        return self._components[component_id]
+
+    def __iter__(self):
+        return iter(list(self._components.values()))
+
+    def __len__(self):
+        return len(self._components)
+
+
+class ComponentMotions:
+    """Motions of component that keep its restrictions satisfied, if all
+    figures of component form one rigid body: translations, and rotations
+    if restrictions are relative. Optimum of moving of such component is
+    the closest motion to desired values (see EquationsSystem._solve_motion).
+    """
+
+    def __init__(self, system: KernelSystem, points: list, invariances: tuple):
+        """
+        Parameters
+        ----------
+        system: KernelSystem
+            Equations of component (moved values are checked by them).
+        points: list[tuple(int, int)]
+            Indexes of symbols x and y of points of figures.
+        invariances: tuple[str]
+            ('translation',) or ('translation', 'rotation').
+        """
+        self.system = system
+        self.points = points
+        self.invariances = invariances
+        self.symbols_ids = {
+            name: i for i, name in enumerate(system.symbols_names)
+        }
+
+
+class MotionTask:
+    """Optimization task of rigid component that is solved in closed form
+    (see EquationsSystem._solve_motion). If moved values don't satisfy
+    restrictions, task is solved by Lagrange method, its task is prepared
+    when it's needed for the first time.
+    """
+
+    def __init__(
+        self, motions: ComponentMotions, create_task: callable, solver_key
+    ):
+        """
+        Parameters
+        ----------
+        motions: ComponentMotions
+            Motions of component.
+        create_task: callable
+            Function without arguments that prepares task of Lagrange method
+            (OptimizationTask or KernelTask).
+        solver_key: hashable
+            Key of component.
+        """
+        self.symbols_names = motions.system.symbols_names
+        self.solver_key = solver_key
+        self._motions = motions
+        self._create_task = create_task
+        self._task = None
+
+    def solve(
+        self,
+        desired_values: dict,
+        high_priority_desired_values: dict = empty_dict,
+        initial_values: np_ndarray = None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Solve task (see OptimizationTask.solve), unknowns values are None
+        if it's solved in closed form.
+        """
+        symbols_ids = self._motions.symbols_ids
+        solution = EquationsSystem._solve_motion(
+            self._motions,
+            desired_values,
+            {
+                name: value
+                for name, value in high_priority_desired_values.items()
+                if name in symbols_ids
+            },
+        )
+        if solution is not None:
+            return solution, None
+
+        if self._task is None:
+            self._task = self._create_task()
+        return self._task.solve(
+            desired_values,
+            high_priority_desired_values,
+            initial_values,
+            precision,
+        )
+
+
+class ComponentRank:
+    """Numeric rank of jacobian of component at values of its symbols:
+    independent rows of jacobian and orthonormal basis of their span.
+    Rows of new restriction are added incrementally (see extend), so they
+    are checked without factorization of jacobian of the whole component.
+    """
+
+    def __init__(
+        self,
+        symbols_names: list,
+        values: np_ndarray,
+        kernels: list,
+        restrictions_names: list,
+        rows_ids: list,
+        rows: np_ndarray,
+        residuals: np_ndarray,
+        basis: np_ndarray,
+    ):
+        """
+        Parameters
+        ----------
+        symbols_names: list[str]
+            Names of symbols (columns of rows).
+        values: np.ndarray
+            Values of symbols.
+        kernels: list[tuple(Restriction, list[str])]
+            Restrictions of component and names of their symbols.
+        restrictions_names: list[str]
+            Names of restrictions of kernels.
+        rows_ids: list[int]
+            Indexes of independent equations of kernels.
+        rows: np.ndarray
+            Rows of jacobian of independent equations at values.
+        residuals: np.ndarray
+            Residuals of independent equations at values.
+        basis: np.ndarray
+            Orthonormal basis of span of rows (in columns).
+        """
+        self.symbols_names = symbols_names
+        self.values = values
+        self.kernels = kernels
+        self.restrictions_names = restrictions_names
+        self.rows_ids = rows_ids
+        self.rows = rows
+        self.residuals = residuals
+        self.basis = basis
+
+    @classmethod
+    def from_kernels(
+        cls,
+        kernels: list,
+        restrictions_names: list,
+        symbols_names: list,
+        values: np_ndarray,
+    ):
+        """Rank of system of kernels (see KernelSystem) at values: rows are
+        chosen by QR decomposition with column pivoting of transposed
+        jacobian.
+        """
+        system = KernelSystem(kernels, symbols_names)
+        jacobian, residuals = system.jacobian(values), system.residuals(values)
+        if not len(jacobian):
+            return cls(
+                list(symbols_names),
+                values,
+                list(kernels),
+                list(restrictions_names),
+                [],
+                jacobian,
+                residuals,
+                np_zeros((len(symbols_names), 0)),
+            )
+        q, r, pivots = sp_qr(jacobian.T, mode='economic', pivoting=True)
+        diagonal = np_abs(r.diagonal())
+        rank = int((diagonal > RANK_TOLERANCE * diagonal.max(initial=1)).sum())
+        rows_ids = pivots[:rank].tolist()
+        return cls(
+            list(symbols_names),
+            values,
+            list(kernels),
+            list(restrictions_names),
+            rows_ids,
+            jacobian[rows_ids],
+            residuals[rows_ids],
+            q[:, :rank],
+        )
+
+    @classmethod
+    def merge(cls, ranks: list):
+        """Rank of union of components (with different symbols)."""
+        n_rows = [len(rank.rows) for rank in ranks]
+        n_symbols = [len(rank.symbols_names) for rank in ranks]
+        rows = np_zeros((sum(n_rows), sum(n_symbols)))
+        basis = np_zeros((sum(n_symbols), sum(n_rows)))
+        rows_ids = []
+        i = j = n_equations = 0
+        for rank, n, m in zip(ranks, n_rows, n_symbols):
+            rows[i : i + n, j : j + m] = rank.rows
+            basis[j : j + m, i : i + n] = rank.basis
+            rows_ids.extend(n_equations + k for k in rank.rows_ids)
+            i, j = i + n, j + m
+            n_equations += rank.n_equations
+        return cls(
+            [name for rank in ranks for name in rank.symbols_names],
+            np_concatenate([rank.values for rank in ranks]),
+            [kernel for rank in ranks for kernel in rank.kernels],
+            [name for rank in ranks for name in rank.restrictions_names],
+            rows_ids,
+            rows,
+            np_concatenate([rank.residuals for rank in ranks]),
+            basis,
+        )
+
+    @property
+    def n_equations(self) -> int:
+        return sum(restriction.n_equations for restriction, _ in self.kernels)
+
+    def perturbed(self):
+        """Rank at values near current ones that satisfy equations, if it's
+        greater than rank at current values (i.e. they are degenerate):
+        values are perturbed (see _perturbation) and projected back to
+        solutions by Gauss-Newton steps, so they are in general position if
+        they can be.
+
+        Returns
+        -------
+        rank: ComponentRank or None
+            None if rank isn't greater or projection isn't converged.
+        """
+        system = KernelSystem(self.kernels, self.symbols_names)
+        scale = 1 + np_abs(self.values).max(initial=0)
+        x = self.values + self._perturbation()
+        for _ in range(RANK_PROJECTION_ITERATIONS):
+            residuals, jacobian = system.residuals(x), system.jacobian(x)
+            if not (
+                np_isfinite(residuals).all() and np_isfinite(jacobian).all()
+            ):
+                return None
+            if np_abs(residuals).max(initial=0) <= FTOL * scale ** 2:
+                break
+            x = x - np_linalg.lstsq(jacobian, residuals, rcond=None)[0]
+        else:
+            return None
+        tolerance = RANK_TOLERANCE * max(np_abs(jacobian).max(initial=0), 1)
+        if np_linalg.matrix_rank(jacobian, tolerance) <= len(self.rows_ids):
+            return None
+        return ComponentRank.from_kernels(
+            self.kernels, self.restrictions_names, self.symbols_names, x
+        )
+
+    def is_degenerate(self, kernel: tuple) -> bool:
+        """Rows of restriction lose rank at values, e.g. fixed length of
+        zero length segment (then dependency on other rows says nothing):
+        rank is less than at perturbed values (see _perturbation), small
+        singular values are less than perturbation of them. Values are
+        degenerate also if jacobian isn't finite at them (e.g. angle of
+        zero length segment).
+        """
+        system = KernelSystem([kernel], self.symbols_names)
+        jacobian = system.jacobian(self.values)
+        if not (np_isfinite(jacobian).all() and np_isfinite(self.basis).all()):
+            return True
+        perturbed = system.jacobian(self.values + self._perturbation())
+        tolerance = RANK_PERTURBATION * np_abs(perturbed).max(initial=0)
+        return np_linalg.matrix_rank(jacobian, tolerance) < (
+            np_linalg.matrix_rank(perturbed, tolerance)
+        )
+
+    def _perturbation(self) -> np_ndarray:
+        """Random (with fixed seed) small perturbation of values."""
+        scale = 1 + np_abs(self.values).max(initial=0)
+        random = np_random.RandomState(RANK_PERTURBATION_SEED)
+        return (
+            RANK_PERTURBATION
+            * scale
+            * random.standard_normal(len(self.values))
+        )
+
+    def extend(self, restriction_name: str, kernel: tuple):
+        """Rank with equations of new restriction.
+
+        Raises
+        ------
+        RedundantRestrictionError, ConflictingRestrictionError
+            If an equation depends on other equations (see
+            _check_dependent).
+        """
+        system = KernelSystem([kernel], self.symbols_names)
+        result = ComponentRank(
+            self.symbols_names,
+            self.values,
+            self.kernels + [kernel],
+            self.restrictions_names + [restriction_name],
+            list(self.rows_ids),
+            self.rows,
+            self.residuals,
+            self.basis,
+        )
+        n_equations = self.n_equations
+        for i, (row, residual) in enumerate(
+            zip(system.jacobian(self.values), system.residuals(self.values))
+        ):
+            orthogonal = row
+            for _ in range(2):  # Reorthogonalization keeps basis orthonormal
+                orthogonal = orthogonal - result.basis.dot(
+                    result.basis.T.dot(orthogonal)
+                )
+            norm = np_linalg.norm(orthogonal)
+            if norm <= RANK_TOLERANCE * max(np_linalg.norm(row), 1):
+                result._check_dependent(n_equations + i, row, residual)
+                continue
+            result.basis = np_column_stack([result.basis, orthogonal / norm])
+            result.rows = np_vstack([result.rows, row])
+            result.residuals = np_concatenate([result.residuals, [residual]])
+            result.rows_ids.append(n_equations + i)
+        return result
+
+    def _check_dependent(self, row_id: int, row, residual: float):
+        """Check equation whose row of jacobian is a combination of rows.
+
+        Linearized equations are compatible if residual is the same
+        combination of residuals of rows. Otherwise (or if equation is
+        satisfied) the combination of equations is checked in second
+        order: its hessian on tangent space (null space of rows) shows if
+        equation can be satisfied by moving along solutions of other
+        equations (e.g. parallel segments with fixed lengths from right
+        angle) or it can't be changed by them (e.g. two fixed lengths of
+        one segment).
+
+        Raises
+        ------
+        RedundantRestrictionError, ConflictingRestrictionError
+            If equation is satisfied (or can't be satisfied) by other
+            equations.
+        """
+        coefficients = np_linalg.lstsq(self.rows.T, row, rcond=None)[0]
+        inconsistency = residual - coefficients.dot(self.residuals)
+        scale = 1 + np_abs(self.values).max(initial=0)
+        is_conflicting = abs(inconsistency) > FTOL * scale ** 2
+
+        multipliers = np_zeros(self.n_equations)
+        multipliers[self.rows_ids] = -coefficients
+        multipliers[row_id] = 1
+        hessian = KernelSystem(
+            self.kernels, self.symbols_names
+        ).lagrangian_hessian(self.values, multipliers)
+        tolerance = RANK_TOLERANCE * max(np_abs(hessian).max(initial=0), 1)
+        tangent = null_space(self.rows)
+        curvatures = np_linalg.eigvalsh(tangent.T.dot(hessian).dot(tangent))
+        curvatures = curvatures[np_abs(curvatures) > tolerance]
+        if is_conflicting:
+            if (curvatures * inconsistency < 0).any():
+                return
+        elif len(curvatures):
+            return
+
+        # Involved rows: rows of combination and rows that forbid second
+        # order changes of it (directions that change only one row)
+        involved = np_abs(coefficients) > RANK_TOLERANCE * np_abs(
+            coefficients
+        ).max(initial=0)
+        if len(self.rows):
+            directions = np_linalg.pinv(self.rows)
+            directions /= np_linalg.norm(directions, axis=0)
+            changes = hessian.dot(directions)
+            involved |= np_abs((directions * changes).sum(axis=0)) > tolerance
+            involved |= (
+                np_linalg.norm(tangent.T.dot(changes), axis=0) > tolerance
+            )
+
+        rows_restrictions = [
+            name
+            for name, (restriction, _) in zip(
+                self.restrictions_names, self.kernels
+            )
+            for _ in range(restriction.n_equations)
+        ]
+        restriction_name = rows_restrictions[row_id]
+        names = list(
+            dict.fromkeys(
+                rows_restrictions[self.rows_ids[i]]
+                for i in np_flatnonzero(involved)
+                if rows_restrictions[self.rows_ids[i]] != restriction_name
+            )
+        )
+        if is_conflicting:
+            raise ConflictingRestrictionError(
+                f'Restriction {restriction_name} conflicts with '
+                f'restrictions {names}.',
+                names,
+            )
+        raise RedundantRestrictionError(
+            f'Restriction {restriction_name} is redundant, it follows from '
+            f'restrictions {names}.',
+            names,
+        )
+
+
+class EquationsSystem:
+    @contract(
+        mode='str',
+        n_workers='int,>=0',
+        memoization_quantum='float | None',
+        initial_guess='str',
+        n_restarts='int,>=0',
+    )
+    def __init__(
+        self,
+        mode: str = 'symbolic',
+        n_workers: int = 0,
+        memoization_quantum: float = None,
+        initial_guess: str = 'zeros',
+        n_restarts: int = 0,
+    ):
+        """
+        Parameters
+        ----------
+        mode: str, optional, default 'symbolic'
+            Mode of solving of optimization tasks, one of SOLVER_MODES.
+        n_workers: int, optional, default 0
+            Number of processes to solve independent components of full
+            system in parallel (see PARALLEL_SOLVING_MIN_EQUATIONS) and of
+            threads to try restarts concurrently. If less than 2, components
+            and restarts are solved one by one.
+        memoization_quantum: float or None, optional, default None
+            If float, solutions of optimization tasks are memoized with this
+            quantum of values (see SolutionsMemo).
+        initial_guess: str, optional, default 'zeros'
+            Initial multipliers of Lagrange systems, one of
+            strategies.INITIAL_GUESSES.
+        n_restarts: int, optional, default 0
+            Number of seeded perturbed starts that are tried if solving from
+            current values failed (see strategies.MultiStart).
+        """
+        if mode not in SOLVER_MODES:
+            raise IncorrectParamValue(f'Incorrect mode {mode}.')
+        if initial_guess not in INITIAL_GUESSES:
+            raise IncorrectParamValue(
+                f'Incorrect initial guess {initial_guess}.'
+            )
+        self._mode = mode
+        self._n_workers = n_workers
+        self._initial_guess = initial_guess
+        self._n_restarts = n_restarts
+
+        self._symbols = dict()
+        self._equations = dict()
+
+        # Structure of system
+        self._figures_symbols = dict()  # figure name -> symbols names
+        self._restrictions_equations = dict()  # restr. name -> equations names
+        self._equations_symbols = dict()  # equation name -> symbols names
+        # restriction name -> (restriction, symbols names) for kernels
+        self._restrictions_kernels = dict()
+        self._incidence = None  # Incidence, built lazily
+        self._components = ComponentsIndex()
+
+        # (canonical system, symbols, parameters) -> CompiledSystem
+        self._compiled = LRUCache(COMPILED_CACHE_SIZE)
+        # Remembers successful strategies for (equations, symbols) of
+        # components
+        self._solver = self._create_solver()
+        # (equations, symbols) of block -> (inputs values, solution),
+        # see _solve_block
+        self._blocks_solutions = LRUCache(BLOCKS_CACHE_SIZE)
+        # (equations, symbols) of component -> ComponentMotions or None,
+        # see _get_motions
+        self._motions = LRUCache(BLOCKS_CACHE_SIZE)
+        # (equations, symbols) of component -> ComponentRank at the last
+        # checked values, see _check_restriction
+        self._ranks = LRUCache(BLOCKS_CACHE_SIZE)
+        self._memoization_quantum = memoization_quantum
+        self._solutions_memo = self._create_solutions_memo()
+
+    def __getstate__(self):
+        # Compiled functions cannot be pickled and it's cheaper to compile
+        # them again than to deepcopy them with every project state.
+        # Remembered strategies and solutions are not a part of state too.
+        state = self.__dict__.copy()
+        state.pop('_compiled')
+        state.pop('_solver')
+        state.pop('_blocks_solutions')
+        state.pop('_motions')
+        state.pop('_ranks')
+        state.pop('_solutions_memo')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compiled = LRUCache(COMPILED_CACHE_SIZE)
+        self._solver = self._create_solver()
+        self._blocks_solutions = LRUCache(BLOCKS_CACHE_SIZE)
+        self._motions = LRUCache(BLOCKS_CACHE_SIZE)
+        self._ranks = LRUCache(BLOCKS_CACHE_SIZE)
+        self._solutions_memo = self._create_solutions_memo()
+
+    def _create_solver(self) -> StrategySelector:
+        multi_start = None
+        if self._n_restarts:
+            multi_start = MultiStart(
+                self._n_restarts, n_workers=self._n_workers
+            )
+        return StrategySelector(
+            initial_guess=INITIAL_GUESSES[self._initial_guess],
+            multi_start=multi_start,
+        )
+
+    def _create_solutions_memo(self):
+        if self._memoization_quantum is None:
+            return None
+        return SolutionsMemo(self._memoization_quantum)
+
+    @property
+    def _figures_names(self):
+        return list(self._figures_symbols.keys())
+
+    @property
+    def _restrictions_names(self):
+        return list(self._restrictions_equations.keys())
+
+    @contract(figure_name='str', symbols_names='list(str)')
+    def add_figure_symbols(self, figure_name: str, symbols_names: list):
+        """
+        Add symbols for one figure.
+        Cannot add symbols for existing figure.
+
+        Parameters
+        ----------
+        figure_name: str
+            Name of figure.
+        symbols_names: list[str]
+            Names f symbols for figure.
+
+        Raises
+        ------
+        IncorrectParamValue: if given figure has already exist.
+        """
+        if figure_name in self._figures_symbols:
+            raise IncorrectParamValue(
+                f'Figure {figure_name} has already exist.'
+            )
+
+        symbols_names = [
+            compose_full_name(figure_name, sym) for sym in symbols_names
+        ]
+        new_symbols = {
+            name: Symbol(name) for name in symbols_names
+        }
+        self._symbols.update(new_symbols)
+        self._figures_symbols[figure_name] = symbols_names
+        self._incidence = None
+        self._components.add_symbols(symbols_names)
+
+    @contract(figure_name='str', symbol_name='str | None')
+    def get_symbols(self, figure_name: str, symbol_name: str = None):
+        """
+        Return symbols for one figure.
+
+        Parameters
+        ----------
+        figure_name: str
+            Name of figure.
+        symbol_name: str or None, optional, default None
+            If string, returns symbol with this name.
+            If None, returns dictionary with all symbols of given figure.
+
+        Returns
+        -------
+            symbols or symbol: dict(str -> sympy.Symbol) or sympy.Symbol
+
+        Raises
+        ------
+            IncorrectParamValue: if there is no such figure or if symbol name
+            is given, but such symbol for such figure does not exist.
+        """
+        if figure_name not in self._figures_symbols:
+            raise IncorrectParamValue(f'Figure {figure_name} does not exist.')
+
+        if symbol_name is not None:
+            symbol_name = compose_full_name(figure_name, symbol_name)
+            if symbol_name not in self._symbols:
+                raise IncorrectParamValue('No such symbol.')
+            return self._symbols[symbol_name]
+        else:
+            result = dict()
+            for name in self._figures_symbols[figure_name]:
+                result[split_full_name(name)[1]] = self._symbols[name]
+            return result
+
+    @contract(figure_name='str')
+    def remove_figure_symbols(self, figure_name: str):
+        """
+        Remove all symbols for given figure.
+
+        Parameters
+        ----------
+        figure_name: str
+            Name of figure.
+
+        Raises
+        -------
+        IncorrectParamValue: if there is no figure with such name.
+        """
+        if figure_name not in self._figures_symbols:
+            raise IncorrectParamValue(f'Figure {figure_name} does not exist.')
+
+        symbols_to_delete = self._figures_symbols.pop(figure_name)
+        for symbol_name in symbols_to_delete:
+            self._symbols.pop(symbol_name)
+        self._invalidate_compiled(symbols_to_delete)
+
+        # Equations that use these symbols (if they were not removed before)
+        # stay in system without deleted symbols.
+        for eq_symbols in self._equations_symbols.values():
+            for symbol_name in symbols_to_delete:
+                eq_symbols.pop(symbol_name, None)
+        self._incidence = None
+        self._components.invalidate()
+
+    @contract(
+        restriction_name='str',
+        equations='list',
+        figures_names='list(str) | None',
+        current_values='figures_values | None',
+    )
+    def add_restriction_equations(
+        self,
+        restriction_name: str,
+        equations: list,
+        restriction=None,
+        figures_names: list = None,
+        current_values: dict = None,
+    ):
+        """
+        Add equations for one restriction.
+
+        Parameters
+        ----------
+        restriction_name: str
+
+        equations: list[sympy.Eq]
+            List of equations.
+        restriction: Restriction instance or None, optional, default None
+            Restriction with numeric kernels of the same equations.
+            It's used in 'kernels' mode.
+        figures_names: list[str] or None, optional, default None
+            Names of figures of restriction (in order of its object types).
+            Must be given with restriction.
+        current_values: str -> (str -> number) or None, optional
+            Current values of variables: figure_name -> (symbol_name ->
+            value). If given, restriction is checked before adding, without
+            solving (see _check_restriction).
+
+        Raises
+        ------
+        IncorrectParamValue: if given restriction has already exist.
+        OverconstrainedError: if restriction is checked and its equations
+            depend on equations of existing restrictions (its subclasses
+            RedundantRestrictionError and ConflictingRestrictionError are
+            raised if it's known whether they are compatible).
+        """
+        if restriction_name in self._restrictions_equations:
+            raise IncorrectParamValue(
+                f'Restriction {restriction_name} has already exist.'
+            )
+
+        equations_names = [
+            compose_full_name(restriction_name, str(i))
+            for i in range(len(equations))
+        ]
+        equations_symbols = [
+            self._get_equation_symbols_names(eq) for eq in equations
+        ]
+        for eq, eq_symbols in zip(equations, equations_symbols):
+            if not eq_symbols:
+                raise RuntimeError(f'No symbols in equation {eq}.')
+        rank = None
+        if current_values is not None:
+            rank = self._check_restriction(
+                restriction_name,
+                equations_names,
+                equations_symbols,
+                restriction,
+                figures_names,
+                unroll_values_dict(current_values),
+            )
+        for name, eq_symbols in zip(equations_names, equations_symbols):
+            self._components.add_equation(name, eq_symbols)
+
+        new_equations = {
+            name: eq for name, eq in zip(equations_names, equations)
+        }
+        self._equations.update(new_equations)
+        self._equations_symbols.update(zip(equations_names, equations_symbols))
+        self._restrictions_equations[restriction_name] = equations_names
+        if restriction is not None:
+            self._restrictions_kernels[restriction_name] = (
+                restriction,
+                [
+                    name
+                    for figure_name in figures_names
+                    for name in self._figures_symbols[figure_name]
+                ],
+            )
+        self._incidence = None
+        self._invalidate_compiled(set().union(*equations_symbols))
+        if rank is not None:
+            components = self._get_components()
+            component = components[
+                components.component_id(next(iter(equations_symbols[0])))
+            ]
+            # Rank can contain symbols of figures that are not in equations
+            if len(rank.symbols_names) == len(component.symbols):
+                self._ranks.put(self._get_component_key(component), rank)
+
+    @contract(restriction_name='str')
+    def remove_restriction_equations(self, restriction_name: str):
+        """
+        Remove all equations for given restriction.
+
+        Parameters
+        ----------
+        restriction_name: str
+            Name of restriction.
+
+        Raises
+        -------
+        IncorrectParamValue: if there is no such restriction.
+        """
+
+        if restriction_name not in self._restrictions_equations:
+            raise IncorrectParamValue(
+                f'Restriction {restriction_name} does not exists.'
+            )
+
+        equations_to_delete = self._restrictions_equations.pop(
+            restriction_name
+        )
+        self._restrictions_kernels.pop(restriction_name, None)
+        symbols_names = set()
+        for equation_name in equations_to_delete:
+            self._equations.pop(equation_name)
+            symbols_names.update(self._equations_symbols.pop(equation_name))
+        self._invalidate_compiled(symbols_names)
+        self._incidence = None
+        self._components.invalidate()
+
+    @contract(current_values='figures_values', returns='figures_values')
+    def solve(self, current_values: dict) -> dict:
+        """Solve full system in a current state.
+
+        Parameters
+        ----------
+        current_values: str -> (str -> number)
+            Current values of variables: figure_name -> (symbol_name -> value).
+
+        Returns
+        ----------
+        new_values: str -> (str -> number)
+            New values of variables: figure_name -> (symbol_name -> value).
+        """
+
+        current_values = unroll_values_dict(current_values)
 
-            res = self._solve_system(equations, symbols, desired_values)
-            result.update(res)
+        components = [c for c in self._get_components() if c.equations]
+        n_equations = sum(len(c.equations) for c in components)
+        if (
+            self._n_workers > 1
+            and len(components) > 1
+            and n_equations >= PARALLEL_SOLVING_MIN_EQUATIONS
+        ):
+            result = self._solve_in_parallel(components, current_values)
+        else:
+            result = {}
+            for component in components:
+                desired_values = {
+                    symbol_name: current_values[symbol_name]
+                    for symbol_name in component.symbols
+                }
+                result.update(
+                    self._solve_component(component, desired_values)
+                )
 
         return roll_up_values_dict(result)
 
@@ -561,44 +1893,37 @@ class EquationsSystem:
 
         current_values = unroll_values_dict(current_values)
 
-        graph = self._graph.copy()
-        for i, equation in enumerate(new_equations):
-            name = compose_full_name(SPECIAL_NAME, str(i))
-            self._add_equation_to_graph(graph, equation, equation_name=name)
+        components = self._get_components()
+
+        # New equations can link several existing components
+        linked = UnionFind()
+        equations_ids = []
+        for equation in new_equations:
+            eq_symbols = self._get_equation_symbols_names(equation)
+            if not eq_symbols:
+                raise RuntimeError(f'No symbols in equation {equation}.')
+            ids = [components.component_id(name) for name in eq_symbols]
+            for component_id in ids:
+                linked.add(component_id)
+                linked.union(ids[0], component_id)
+            equations_ids.append(ids[0])
+
+        groups = defaultdict(list)  # root component id -> new equations
+        for equation, component_id in zip(new_equations, equations_ids):
+            groups[linked.find(component_id)].append(equation)
 
         result = {}
-        subgraphs = [
-            graph.subgraph(c).copy() for c in nx.connected_components(graph)
-        ]
-        for subgraph in subgraphs:
-            equations_in_subgraph_names = set(
-                [e[2]['equation_name'] for e in subgraph.edges(data=True)]
-            )
-
-            # Find equations in subgraph from new_equations
-            new_equations_in_subgraph_names = []
-            subgraph_equations = []
-            for name in equations_in_subgraph_names:
-                base_name, object_name = split_full_name(name)
-                if base_name == SPECIAL_NAME:
-                    new_equations_in_subgraph_names.append(name)
-                    subgraph_equations.append(new_equations[int(object_name)])
-
-            if not new_equations_in_subgraph_names:
-                continue
-
-            for name in new_equations_in_subgraph_names:
-                equations_in_subgraph_names.remove(name)
-
-            subgraph_equations.extend(
-                [self._equations[name] for name in equations_in_subgraph_names]
-            )
-
-            symbols = {
-                name: sym
-                for name, sym in self._symbols.items()
-                if name in subgraph.nodes()
-            }
+        for root, components_ids in linked.groups().items():
+            equations = list(groups[root])
+            symbols = dict()
+            for component_id in components_ids:
+                component = components[component_id]
+                equations.extend(
+                    self._equations[name] for name in component.equations
+                )
+                symbols.update(
+                    (name, self._symbols[name]) for name in component.symbols
+                )
 
             desired_values = {
                 symbol_name: current_values[symbol_name]
@@ -606,7 +1931,7 @@ class EquationsSystem:
             }
 
             result.update(
-                self._solve_system(subgraph_equations, symbols, desired_values)
+                self._solve_system(equations, symbols, desired_values)
             )
 
         return roll_up_values_dict(result)
@@ -614,10 +1939,14 @@ class EquationsSystem:
     @contract(
         optimizing_values='figures_values',
         current_values='figures_values',
+        precision='str',
         returns='figures_values',
     )
     def solve_optimization_task(
-        self, optimizing_values: dict, current_values: dict
+        self,
+        optimizing_values: dict,
+        current_values: dict,
+        precision: str = 'polish',
     ) -> dict:
         """Solve subsystem with new equation.
 
@@ -628,6 +1957,9 @@ class EquationsSystem:
             figure_name -> (symbol_name -> value).
         current_values: str -> (str -> number)
             Current values of variables: figure_name -> (symbol_name -> value).
+        precision: str, optional, default 'polish'
+            Name of precision of numeric solving (see strategies.PRECISIONS):
+            'interactive' is cheaper, 'polish' is exact.
 
         Returns
         ----------
@@ -638,47 +1970,516 @@ class EquationsSystem:
         optimizing_values = unroll_values_dict(optimizing_values)
         current_values = unroll_values_dict(current_values)
 
+        # Only components that contain optimizing symbols are solved
+        components = self._get_components()
         result = dict()
-        subgraphs = [
-            self._graph.subgraph(c).copy()
-            for c in nx.connected_components(self._graph)
-        ]
-        for subgraph in subgraphs:
-            optimizing_values_in_subgraph = {
-                symbol_name: value
-                for symbol_name, value in optimizing_values.items()
-                if symbol_name in subgraph.nodes()
+        for component_id, names in self._group_by_components(
+            optimizing_values
+        ).items():
+            component = components[component_id]
+            desired_values = {
+                symbol_name: current_values[symbol_name]
+                for symbol_name in component.symbols
             }
+            values = {name: optimizing_values[name] for name in names}
+
+            # Rigid components are moved in closed form
+            motions = self._get_motions(component)
+            if motions is not None:
+                res = self._solve_motion(motions, desired_values, values)
+                if res is not None:
+                    result.update(res)
+                    continue
+
+            def solve_task():
+                task = self._create_task(component, names)
+                return task.solve(desired_values, values, precision=precision)
+
+            # Memoized solutions are found before preparation of task
+            if self._solutions_memo is None:
+                res, _ = solve_task()
+            else:
+                res, _ = self._solutions_memo.solve(
+                    self._get_component_key(component),
+                    list(component.symbols),
+                    solve_task,
+                    desired_values,
+                    values,
+                    precision,
+                )
+            result.update(res)
 
-            if optimizing_values_in_subgraph:
-                symbols = {
-                    name: sym
-                    for name, sym in self._symbols.items()
-                    if name in subgraph.nodes()
-                }
-                desired_values = {
-                    symbol_name: current_values[symbol_name]
-                    for symbol_name in symbols
+        return roll_up_values_dict(result)
+
+    @contract(optimizing_symbols='dict(str: list(str))')
+    def create_drag_session(self, optimizing_symbols: dict) -> DragSession:
+        """Prepare optimization tasks for figure moving.
+
+        Parameters
+        ----------
+        optimizing_symbols: str -> list(str)
+            Names of symbols that will have desired values during moving:
+            figure_name -> symbols names.
+
+        Returns
+        ----------
+        drag_session: DragSession
+            Session that solves frames of moving.
+        """
+        names = [
+            compose_full_name(figure_name, symbol_name)
+            for figure_name, symbols_names in optimizing_symbols.items()
+            for symbol_name in symbols_names
+        ]
+
+        components = self._get_components()
+        tasks = []
+        for component_id, hp_names in self._group_by_components(names).items():
+            component = components[component_id]
+            # Rigid components are moved in closed form
+            motions = self._get_motions(component)
+            if motions is None:
+                tasks.append(self._create_task(component, hp_names))
+            else:
+                tasks.append(
+                    MotionTask(
+                        motions,
+                        partial(self._create_task, component, hp_names),
+                        self._get_component_key(component),
+                    )
+                )
+        return DragSession(tasks, self._solutions_memo)
+
+    def _create_task(self, component: Component, high_priority_names: list):
+        """Prepare optimization task for component: with kernels in
+        'kernels' mode (if all restrictions of component have kernels),
+        symbolic otherwise.
+        """
+        solver_key = self._get_component_key(component)
+
+        kernel_system = self._get_kernel_system(component)
+        if kernel_system is not None:
+            return KernelTask(
+                kernel_system, high_priority_names, self._solver, solver_key
+            )
+
+        symbols = {name: self._symbols[name] for name in component.symbols}
+        equations = [self._equations[name] for name in component.equations]
+        return self._prepare_optimization_task(
+            equations, symbols, high_priority_names, solver_key
+        )
+
+    @staticmethod
+    def _solve_motion(
+        motions: ComponentMotions,
+        desired_values: dict,
+        high_priority_desired_values: dict,
+    ):
+        """Optimization task of rigid component in closed form: the motion
+        (see ComponentMotions) that minimizes weighted squared distance to
+        desired values, i.e. translation of weighted center of points to
+        center of desired values (and rotation of weighted Procrustes
+        problem). It's the same optimum that is found by Lagrange method,
+        because other values don't satisfy restrictions.
+
+        Returns
+        -------
+        solution: dict (str -> float) or None
+            Values of all symbols of component. None if x and y of a point
+            have different weights or moved values don't satisfy
+            restrictions (e.g. they weren't satisfied at current values).
+        """
+        names = motions.system.symbols_names
+        current = np_array([desired_values[name] for name in names])
+        target = current.copy()
+        weights = np_ones(len(target))
+        for name, value in high_priority_desired_values.items():
+            i = motions.symbols_ids[name]
+            target[i] = value
+            weights[i] = HIGH_PRIORITY_WEIGHT
+
+        xs, ys = np_array(motions.points).T
+        w = weights[xs]
+        if (w != weights[ys]).any():
+            return None
+        w = w / w.sum()
+        center_x, center_y = w.dot(current[xs]), w.dot(current[ys])
+        target_x, target_y = w.dot(target[xs]), w.dot(target[ys])
+        dx, dy = current[xs] - center_x, current[ys] - center_y
+        if 'rotation' in motions.invariances:
+            tx, ty = target[xs] - target_x, target[ys] - target_y
+            angle = np_arctan2(
+                w.dot(dx * ty - dy * tx), w.dot(dx * tx + dy * ty)
+            )
+            c, s = np_cos(angle), np_sin(angle)
+            dx, dy = c * dx - s * dy, s * dx + c * dy
+
+        x = np_zeros(len(current))
+        x[xs], x[ys] = target_x + dx, target_y + dy
+        scale = 1 + np_abs(x).max(initial=0)
+        residuals = motions.system.residuals(x)
+        if np_abs(residuals).max(initial=0) > FTOL * scale ** 2:
+            return None
+        count('closed_form_motions')
+        return dict(zip(names, x.tolist()))
+
+    def _solve_in_parallel(self, components: list, values: dict) -> dict:
+        """Solve components in pool of processes: components are split to
+        chunks with close numbers of equations, every process solves
+        subsystem of its chunk.
+        """
+        chunks = [[] for _ in range(self._n_workers)]
+        loads = [0] * self._n_workers
+        for component in sorted(
+            components, key=lambda c: len(c.equations), reverse=True
+        ):
+            i = loads.index(min(loads))
+            chunks[i].append(component)
+            loads[i] += len(component.equations)
+
+        executor = get_executor(self._n_workers)
+        futures = []
+        for chunk in chunks:
+            if chunk:
+                subsystem = self._get_subsystem(chunk)
+                chunk_values = {
+                    name: values[name] for name in subsystem._symbols
                 }
-                # desired_values.update(optimizing_values_in_subgraph)
+                blocks_solutions = self._blocks_solutions.items(
+                    lambda key: key[0][0] in subsystem._equations
+                )
+                futures.append(
+                    executor.submit(
+                        _solve_components,
+                        subsystem,
+                        chunk_values,
+                        blocks_solutions,
+                    )
+                )
 
-                equations_names = set(
-                    [
-                        edge[2]['equation_name']
-                        for edge in subgraph.edges(data=True)
-                    ]
+        result = dict()
+        for future in futures:
+            res, blocks_solutions = future.result()
+            result.update(res)
+            for key, value in blocks_solutions:
+                self._blocks_solutions.put(key, value)
+        return result
+
+    def _get_subsystem(self, components: list):
+        """System with symbols and equations of components only (without
+        figures and restrictions, it can be solved, but not changed) and
+        with the same settings of solving.
+        """
+        subsystem = EquationsSystem(
+            self._mode,
+            self._n_workers,
+            self._memoization_quantum,
+            self._initial_guess,
+            self._n_restarts,
+        )
+        for component in components:
+            subsystem._symbols.update(
+                (name, self._symbols[name]) for name in component.symbols
+            )
+            for name in component.equations:
+                subsystem._equations[name] = self._equations[name]
+                subsystem._equations_symbols[name] = dict(
+                    self._equations_symbols[name]
                 )
-                equations = [self._equations[name] for name in equations_names]
+        subsystem._components.invalidate()
+        return subsystem
 
-                res = self._solve_optimization_task(
-                    equations,
-                    symbols,
-                    desired_values,
-                    optimizing_values_in_subgraph,
+    def _solve_component(
+        self, component: Component, desired_values: dict
+    ) -> dict:
+        """Solve component by blocks (see Incidence.block_triangular):
+        square blocks one by one, then underdetermined part with found
+        values of symbols of blocks. Components with overdetermined part are
+        solved at once.
+        """
+        if not component.equations:
+            return {}
+
+        if component.decomposition is None:
+            incidence = self._get_component_incidence(component)
+            component.decomposition = incidence.block_triangular()
+        underdetermined, blocks, overdetermined = component.decomposition
+        if overdetermined[1]:
+            equations = [self._equations[name] for name in component.equations]
+            symbols = {name: self._symbols[name] for name in component.symbols}
+            return self._solve_system(equations, symbols, desired_values)
+
+        values = dict(desired_values)
+        for symbols_names, equations_names in blocks + [underdetermined]:
+            if equations_names:
+                values.update(
+                    self._solve_block(symbols_names, equations_names, values)
                 )
-                result.update(res)
+        return values
 
-        return roll_up_values_dict(result)
+    def _solve_block(
+        self, symbols_names: list, equations_names: list, values: dict
+    ) -> dict:
+        """Solve equations for symbols, values of other symbols of equations
+        (inputs) are known. Solution is reused while inputs are the same and
+        values of symbols are not changed since.
+        """
+        symbols = {name: self._symbols[name] for name in symbols_names}
+        inputs = {
+            name: values[name]
+            for equation_name in equations_names
+            for name in self._equations_symbols[equation_name]
+            if name not in symbols
+        }
+        current_values = {name: values[name] for name in symbols}
+
+        key = (tuple(equations_names), tuple(symbols_names))
+        if self._blocks_solutions.get(key) == (inputs, current_values):
+            return current_values
+
+        substitution = {
+            self._symbols[name]: sympy_Float(value)
+            for name, value in inputs.items()
+        }
+        system = []
+        for name in equations_names:
+            equation = self._equations[name]
+            system.append(
+                Eq(
+                    equation.lhs.xreplace(substitution),
+                    equation.rhs.xreplace(substitution),
+                    evaluate=False,
+                )
+            )
+        solution = self._solve_system(system, symbols, current_values)
+        self._blocks_solutions.put(key, (inputs, solution))
+        return solution
+
+    def _check_restriction(
+        self,
+        restriction_name: str,
+        equations_names: list,
+        equations_symbols: list,
+        restriction,
+        figures_names: list,
+        values: dict,
+    ):
+        """Check new restriction by rank analysis of components that it
+        links: numeric (rank of jacobian at current values, see
+        ComponentRank) or structural if some restrictions have no kernels
+        (see _check_structure). Ranks are remembered for components, so
+        restrictions that are added to unchanged figures are checked
+        incrementally. Restrictions that are dependent only at degenerate
+        values (e.g. with zero length segments) are not rejected, they are
+        checked by solving.
+
+        Returns
+        -------
+        rank: ComponentRank or None
+            Rank with new restriction, None if some restrictions have no
+            kernels or values are degenerate.
+
+        Raises
+        ------
+        OverconstrainedError
+            If restriction is dependent.
+        """
+        symbols_names = set().union(*equations_symbols)
+        kernel = None
+        if restriction is not None:
+            kernel = (
+                restriction,
+                [
+                    name
+                    for figure_name in figures_names
+                    for name in self._figures_symbols[figure_name]
+                ],
+            )
+            symbols_names.update(kernel[1])
+        components = self._get_components()
+        components_ids = dict.fromkeys(
+            components.component_id(name) for name in sorted(symbols_names)
+        )
+        linked = [components[component_id] for component_id in components_ids]
+
+        # Structure is checked only if numeric rank can't be found: it
+        # doesn't show if dependency is only at current values
+        kernels = [self._get_kernels(component) for component in linked]
+        if kernel is None or any(k is None for k in kernels):
+            self._check_structure(
+                restriction_name, equations_names, equations_symbols, linked
+            )
+            return None
+
+        ranks = []
+        for component, component_kernels in zip(linked, kernels):
+            key = self._get_component_key(component)
+            rank = self._ranks.get(key)
+            if rank is not None:
+                rank_values = np_array(
+                    [values[name] for name in rank.symbols_names]
+                )
+                if (rank_values == rank.values).all():
+                    ranks.append(rank)
+                    continue
+            names = list(component.symbols)
+            restrictions_names = list(
+                dict.fromkeys(
+                    split_full_name(name)[0] for name in component.equations
+                )
+            )
+            rank = ComponentRank.from_kernels(
+                component_kernels,
+                restrictions_names,
+                names,
+                np_array([values[name] for name in names]),
+            )
+            self._ranks.put(key, rank)
+            ranks.append(rank)
+
+        rank = ranks[0] if len(ranks) == 1 else ComponentRank.merge(ranks)
+        # Rows can be dependent only at degenerate values: restriction is
+        # solved if its own rows lose rank there, or if it's independent
+        # near them when rows of component lose rank
+        if not rank.is_degenerate(kernel):
+            try:
+                return rank.extend(restriction_name, kernel)
+            except OverconstrainedError:
+                perturbed = rank.perturbed()
+                if perturbed is None:
+                    raise
+                perturbed.extend(restriction_name, kernel)
+        count('degenerate_ranks')
+        return None
+
+    def _check_structure(
+        self,
+        restriction_name: str,
+        equations_names: list,
+        equations_symbols: list,
+        linked: list,
+    ):
+        """Check that equations of new restriction and of linked components
+        are not overdetermined structurally: some of them use less symbols
+        than their number (see Incidence.block_triangular).
+
+        Raises
+        ------
+        OverconstrainedError
+            If restriction overdetermines system.
+        """
+        equations = dict(zip(equations_names, equations_symbols))
+        for component in linked:
+            equations.update(
+                (name, self._equations_symbols[name])
+                for name in component.equations
+            )
+        incidence = Incidence(
+            equations, [name for c in linked for name in c.symbols]
+        )
+        overdetermined = incidence.block_triangular()[2][1]
+        if overdetermined:
+            names = list(
+                dict.fromkeys(
+                    split_full_name(name)[0]
+                    for name in overdetermined
+                    if name not in equations_names
+                )
+            )
+            raise OverconstrainedError(
+                f'Restriction {restriction_name} overdetermines system with '
+                f'restrictions {names}.',
+                names,
+            )
+
+    @staticmethod
+    def _get_component_key(component: Component) -> tuple:
+        """Key of structure of component: (equations, symbols)."""
+        return tuple(component.equations), tuple(component.symbols)
+
+    def _get_kernel_system(self, component: Component):
+        """KernelSystem of component or None if it can't be built."""
+        if self._mode != 'kernels':
+            return None
+
+        kernels = self._get_kernels(component)
+        if kernels is None:
+            return None
+        return KernelSystem(kernels, list(component.symbols))
+
+    def _get_kernels(self, component: Component):
+        """Kernels of restrictions of component (see
+        add_restriction_equations) or None if some of them are missing.
+        """
+        restrictions_names = dict.fromkeys(
+            split_full_name(name)[0] for name in component.equations
+        )
+        kernels = []
+        for restriction_name in restrictions_names:
+            kernel = self._restrictions_kernels.get(restriction_name)
+            if kernel is None:
+                return None
+            if not all(name in component.symbols for name in kernel[1]):
+                return None  # Figure was removed
+            kernels.append(kernel)
+        return kernels
+
+    def _get_motions(self, component: Component):
+        """Motions of component (see ComponentMotions), they are classified
+        once for structure of component. None if component can be deformed
+        (or isn't invariant to motions).
+        """
+        key = self._get_component_key(component)
+        if key not in self._motions:
+            self._motions.put(key, self._classify_motions(component))
+        return self._motions.get(key)
+
+    def _classify_motions(self, component: Component):
+        if not component.equations:
+            return None
+        kernels = self._get_kernels(component)
+        if kernels is None:
+            return None
+
+        # Components with parts of figures (e.g. y of horizontal segment)
+        # are not bodies
+        figures_names = dict.fromkeys(
+            split_full_name(name)[0] for name in component.symbols
+        )
+        figures_symbols = [
+            self._figures_symbols.get(figure_name, ())
+            for figure_name in figures_names
+        ]
+        if sum(map(len, figures_symbols)) != len(component.symbols):
+            return None
+
+        # Pure translation isn't the optimum of deformable components, even
+        # without fixed figures (e.g. center of segment is dragged): other
+        # figures are closer to current values if component is deformed,
+        # so such components are solved by Lagrange method.
+        system = KernelSystem(kernels, list(component.symbols))
+        invariances = system.invariances()
+        if not invariances or not system.is_rigid():
+            return None
+
+        symbols_ids = {name: i for i, name in enumerate(component.symbols)}
+        points = [
+            (symbols_ids[names[i]], symbols_ids[names[i + 1]])
+            for names in figures_symbols
+            for i in range(0, len(names), 2)
+        ]
+        return ComponentMotions(system, points, invariances)
+
+    def _group_by_components(self, symbols_names) -> dict:
+        """Group names of symbols by components: component_id -> names.
+        Unknown names are ignored.
+        """
+        components = self._get_components()
+        result = defaultdict(list)
+        for name in symbols_names:
+            if name in self._symbols:
+                result[components.component_id(name)].append(name)
+        return result
 
     @contract(
         system='list',
@@ -718,6 +2519,31 @@ class EquationsSystem:
             desired_values.keys()
         ), 'symbols.keys() must be equal to best_values.keys()'
 
+        task = self._prepare_optimization_task(
+            system, symbols, list(high_priority_desired_values)
+        )
+        result, _ = task.solve(desired_values, high_priority_desired_values)
+        return result
+
+    @contract(
+        system='list[N]',
+        symbols='dict[M], M >= N',
+        high_priority_names='list(str)',
+    )
+    def _prepare_optimization_task(
+        self,
+        system: list,
+        symbols: dict,
+        high_priority_names: list = (),
+        solver_key=None,
+    ) -> OptimizationTask:
+        """Simplify system, build equations of Lagrange method and compile
+        them. Desired values are parameters of compiled system, so task can
+        be solved with any desired values. Successful numeric strategy is
+        remembered for solver_key.
+        """
+        symbols_names = list(symbols)
+
         # Simplify by substitutions
         substitutor = Substitutor()
         try:
@@ -744,17 +2570,40 @@ class EquationsSystem:
         # Subs will be {x1: x2}.
         # If not change we will optimize x2 -> 1, x1 = x2 = 1.
         # So we change hpdv to {'x2': 5}.
-        for k, v in substitutor.subs.items():
-            if str(k) in high_priority_desired_values:
-                cur_v = high_priority_desired_values.pop(str(k))
-                high_priority_desired_values[str(v)] = cur_v
+        subs = substitutor.subs
+        high_priority_names = {
+            name: str(subs.get(name, name)) for name in high_priority_names
+        }
+        high_priority_unknowns = set(high_priority_names.values())
+
+        # Linear systems are solved directly, without compilation
+        unknowns_names = [name for name in symbols_names if name not in subs]
+        linear_system = self._system_to_linear(
+            system, [symbols[name] for name in unknowns_names]
+        )
+        if linear_system is not None:
+            return OptimizationTask(
+                symbols_names,
+                unknowns_names,
+                0,
+                [],
+                high_priority_names,
+                substitutor,
+                linear_system=linear_system,
+            )
 
         # ############################################################
         if len(system) == len(symbols):  # Optimization
-            result = self._solve_square_system(system, symbols, desired_values)
-            result = {name: value for name, value in result.items()}
-            result = substitutor.restore(result)
-            return result
+            return self._compile_task(
+                system,
+                symbols_names,
+                dict(symbols),
+                0,
+                {},
+                high_priority_names,
+                substitutor,
+                solver_key,
+            )
 
         lambdas_names = [
             compose_full_name('lambda', str(i)) for i in range(len(system))
@@ -773,99 +2622,232 @@ class EquationsSystem:
         if loss_part2 == 0:  # System is empty -> no lambdas
             loss_part2 = sympy_Integer(0)  # To be possible to diff
 
-        for sub_sym in substitutor.subs.keys():
+        symbols = dict(symbols)
+        for sub_sym in subs.keys():
             symbols.pop(sub_sym)
 
+        # Desired values are parameters of compiled system, so the same
+        # system can be reused with other values (e.g. while moving figure).
+        parameters = dict()  # parameter -> (symbol name, is high priority)
         with measure('get equations with diff'):
             equations = [0] * len(symbols)
             for i, (name, sym) in enumerate(symbols.items()):
-                if name in high_priority_desired_values:
+                param = Symbol(compose_full_name(PARAMETER_NAME, name))
+                if name in high_priority_unknowns:
+                    parameters[param] = (name, True)
                     eq = Eq(
-                        1000 * (sym - high_priority_desired_values[name])
+                        HIGH_PRIORITY_WEIGHT * (sym - param)
                         + loss_part2.diff(sym),
                         0,
                     )
                 else:
-                    eq = Eq(
-                        sym - desired_values[name] + loss_part2.diff(sym), 0
-                    )
+                    parameters[param] = (name, False)
+                    eq = Eq(sym - param + loss_part2.diff(sym), 0)
                 equations[i] = eq
 
         equations.extend(system)
         lambdas_dict.update(symbols)
-        result = self._solve_square_system(
-            equations, lambdas_dict, desired_values
+        return self._compile_task(
+            equations,
+            symbols_names,
+            lambdas_dict,
+            len(lambdas_names),
+            parameters,
+            high_priority_names,
+            substitutor,
+            solver_key,
         )
 
-        result = {
-            name: value
-            for name, value in result.items()
-            if split_full_name(name)[0] != 'lambda'
-        }
-        result = substitutor.restore(result)
-        return result
-
-    @classmethod
-    @contract(
-        system='list[N]',
-        symbols_dict='dict[N]',
-        desired_values='dict | None',
-        returns='dict[N]',
-    )
-    def _solve_square_system(
-        cls, system: list, symbols_dict: dict, desired_values: dict = None
-    ):
-        """Desired values only for setting initial conditions."""
-
-        if len(symbols_dict) != len(system):
+    def _compile_task(
+        self,
+        system: list,
+        symbols_names: list,
+        unknowns: dict,
+        n_multipliers: int,
+        parameters: dict,
+        high_priority_names: dict,
+        substitutor: Substitutor,
+        solver_key=None,
+    ) -> OptimizationTask:
+        """Compile square system (unknowns are multipliers, then symbols)."""
+        if len(unknowns) != len(system):
             raise RuntimeError(
-                f'len(symbols_dict) = {len(symbols_dict)},'
+                f'len(unknowns) = {len(unknowns)},'
                 f'len(simplified_system) = {len(system)}'
             )
 
-        symbols_names = list(symbols_dict.keys())
-        symbols_list = [symbols_dict[name] for name in symbols_names]
-
+        compiled = None
         if system:
-            # Prepare
-            canonical_system = cls._system_to_canonical(system)
-            system_function = cls._system_to_function(
-                canonical_system, symbols_list
+            key = self._get_compiled_key(
+                self._system_to_canonical(system),
+                list(unknowns.values()),
+                list(parameters.keys()),
             )
+            compiled = self._compile(key)
+
+        return OptimizationTask(
+            symbols_names,
+            list(unknowns.keys()),
+            n_multipliers,
+            list(parameters.values()),
+            high_priority_names,
+            substitutor,
+            compiled,
+            self._solver,
+            solver_key,
+        )
 
-            # Prepare ini values
-            ini_values = list(random.random(len(symbols_list)))
-            if desired_values is not None:
-                for i, symbol_name in enumerate(symbols_names):
-                    if symbol_name in desired_values:
-                        ini_values[i] = desired_values[symbol_name]
-
-            # Solve
-            solution = cls._solve_numeric(
-                system_function, np_array(ini_values)
+    @staticmethod
+    @contract(system='list[N,>0]', symbols='list[N]', parameters='list')
+    def _get_compiled_key(system: list, symbols: list, parameters: list):
+        """Key that identifies structure of canonical system."""
+        return tuple(system), tuple(symbols), tuple(parameters)
+
+    def _compile(self, key: tuple) -> CompiledSystem:
+        """Return compiled canonical system, use cache if it's possible."""
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            system, symbols, parameters = map(list, key)
+            function = self._system_to_function(system, symbols, parameters)
+            if len(symbols) < SPARSE_SOLVER_MIN_SIZE:
+                compiled = CompiledSystem(
+                    function,
+                    self._system_to_jacobian(system, symbols, parameters),
+                )
+            else:
+                sparsity = self._system_to_sparsity(system, symbols)
+                compiled = CompiledSystem(function, sparsity=sparsity)
+            self._compiled.put(key, compiled)
+        return compiled
+
+    def _invalidate_compiled(self, symbols_names):
+        """Remove from cache compiled systems (and remembered strategies,
+        solutions of blocks, motions and ranks of components and memoized
+        solutions) that use given symbols.
+        """
+        symbols_names = set(symbols_names)
+
+        def condition(key):
+            return any(str(sym) in symbols_names for sym in key[1])
+
+        self._compiled.remove_if(condition)
+        self._solver.forget(condition)
+        self._blocks_solutions.remove_if(condition)
+        self._motions.remove_if(condition)
+        self._ranks.remove_if(condition)
+        if self._solutions_memo is not None:
+            self._solutions_memo.forget(condition)
+
+    def _get_incidence(self) -> Incidence:
+        """Return incidence of system, build it if it's necessary (to
+        rebuild index of components after removing of equations).
+        """
+        if self._incidence is None:
+            self._incidence = Incidence(
+                self._equations_symbols, list(self._symbols)
             )
-        else:
-            solution = []
+        return self._incidence
+
+    def _get_component_incidence(self, component: Component) -> Incidence:
+        """Incidence of component, it's built from its equations only, so
+        incidence of full system isn't rebuilt after every change.
+        """
+        return Incidence(
+            {
+                name: self._equations_symbols[name]
+                for name in component.equations
+            },
+            list(component.symbols),
+        )
 
-        # Add values for symbols that were substituted
-        solution_dict = dict(zip(symbols_names, solution))
+    def _get_components(self) -> ComponentsIndex:
+        """Return index of components, rebuild it if it's necessary."""
+        if not self._components.is_valid:
+            self._components.rebuild(self._get_incidence())
+        return self._components
 
-        return solution_dict
+    def _get_equation_symbols_names(self, equation: Eq) -> dict:
+        """Names of system symbols that are used in equation (keys of dict,
+        sorted, so order of symbols of components doesn't depend on hashes
+        of strings).
+        """
+        return dict.fromkeys(
+            sorted(
+                name
+                for name in map(str, equation.free_symbols)
+                if name in self._symbols
+            )
+        )
 
     @staticmethod
     @measured
-    @contract(system='list[N,>0]', symbols='list[N]')
-    def _system_to_function(system: list, symbols: list):
-        functions = [lambdify(symbols, f, dummify=False) for f in system]
+    @contract(system='list[N,>0]', symbols='list[N]', parameters='list')
+    def _system_to_function(system: list, symbols: list, parameters: list):
+        # One function for all system, common subexpressions (e.g. lengths
+        # of segments used in several equations) are evaluated once.
+        function = lambdify(
+            symbols + parameters, system, cse=True, dummify=False
+        )
 
-        def fun(x):
+        def fun(x, params=()):
             if len(x) != len(symbols):
                 raise ValueError
-            res = np_array([f(*x) for f in functions])
-            return res
+            return np_array(function(*x, *params), dtype=float)
 
         return fun
 
+    @staticmethod
+    @measured
+    @contract(system='list[N,>0]', symbols='list[N]', parameters='list')
+    def _system_to_jacobian(system: list, symbols: list, parameters: list):
+        jacobian = Matrix(system).jacobian(symbols)
+        function = lambdify(
+            symbols + parameters, jacobian, cse=True, dummify=False
+        )
+
+        def jac(x, params=()):
+            if len(x) != len(symbols):
+                raise ValueError
+            return np_array(function(*x, *params), dtype=float)
+
+        return jac
+
+    @staticmethod
+    @measured
+    @contract(system='list[N,>0]', symbols='list[N]')
+    def _system_to_sparsity(system: list, symbols: list):
+        """Sparsity structure of jacobian of canonical system."""
+        symbols_names = [str(sym) for sym in symbols]
+        incidence = Incidence(
+            {
+                str(i): {str(sym) for sym in f.free_symbols}
+                for i, f in enumerate(system)
+            },
+            symbols_names,
+        )
+        return incidence.matrix
+
+    @staticmethod
+    @measured
+    @contract(system='list', symbols='list')
+    def _system_to_linear(system: list, symbols: list):
+        """Matrix A and vector b (np.ndarray) of system A x = b if system is
+        linear, None otherwise.
+        """
+        if not system:
+            return np_zeros((0, len(symbols))), np_zeros(0)
+        try:
+            matrix, rhs = linear_eq_to_matrix(system, symbols)
+        except NonlinearError:
+            return None
+        try:
+            return (
+                np_array(matrix, dtype=float).reshape(len(system), -1),
+                np_array(rhs, dtype=float).ravel(),
+            )
+        except TypeError:  # Coefficients contain other symbols
+            return None
+
     @staticmethod
     @contract(system='list')
     def _system_to_canonical(system: list):
@@ -873,40 +2855,356 @@ class EquationsSystem:
 
     @staticmethod
     @measured
-    def _solve_numeric(fun: callable, init: np_ndarray) -> np_ndarray:
-        result = sp_optimize.fsolve(fun, init, full_output=True, maxfev=1000)
-        if result[2] != 1:
-            raise CannotSolveSystemError(result[3])
-        res = result[0]
-
-        # result = sp_optimize.root(fun, init)
-        # if not result.success:
-        #     raise CannotSolveSystemError(result.message)
-        # res = result.x
-
-        return res
-
-    def _update_graph(self):
-        graph = nx.MultiGraph()
-        graph.add_nodes_from(self._symbols)
-        for eq_name, eq in self._equations.items():
-            self._add_equation_to_graph(graph, eq, equation_name=eq_name)
-        self._graph = graph
+    def _solve_closest(
+        system: KernelSystem,
+        target: np_ndarray,
+        weights: np_ndarray,
+        init: np_ndarray,
+        init_multipliers: np_ndarray = None,
+        sparse: bool = None,
+        solver: StrategySelector = None,
+        solver_key=None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Find solution of system that is the closest to target:
+        minimize sum(weights * (x - target) ** 2) / 2 with system = 0.
+
+        Linear systems are solved directly. Rigid clusters of figures of
+        dense systems are moved as bodies (see
+        KernelSystem.rigid_parameterization). Linear equations of dense
+        mixed systems are eliminated: nonlinear equations are solved in
+        coordinates of subspace of solutions of linear ones. So Newton
+        iterations are smaller. Other systems are solved by Lagrange method
+        (see _solve_lagrange). Large systems (see SPARSE_SOLVER_MIN_SIZE) are
+        sparse, if sparse is None.
+
+        Returns
+        -------
+        x: np.ndarray
+            Values of symbols.
+        multipliers: np.ndarray
+            Lagrange multipliers.
+        """
+        n_equations, n_symbols = system.shape
+        if sparse is None:
+            sparse = n_equations + n_symbols >= SPARSE_SOLVER_MIN_SIZE
+            rigid = True
+        else:
+            rigid = not sparse
+
+        linear, nonlinear = system.split()
+        if nonlinear.n_equations == 0:
+            matrix, rhs = linear.linear_form(sparse)
+            return EquationsSystem._solve_linear_closest(
+                matrix, rhs, weights, target, sparse=sparse
+            )
+        if rigid:
+            # Reduced system is dense, but it's small
+            reduced, y = EquationsSystem._get_rigid_system(system, init)
+            if (
+                reduced is not None
+                and sum(reduced.shape) < SPARSE_SOLVER_MIN_SIZE
+            ):
+                x, reduced_multipliers = EquationsSystem._solve_reduced(
+                    reduced, y, target, weights, solver, solver_key, precision
+                )
+                # Multipliers are used only as initial values of the next
+                # solving, so removed equations of clusters get zeros.
+                removed = [r for c in system.rigid_clusters() for r in c.rows]
+                kept = sorted(set(range(n_equations)) - set(removed))
+                multipliers = np_zeros(n_equations)
+                multipliers[kept] = reduced_multipliers
+                return x, multipliers
+        if linear.n_equations == 0 or sparse:
+            return EquationsSystem._solve_lagrange(
+                system,
+                target,
+                weights,
+                init,
+                init_multipliers,
+                sparse,
+                solver,
+                solver_key,
+                precision,
+            )
+
+        origin, basis = linear.solutions_subspace()
+        matrix, rhs = linear.linear_form()
+        EquationsSystem._check_linear_solution(matrix, origin, rhs)
+        if basis.shape[1] == 0:  # Linear equations define all symbols
+            x = origin
+            scale = 1 + np_abs(x).max(initial=0)
+            if np_abs(nonlinear.residuals(x)).max() > FTOL * scale ** 2:
+                raise SystemIncompatibleError(
+                    'Linear and nonlinear equations are incompatible.'
+                )
+        else:
+            reduced = ReducedKernelSystem(nonlinear, origin, basis)
+            x, _ = EquationsSystem._solve_reduced(
+                reduced,
+                reduced.to_reduced(np_array(init, dtype=float)),
+                target,
+                weights,
+                solver,
+                solver_key,
+                precision,
+            )
+        # Multipliers of all equations at solution: W (x - target) + J.T l = 0
+        multipliers = np_linalg.lstsq(
+            system.jacobian(x).T, -weights * (x - target), rcond=None
+        )[0]
+        return x, multipliers
+
+    @staticmethod
+    def _solve_reduced(
+        reduced: ReducedKernelSystem,
+        init: np_ndarray,
+        target: np_ndarray,
+        weights: np_ndarray,
+        solver: StrategySelector = None,
+        solver_key=None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Find solution of reduced system that is the closest to target
+        (in full coordinates) starting from coordinates init.
+
+        Returns
+        -------
+        x: np.ndarray
+            Values of all symbols.
+        multipliers: np.ndarray
+            Lagrange multipliers of equations of reduced system.
+        """
+        # Objective in coordinates y (x = origin + basis y) is
+        # (y - reduced_target).T M (y - reduced_target) / 2 + const.
+        basis = reduced.basis
+        weights_matrix = (basis.T * weights).dot(basis)
+        reduced_target = np_linalg.solve(
+            weights_matrix, (basis.T * weights).dot(target - reduced.origin)
+        )
+        y, multipliers = EquationsSystem._solve_lagrange(
+            reduced,
+            reduced_target,
+            weights_matrix,
+            init,
+            solver=solver,
+            solver_key=solver_key,
+            precision=precision,
+        )
+        return reduced.to_full(y), multipliers
+
+    @staticmethod
+    def _get_rigid_system(system: KernelSystem, x: np_ndarray) -> tuple:
+        """System in coordinates of rigid clusters and coordinates of x (see
+        KernelSystem.rigid_parameterization) or (None, None) if there are no
+        clusters or restrictions of clusters are not satisfied at x.
+        """
+        clusters = system.rigid_clusters()
+        if not clusters:
+            return None, None
+        x = np_array(x, dtype=float)
+        rows = [
+            row
+            for cluster in clusters
+            for row in cluster.rows + cluster.anchor_rows
+        ]
+        scale = 1 + np_abs(x).max(initial=0)
+        if np_abs(system.residuals(x)[rows]).max() > FTOL * scale ** 2:
+            return None, None
+        return system.rigid_parameterization(x)
+
+    @staticmethod
+    def _solve_lagrange(
+        system,
+        target: np_ndarray,
+        weights: np_ndarray,
+        init: np_ndarray,
+        init_multipliers: np_ndarray = None,
+        sparse: bool = False,
+        solver: StrategySelector = None,
+        solver_key=None,
+        precision: str = 'polish',
+    ) -> tuple:
+        """Solve Lagrange system W (x - target) + J.T lambda = 0,
+        residuals = 0 by strategies, its jacobian is
+        | W + L  J.T |
+        | J      0   |
+        where L = sum(lambda_j * H_j) (hessians of equations).
+        Weights are diagonal of W or W (dense only).
+        """
+        n_equations, n_symbols = system.shape
+        if sparse:
+            get_jacobian = system.sparse_jacobian
+            get_hessian = system.sparse_lagrangian_hessian
+            weights_matrix = sp_diags(weights)
+            # Regularization for redundant equations, it doesn't move root
+            regularization = sp_diags(
+                [-SPARSE_SOLVER_REGULARIZATION] * n_equations
+            )
+        else:
+            get_jacobian = system.jacobian
+            get_hessian = system.lagrangian_hessian
+            weights_matrix = np_diag(weights) if weights.ndim == 1 else weights
+            zeros = np_zeros((n_equations, n_equations))
+
+        def fun(z, params=()):
+            x, multipliers = z[:n_symbols], z[n_symbols:]
+            return np_concatenate(
+                [
+                    weights_matrix.dot(x - target)
+                    + get_jacobian(x).T.dot(multipliers),
+                    system.residuals(x),
+                ]
+            )
+
+        def jac(z, params=()):
+            x, multipliers = z[:n_symbols], z[n_symbols:]
+            jacobian = get_jacobian(x)
+            hessian = get_hessian(x, multipliers)
+            if sparse:
+                return sp_bmat(
+                    [
+                        [weights_matrix + hessian, jacobian.T],
+                        [jacobian, regularization],
+                    ],
+                    format='csc',
+                )
+            return np_block(
+                [[weights_matrix + hessian, jacobian.T], [jacobian, zeros]]
+            )
+
+        solver = solver or StrategySelector()
+        x = np_array(init, dtype=float)
+        if init_multipliers is None:
+            multipliers = solver.initial_guess.multipliers(
+                n_equations,
+                weights_matrix.dot(x - target),
+                get_jacobian(x).T,
+            )
+        else:
+            multipliers = np_array(init_multipliers, dtype=float)
+
+        problem = RootProblem(
+            fun, jac=jac, is_sparse=sparse, scaled=slice(n_symbols)
+        )
+        z = EquationsSystem._solve_problem(
+            problem,
+            np_concatenate([x, multipliers]),
+            solver,
+            solver_key,
+            precision,
+        )
+        return z[:n_symbols], z[n_symbols:]
 
     @staticmethod
-    @contract(equation_name='str | None', returns='None')
-    def _add_equation_to_graph(graph, equation, equation_name=None):
-        """Add edges to graph inplace."""
-        eq_symbols = get_equation_symbols_names(equation, list(graph.nodes))
-
-        if len(eq_symbols) == 0:
-            raise RuntimeError(f'No symbols in equation {equation}.')
-        elif len(eq_symbols) == 1:  # Equation like `Eq(figure1_x1, 5)`
-            new_node_name = compose_full_name(GROWTH_NODE_NAME, equation_name)
-            graph.add_node(new_node_name)
-            graph.add_edge(
-                new_node_name, eq_symbols.pop(), equation_name=equation_name
+    @measured
+    def _solve_linear_closest(
+        matrix,
+        rhs: np_ndarray,
+        weights: np_ndarray,
+        target: np_ndarray,
+        allow_redundant: bool = True,
+        sparse: bool = False,
+    ) -> tuple:
+        """Find solution of linear system A x = b that is the closest to
+        target: minimize sum(weights * (x - target) ** 2) / 2.
+
+        Lagrange system is linear:
+        | W  A.T | | x      |   | W target |
+        | A  0   | | lambda | = | b        |
+        it's solved directly by least squares (dense) or LU factorization
+        with regularization (sparse).
+
+        Parameters
+        ----------
+        matrix: np.ndarray or scipy.sparse matrix
+            A (n_equations x n_symbols), sparse if sparse is True.
+        rhs: np.ndarray
+            b.
+        weights: np.ndarray
+            Diagonal of W.
+        target: np.ndarray
+            Desired values of symbols.
+        allow_redundant: bool, optional, default True
+            If False, dependent equations (e.g. [x + y = 1, 2x + 2y = 2])
+            are not allowed.
+        sparse: bool, optional, default False
+            Solve with sparse matrices.
+
+        Returns
+        -------
+        x: np.ndarray
+            Values of symbols.
+        multipliers: np.ndarray
+            Lagrange multipliers.
+
+        Raises
+        ------
+        SystemIncompatibleError: if system has no solutions.
+        SystemOverfittedError: if equations are dependent and it's not
+        allowed.
+        """
+        n_equations, n_symbols = matrix.shape
+        kkt_rhs = np_concatenate([weights * target, rhs])
+        if sparse:
+            kkt = sp_bmat(
+                [
+                    [sp_diags(weights), matrix.T],
+                    [
+                        matrix,
+                        sp_diags(
+                            [-SPARSE_SOLVER_REGULARIZATION] * n_equations
+                        ),
+                    ],
+                ],
+                format='csc',
             )
+            try:
+                z = splu(kkt).solve(kkt_rhs)
+            except RuntimeError as e:  # Singular matrix
+                raise CannotSolveSystemError(str(e))
         else:
-            for u, v in combinations(eq_symbols, 2):
-                graph.add_edge(u, v, equation_name=equation_name)
+            kkt = np_block(
+                [
+                    [np_diag(weights), matrix.T],
+                    [matrix, np_zeros((n_equations, n_equations))],
+                ]
+            )
+            z = np_linalg.lstsq(kkt, kkt_rhs, rcond=None)[0]
+
+        x = z[:n_symbols]
+        EquationsSystem._check_linear_solution(matrix, x, rhs)
+        if (
+            not allow_redundant
+            and n_equations
+            and np_linalg.matrix_rank(matrix) < n_equations
+        ):
+            raise SystemOverfittedError('Linear equations are dependent.')
+        return x, z[n_symbols:]
+
+    @staticmethod
+    def _check_linear_solution(matrix, x: np_ndarray, rhs: np_ndarray):
+        """Raise SystemIncompatibleError if x is not solution of A x = b."""
+        if len(rhs) == 0:
+            return
+        scale = 1 + np_abs(x).max(initial=0) + np_abs(rhs).max()
+        if np_abs(matrix.dot(x) - rhs).max() > FTOL * scale:
+            raise SystemIncompatibleError('Linear equations are incompatible.')
+
+    @staticmethod
+    @measured
+    def _solve_problem(
+        problem: RootProblem,
+        init: np_ndarray,
+        solver: StrategySelector,
+        solver_key=None,
+        precision: str = 'polish',
+    ) -> np_ndarray:
+        if precision not in PRECISIONS:
+            raise IncorrectParamValue(f'Incorrect precision {precision}.')
+        try:
+            return solver.solve(
+                problem, init, solver_key, PRECISIONS[precision]
+            )
+        except StrategyFailed as e:
+            raise CannotSolveSystemError(str(e))
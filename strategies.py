@@ -0,0 +1,618 @@
+"""Module with strategies of numeric solving of square systems of
+equations and their selection.
+"""
+
+from numpy import (
+    abs as np_abs,
+    array as np_array,
+    zeros as np_zeros,
+    isfinite as np_isfinite,
+    linalg as np_linalg,
+    random as np_random,
+)
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from threading import Event
+import scipy.optimize as sp_optimize
+from scipy.sparse import issparse, csc_matrix
+from scipy.sparse.linalg import splu, lsqr as sp_lsqr
+
+from utils import LRUCache
+
+FTOL = 1e-8  # Max residual relative to squared scale of solution
+STRATEGIES_MEMORY_SIZE = 128
+MULTI_START_SEED = 0
+
+_executors = dict()  # number of workers -> ThreadPoolExecutor
+
+
+class StrategyFailed(Exception):
+    pass
+
+
+class Precision:
+    """Tolerances and budget of evaluations of solving."""
+
+    def __init__(
+        self,
+        name: str,
+        ftol: float,
+        xtol: float = None,
+        max_evaluations: int = None,
+        accept_unfinished: bool = False,
+    ):
+        """
+        Parameters
+        ----------
+        name: str
+        ftol: float
+            Max residual relative to squared scale of solution.
+        xtol: float or None, optional, default None
+            Iterations are stopped when steps are less than xtol relative to
+            scale of solution. If None, defaults of strategies are used.
+        max_evaluations: int or None, optional, default None
+            Max number of evaluations of function (or jacobian, for methods
+            that evaluate it on every iteration). If None, limits of
+            strategies are used.
+        accept_unfinished: bool, optional, default False
+            If True, solution is accepted when budget is exhausted, but
+            residuals satisfy ftol.
+        """
+        self.name = name
+        self.ftol = ftol
+        self.xtol = xtol
+        self.max_evaluations = max_evaluations
+        self.accept_unfinished = accept_unfinished
+
+    def limit(self, max_evaluations: int) -> int:
+        """Budget of strategy with its own limit."""
+        if self.max_evaluations is None:
+            return max_evaluations
+        return min(max_evaluations, self.max_evaluations)
+
+
+# Frames of moving of figures don't need exact roots, final positions do
+PRECISIONS = {
+    'interactive': Precision('interactive', 1e-6, 1e-6, 20, True),
+    'polish': Precision('polish', FTOL),
+}
+POLISH = PRECISIONS['polish']
+
+
+class RootProblem:
+    """Square system fun(x, params) = 0.
+
+    Jacobian is a function jac(x, params) that returns np.ndarray or
+    scipy.sparse matrix or None (then it's estimated by finite differences,
+    with groups of structurally independent columns if sparsity is given).
+    """
+
+    def __init__(
+        self,
+        fun: callable,
+        params=(),
+        jac: callable = None,
+        sparsity=None,
+        is_sparse: bool = False,
+        scaled: slice = slice(None),
+    ):
+        """
+        Parameters
+        ----------
+        fun: callable
+            Residuals of system.
+        params: np.ndarray or tuple, optional, default ()
+            Parameters of fun and jac.
+        jac: callable or None, optional, default None
+            Jacobian of system.
+        sparsity: scipy.sparse matrix or None, optional, default None
+            Structure of jacobian.
+        is_sparse: bool, optional, default False
+            True if jac returns sparse matrices.
+        scaled: slice, optional, default slice(None)
+            Part of x that defines scale of tolerances (e.g. coordinates of
+            figures without Lagrange multipliers, that can be large).
+        """
+        self.fun = fun
+        self.params = params
+        self.jac = jac
+        self.sparsity = sparsity
+        self.is_sparse = is_sparse or sparsity is not None
+        self.scaled = scaled
+
+    def scale(self, x) -> float:
+        """Scale of solution for relative tolerances."""
+        return 1 + np_abs(x[self.scaled]).max(initial=0)
+
+
+class StoppableProblem(RootProblem):
+    """Problem whose evaluations raise StrategyFailed after stop(), so
+    strategies that solve it in other threads are finished early.
+    """
+
+    def __init__(self, problem: RootProblem):
+        self._stopped = Event()
+        super().__init__(
+            self._checked(problem.fun),
+            problem.params,
+            problem.jac and self._checked(problem.jac),
+            problem.sparsity,
+            problem.is_sparse,
+            problem.scaled,
+        )
+
+    def stop(self):
+        self._stopped.set()
+
+    def _checked(self, function: callable) -> callable:
+        def checked_function(x, params=()):
+            if self._stopped.is_set():
+                raise StrategyFailed('Solving is stopped.')
+            return function(x, params)
+
+        return checked_function
+
+
+class SolverStrategy:
+    """Base class of strategies."""
+
+    name = None
+
+    def is_applicable(self, problem: RootProblem) -> bool:
+        return True
+
+    def solve(self, problem: RootProblem, init, precision: Precision = POLISH):
+        """Find root of problem starting from init.
+
+        Raises
+        ------
+        StrategyFailed: if root is not found.
+        """
+        x = self._solve(problem, np_array(init, dtype=float), precision)
+        self._check_root(problem, x, precision)
+        return x
+
+    def _solve(self, problem: RootProblem, init, precision: Precision):
+        raise NotImplementedError
+
+    @staticmethod
+    def _check_root(problem: RootProblem, x, precision: Precision = POLISH):
+        residuals = problem.fun(x, problem.params)
+        scale = problem.scale(x)
+        if not (
+            np_isfinite(x).all()
+            and np_abs(residuals).max(initial=0)
+            <= precision.ftol * scale ** 2
+        ):
+            raise StrategyFailed('Solution is not a root of system.')
+
+    def _check_unfinished(
+        self, problem: RootProblem, x, precision: Precision, message: str
+    ):
+        """Budget of method is exhausted, but x is still accepted if it's a
+        root with given precision (and precision accepts it).
+        """
+        if not precision.accept_unfinished:
+            raise StrategyFailed(message)
+        try:
+            self._check_root(problem, x, precision)
+        except StrategyFailed:
+            raise StrategyFailed(message)
+
+
+class HybrStrategy(SolverStrategy):
+    """Powell hybrid method (MINPACK hybrd/hybrj), dense."""
+
+    name = 'hybr'
+
+    def __init__(self, maxfev: int = 1000):
+        self.maxfev = maxfev
+
+    def is_applicable(self, problem: RootProblem) -> bool:
+        return not problem.is_sparse
+
+    def _solve(self, problem: RootProblem, init, precision: Precision):
+        kwargs = {}
+        if precision.xtol is not None:
+            kwargs['xtol'] = precision.xtol
+        result = sp_optimize.fsolve(
+            problem.fun,
+            init,
+            args=(problem.params,),
+            fprime=problem.jac,
+            full_output=True,
+            maxfev=precision.limit(self.maxfev),
+            **kwargs,
+        )
+        if result[2] == 2:  # Number of calls reached maxfev
+            self._check_unfinished(problem, result[0], precision, result[3])
+        elif result[2] != 1:
+            raise StrategyFailed(result[3])
+        return result[0]
+
+
+class LeastSquaresStrategy(SolverStrategy):
+    """Minimization of sum of squared residuals: Levenberg-Marquardt
+    (MINPACK, dense) or trust region reflective (supports sparse jacobians).
+    """
+
+    def __init__(self, method: str):
+        self.method = method
+        self.name = method
+
+    def is_applicable(self, problem: RootProblem) -> bool:
+        return self.method != 'lm' or not problem.is_sparse
+
+    def _solve(self, problem: RootProblem, init, precision: Precision):
+        kwargs = {}
+        if problem.jac is not None:
+            kwargs['jac'] = problem.jac
+        elif problem.sparsity is not None:
+            kwargs['jac_sparsity'] = problem.sparsity
+        if precision.xtol is not None:
+            kwargs['xtol'] = precision.xtol
+        try:
+            result = sp_optimize.least_squares(
+                problem.fun,
+                init,
+                args=(problem.params,),
+                method=self.method,
+                x_scale='jac',
+                max_nfev=precision.max_evaluations,
+                **kwargs,
+            )
+        except ValueError as e:  # Residuals are not finite at init
+            raise StrategyFailed(str(e))
+        if result.status == 0:  # Budget is exhausted
+            self._check_unfinished(
+                problem, result.x, precision, result.message
+            )
+        elif result.status < 0:
+            raise StrategyFailed(result.message)
+        return result.x
+
+
+class DampedNewtonStrategy(SolverStrategy):
+    """Newton method with backtracking line search by norm of residuals.
+    Steps are found with least squares (dense) or LU factorization (sparse),
+    so jacobian is required.
+    """
+
+    name = 'damped_newton'
+
+    def __init__(
+        self,
+        max_iterations: int = 100,
+        xtol: float = 1e-10,
+        min_damping: float = 1e-4,
+    ):
+        self.max_iterations = max_iterations
+        self.xtol = xtol
+        self.min_damping = min_damping
+
+    def is_applicable(self, problem: RootProblem) -> bool:
+        return problem.jac is not None
+
+    def _solve(self, problem: RootProblem, init, precision: Precision):
+        fun, jac, params = problem.fun, problem.jac, problem.params
+        max_iterations = precision.limit(self.max_iterations)
+        xtol = max(self.xtol, precision.xtol or 0)
+
+        x = init
+        residuals = fun(x, params)
+        norm = np_linalg.norm(residuals)
+        for _ in range(max_iterations):
+            jacobian = jac(x, params)
+            values = jacobian.data if issparse(jacobian) else jacobian
+            if not (
+                np_isfinite(residuals).all() and np_isfinite(values).all()
+            ):
+                raise StrategyFailed('Residuals or jacobian are not finite.')
+            step = self._newton_step(jacobian, -residuals)
+
+            # Halve step while residuals don't decrease
+            damping = 1.0
+            while True:
+                new_x = x + damping * step
+                new_residuals = fun(new_x, params)
+                new_norm = np_linalg.norm(new_residuals)
+                if new_norm < norm or damping <= self.min_damping:
+                    break
+                damping /= 2
+
+            x, residuals, norm = new_x, new_residuals, new_norm
+            scale = problem.scale(x)
+            if np_abs(damping * step).max(initial=0) <= xtol * scale:
+                return x
+
+        self._check_unfinished(
+            problem,
+            x,
+            precision,
+            f'The iteration is not converged in {max_iterations} '
+            f'iterations.',
+        )
+        return x
+
+    @staticmethod
+    def _newton_step(jacobian, rhs):
+        if issparse(jacobian):
+            try:
+                return splu(csc_matrix(jacobian)).solve(rhs)
+            except RuntimeError as e:  # Singular matrix
+                raise StrategyFailed(str(e))
+        try:
+            return np_linalg.lstsq(jacobian, rhs, rcond=None)[0]
+        except np_linalg.LinAlgError as e:  # SVD is not converged
+            raise StrategyFailed(str(e))
+
+
+class InitialGuess:
+    """Base class of strategies of initial values of Lagrange multipliers
+    (symbols start from desired values, i.e. from current geometry).
+    """
+
+    name = None
+
+    def multipliers(self, n_multipliers: int, gradient, jacobian_t=None):
+        """Initial multipliers.
+
+        Parameters
+        ----------
+        n_multipliers: int
+        gradient: np.ndarray
+            Gradient of objective at initial values of symbols.
+        jacobian_t: np.ndarray or scipy.sparse matrix or None, optional
+            Transposed jacobian of equations at initial values of symbols
+            (n_symbols x n_multipliers) or None if it's unknown.
+        """
+        raise NotImplementedError
+
+
+class ZerosGuess(InitialGuess):
+    """Multipliers are zeros."""
+
+    name = 'zeros'
+
+    def multipliers(self, n_multipliers: int, gradient, jacobian_t=None):
+        return np_zeros(n_multipliers)
+
+
+class LeastSquaresGuess(InitialGuess):
+    """Multipliers are least squares solution of stationarity condition
+    gradient + J.T lambda = 0 (zeros if jacobian is unknown).
+    """
+
+    name = 'least_squares'
+
+    def multipliers(self, n_multipliers: int, gradient, jacobian_t=None):
+        if jacobian_t is None or n_multipliers == 0:
+            return np_zeros(n_multipliers)
+        if issparse(jacobian_t):
+            return sp_lsqr(jacobian_t, -gradient)[0]
+        return np_linalg.lstsq(jacobian_t, -gradient, rcond=None)[0]
+
+
+INITIAL_GUESSES = {
+    'zeros': ZerosGuess(),
+    'least_squares': LeastSquaresGuess(),
+}
+
+
+def get_executor(n_workers: int) -> ThreadPoolExecutor:
+    """Pool of threads shared by all selectors."""
+    executor = _executors.get(n_workers)
+    if executor is None:
+        executor = ThreadPoolExecutor(n_workers)
+        _executors[n_workers] = executor
+    return executor
+
+
+class MultiStart:
+    """Seeded perturbations of initial values to restart solving after
+    failure, so restarts are reproducible.
+
+    Starts can be solved concurrently by pool of threads (problems hold
+    compiled functions and closures that can't be sent to processes).
+    Strategies call residuals and jacobians in Python on every evaluation,
+    so threads mostly hold GIL and don't solve faster than one: they help
+    only when early starts fail slowly and later ones succeed quickly
+    (see experiments/benchmark_restarts.py).
+    """
+
+    def __init__(
+        self,
+        n_starts: int,
+        scale: float = 0.1,
+        seed: int = MULTI_START_SEED,
+        n_workers: int = 0,
+    ):
+        """
+        Parameters
+        ----------
+        n_starts: int
+            Number of perturbed starts.
+        scale: float, optional, default 0.1
+            Standard deviation of perturbations relative to scale of initial
+            values.
+        seed: int, optional, default MULTI_START_SEED
+            Seed of generator of perturbations (the same for every call of
+            starts).
+        n_workers: int, optional, default 0
+            Number of threads to solve starts concurrently. If less than 2,
+            starts are solved one by one (then solving is deterministic).
+        """
+        self.n_starts = n_starts
+        self.scale = scale
+        self.seed = seed
+        self.n_workers = n_workers
+
+    def starts(self, init):
+        """Perturbed copies of init."""
+        init = np_array(init, dtype=float)
+        random_state = np_random.RandomState(self.seed)
+        scale = self.scale * (1 + np_abs(init).max(initial=0))
+        for _ in range(self.n_starts):
+            yield init + random_state.normal(0, scale, init.shape)
+
+
+class StrategySelector:
+    """Chooses strategies for problem by its structure and tries them one
+    by one until success. Strategy that succeeded is remembered for a key
+    (e.g. component) and is tried first next time.
+    """
+
+    def __init__(
+        self,
+        strategies: list = None,
+        initial_guess: InitialGuess = None,
+        multi_start: MultiStart = None,
+    ):
+        """
+        Parameters
+        ----------
+        strategies: list[SolverStrategy] or None, optional, default None
+            Strategies in order of preference. If None, default ones.
+        initial_guess: InitialGuess or None, optional, default None
+            Initial multipliers of Lagrange systems. If None, zeros.
+        multi_start: MultiStart or None, optional, default None
+            Perturbed starts that are tried if all strategies failed from
+            initial values. If None, there are no restarts.
+        """
+        if strategies is None:
+            strategies = [
+                HybrStrategy(),
+                DampedNewtonStrategy(),
+                LeastSquaresStrategy('lm'),
+                LeastSquaresStrategy('trf'),
+            ]
+        self.strategies = strategies
+        self.initial_guess = initial_guess or INITIAL_GUESSES['zeros']
+        self.multi_start = multi_start
+        self._memory = LRUCache(STRATEGIES_MEMORY_SIZE)  # key -> name
+
+    def select(self, problem: RootProblem, key=None) -> list:
+        """Applicable strategies in order of trying."""
+        strategies = [s for s in self.strategies if s.is_applicable(problem)]
+        if problem.is_sparse:
+            # Sparse jacobians are factored faster than dense
+            strategies.sort(key=lambda s: s.name != 'damped_newton')
+
+        successful = self._memory.get(key) if key is not None else None
+        strategies.sort(key=lambda s: s.name != successful)
+        return strategies
+
+    def solve(
+        self,
+        problem: RootProblem,
+        init,
+        key=None,
+        precision: Precision = POLISH,
+    ):
+        """Find root of problem. If all strategies failed, they are tried
+        from perturbed starts (see MultiStart).
+
+        Raises
+        ------
+        StrategyFailed: if all strategies failed.
+        """
+        try:
+            x, name = self._solve_from(problem, init, key, precision)
+        except StrategyFailed as e:
+            if self.multi_start is None:
+                raise
+            if self.multi_start.n_workers < 2:
+                x, name = self._restart(problem, init, key, precision, e)
+            else:
+                x, name = self._restart_concurrently(
+                    problem, init, key, precision, e
+                )
+        if key is not None:
+            self._memory.put(key, name)
+        return x
+
+    def _solve_from(
+        self, problem: RootProblem, init, key, precision: Precision
+    ) -> tuple:
+        """Try strategies one by one from init.
+
+        Returns
+        -------
+        x: np.ndarray
+            Root of problem.
+        name: str
+            Name of strategy that found it.
+        """
+        errors = []
+        for strategy in self.select(problem, key):
+            try:
+                return strategy.solve(problem, init, precision), strategy.name
+            except StrategyFailed as e:
+                errors.append(f'{strategy.name}: {e}')
+        raise StrategyFailed('; '.join(errors) or 'No applicable strategies.')
+
+    def _restart(
+        self,
+        problem: RootProblem,
+        init,
+        key,
+        precision: Precision,
+        error: StrategyFailed,
+    ) -> tuple:
+        """Try perturbed starts one by one, error is raised if all of them
+        failed.
+        """
+        for start in self.multi_start.starts(init):
+            try:
+                return self._solve_from(problem, start, key, precision)
+            except StrategyFailed:
+                pass
+        raise error
+
+    def _restart_concurrently(
+        self,
+        problem: RootProblem,
+        init,
+        key,
+        precision: Precision,
+        error: StrategyFailed,
+    ) -> tuple:
+        """Solve perturbed starts in pool of threads. On the first success
+        starts that are not started yet are cancelled and running ones are
+        stopped on their next evaluation (see StoppableProblem), so pool is
+        free when restarts are returned. The closest to init of found
+        solutions is chosen.
+        """
+        stoppable = StoppableProblem(problem)
+        executor = get_executor(self.multi_start.n_workers)
+        futures = [
+            executor.submit(self._solve_from, stoppable, start, key, precision)
+            for start in self.multi_start.starts(init)
+        ]
+        for future in as_completed(futures):
+            if future.exception() is None:
+                break
+        else:
+            raise error
+
+        stoppable.stop()
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        solutions = [
+            future.result()
+            for future in futures
+            if not future.cancelled() and future.exception() is None
+        ]
+        init = np_array(init, dtype=float)
+        return min(
+            solutions,
+            key=lambda solution: np_linalg.norm(solution[0] - init),
+        )
+
+    def forget(self, condition: callable):
+        """Remove remembered strategies for keys that satisfy condition."""
+        self._memory.remove_if(condition)
+
+    def get_successful(self, key):
+        """Name of strategy that succeeded last time for key or None."""
+        return self._memory.get(key)
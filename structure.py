@@ -0,0 +1,245 @@
+"""Module with structural analysis of systems of equations."""
+
+from numpy import (
+    ones as np_ones,
+    int64 as np_int64,
+    zeros as np_zeros,
+    cumsum as np_cumsum,
+    argsort as np_argsort,
+    bincount as np_bincount,
+    full as np_full,
+    flatnonzero as np_flatnonzero,
+)
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import (
+    connected_components,
+    maximum_bipartite_matching,
+)
+
+from contracts import contract
+
+
+class Incidence:
+    """Sparse bipartite incidence structure of system: matrix (equations x
+    symbols) with 1 where symbol is used in equation.
+
+    Number of nonzero elements is a sum of numbers of symbols in equations,
+    so it's linear in size of system (unlike graph with edge for every pair
+    of symbols of equation).
+    """
+
+    @contract(equations_symbols='dict', symbols_names='list(str)')
+    def __init__(self, equations_symbols: dict, symbols_names: list):
+        """
+        Parameters
+        ----------
+        equations_symbols: dict (str -> set of str)
+            Names of symbols used in equations: equation_name -> names.
+            Symbols that are not in symbols_names are ignored.
+        symbols_names: list[str]
+            Names of all symbols (columns of matrix).
+        """
+        self.equations_names = list(equations_symbols.keys())
+        self.symbols_names = list(symbols_names)
+        self.equations_ids = {
+            name: i for i, name in enumerate(self.equations_names)
+        }
+        self.symbols_ids = {
+            name: j for j, name in enumerate(self.symbols_names)
+        }
+
+        indptr = [0]
+        indices = []
+        for name in self.equations_names:
+            indices.extend(
+                sorted(
+                    self.symbols_ids[symbol_name]
+                    for symbol_name in equations_symbols[name]
+                    if symbol_name in self.symbols_ids
+                )
+            )
+            indptr.append(len(indices))
+
+        self.matrix = csr_matrix(
+            (np_ones(len(indices)), indices, indptr),
+            shape=(len(self.equations_names), len(self.symbols_names)),
+        )
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def equation_symbols(self, equation_name: str) -> list:
+        """Names of symbols that are used in equation."""
+        i = self.equations_ids[equation_name]
+        row = self.matrix.indices[
+            self.matrix.indptr[i] : self.matrix.indptr[i + 1]
+        ]
+        return [self.symbols_names[j] for j in row]
+
+    def connected_components(self) -> list:
+        """Connected components of bipartite graph equations-symbols.
+
+        Returns
+        -------
+        components: list[tuple(list[str], list[str])]
+            Pairs (symbols names, equations names) for every component.
+            Symbols that are not used in equations are components without
+            equations, equations without symbols - components without
+            symbols.
+        """
+        n_equations, n_symbols = self.matrix.shape
+        n_components, labels = self._components_labels()
+
+        order = np_argsort(labels, kind='stable')
+        bounds = np_zeros(n_components + 1, dtype=np_int64)
+        bounds[1:] = np_cumsum(np_bincount(labels, minlength=n_components))
+
+        components = []
+        for c in range(n_components):
+            symbols, equations = [], []
+            for node in order[bounds[c] : bounds[c + 1]]:
+                if node < n_equations:
+                    equations.append(self.equations_names[node])
+                else:
+                    symbols.append(self.symbols_names[node - n_equations])
+            components.append((symbols, equations))
+        return components
+
+    def _components_labels(self):
+        """Labels of components for nodes: equations, then symbols."""
+        n_equations, n_symbols = self.matrix.shape
+        n_nodes = n_equations + n_symbols
+        coo = self.matrix.tocoo()
+        graph = csr_matrix(
+            (coo.data, (coo.row, coo.col + n_equations)),
+            shape=(n_nodes, n_nodes),
+        )
+        return connected_components(graph, directed=False)
+
+    def block_triangular(self) -> tuple:
+        """Dulmage-Mendelsohn decomposition of system.
+
+        Maximum matching of equations and symbols splits system to
+        underdetermined part (symbols reachable from unmatched symbols by
+        alternating paths and equations of these symbols), overdetermined
+        part (the same for unmatched equations) and square part. Square
+        part is split to blocks (strongly connected components of
+        dependencies of equations via matched symbols) that can be solved
+        one by one: equations of block use symbols of block and of blocks
+        before it. Overdetermined part uses only its own symbols, square
+        part - also symbols of overdetermined one, underdetermined part -
+        symbols of all parts.
+
+        Returns
+        -------
+        underdetermined: tuple(list[str], list[str])
+            Symbols names and equations names of underdetermined part.
+        blocks: list[tuple(list[str], list[str])]
+            Symbols names and equations names of blocks of square part in
+            order of solving.
+        overdetermined: tuple(list[str], list[str])
+            Symbols names and equations names of overdetermined part.
+        """
+        n_equations, n_symbols = self.matrix.shape
+        rows = self.matrix
+        columns = self.matrix.tocsc()
+
+        # Matched symbol of every equation and vice versa (-1 if unmatched)
+        if n_equations and n_symbols:
+            equation_match = maximum_bipartite_matching(
+                rows, perm_type='column'
+            )
+        else:
+            equation_match = np_full(n_equations, -1)
+        symbol_match = np_full(n_symbols, -1)
+        matched = np_flatnonzero(equation_match >= 0)
+        symbol_match[equation_match[matched]] = matched
+
+        def neighbours(matrix, i):
+            return matrix.indices[matrix.indptr[i] : matrix.indptr[i + 1]]
+
+        def alternating_reach(starts, matrix, match):
+            """Nodes reachable from unmatched ones: by any edge to the other
+            side, then by edge of matching back.
+            """
+            reached, other_reached = set(starts), set()
+            stack = list(starts)
+            while stack:
+                for j in neighbours(matrix, stack.pop()):
+                    if j not in other_reached:
+                        other_reached.add(j)
+                        i = match[j]
+                        if i >= 0 and i not in reached:
+                            reached.add(i)
+                            stack.append(i)
+            return reached, other_reached
+
+        under_symbols, under_equations = alternating_reach(
+            np_flatnonzero(symbol_match < 0).tolist(), columns, equation_match
+        )
+        over_equations, over_symbols = alternating_reach(
+            np_flatnonzero(equation_match < 0).tolist(), rows, symbol_match
+        )
+
+        # Dependencies of square equations: equation -> equations whose
+        # matched symbols it uses
+        square = [
+            i
+            for i in range(n_equations)
+            if i not in under_equations and i not in over_equations
+        ]
+        square_ids = {i: k for k, i in enumerate(square)}
+        dependencies = [[] for _ in square]
+        for k, i in enumerate(square):
+            for j in neighbours(rows, i):
+                other = square_ids.get(symbol_match[j])
+                if other is not None and other != k:
+                    dependencies[k].append(other)
+
+        n_blocks, labels = connected_components(
+            csr_matrix(
+                (
+                    np_ones(sum(map(len, dependencies))),
+                    [d for deps in dependencies for d in deps],
+                    np_cumsum([0] + list(map(len, dependencies))),
+                ),
+                shape=(len(square), len(square)),
+            ),
+            directed=True,
+            connection='strong',
+        )
+
+        # Topological order of blocks (Kahn's algorithm)
+        blocks_equations = [[] for _ in range(n_blocks)]
+        for k, label in enumerate(labels):
+            blocks_equations[label].append(k)
+        blocks_dependencies = [set() for _ in range(n_blocks)]
+        dependents = [set() for _ in range(n_blocks)]
+        for k, deps in enumerate(dependencies):
+            for other in deps:
+                if labels[other] != labels[k]:
+                    blocks_dependencies[labels[k]].add(labels[other])
+                    dependents[labels[other]].add(labels[k])
+        ready = [b for b in range(n_blocks) if not blocks_dependencies[b]]
+        blocks = []
+        while ready:
+            b = ready.pop(0)
+            equations = [square[k] for k in blocks_equations[b]]
+            blocks.append(self._names(equation_match[equations], equations))
+            for other in sorted(dependents[b]):
+                blocks_dependencies[other].discard(b)
+                if not blocks_dependencies[other]:
+                    ready.append(other)
+
+        return (
+            self._names(sorted(under_symbols), sorted(under_equations)),
+            blocks,
+            self._names(sorted(over_symbols), sorted(over_equations)),
+        )
+
+    def _names(self, symbols_ids, equations_ids) -> tuple:
+        return (
+            [self.symbols_names[j] for j in symbols_ids],
+            [self.equations_names[i] for i in equations_ids],
+        )
@@ -0,0 +1,244 @@
+from kernels import *
+from restrictions import (
+    SegmentLengthFixed,
+    SegmentsParallel,
+    SegmentsNormal,
+    SegmentsSpotsJoint,
+    SegmentHorizontal,
+    PointFixed,
+    PointOnSegmentFixed,
+)
+
+import numpy as np
+
+
+class TestKernelSystem:
+    def test_assembly(self):
+        symbols_names = [
+            's1___x1',
+            's1___y1',
+            's1___x2',
+            's1___y2',
+            'p___x',
+            'p___y',
+            's2___x1',
+            's2___y1',
+            's2___x2',
+            's2___y2',
+        ]
+        s1, s2 = symbols_names[:4], symbols_names[6:]
+        kernels = [
+            (SegmentLengthFixed(5), s2),
+            (SegmentsParallel(), s1 + s2),
+            (PointFixed(1, 2), symbols_names[4:6]),
+        ]
+        system = KernelSystem(kernels, symbols_names)
+        assert system.shape == (4, 10)
+
+        x = np.arange(10, dtype=float) ** 2
+        residuals = system.residuals(x)
+        assert np.allclose(
+            residuals[0:1], SegmentLengthFixed.residuals(x[6:], np.array([5]))
+        )
+        assert np.allclose(residuals[2:4], [16 - 1, 25 - 2])
+
+        jacobian = system.jacobian(x)
+        assert np.allclose(
+            jacobian[1, 6:],
+            SegmentsParallel.jacobian(
+                np.concatenate([x[:4], x[6:]]), np.array([])
+            )[0, 4:],
+        )
+        assert np.allclose(jacobian[2:4, 4:6], np.eye(2))
+        assert np.allclose(jacobian[2:4, :4], 0)
+
+        multipliers = np.array([2.0, 0.0, 1.0, 1.0])
+        hessian = system.lagrangian_hessian(x, multipliers)
+        assert np.allclose(hessian, hessian.T)
+        assert np.allclose(hessian[6:, 6:], 2 * SegmentLengthFixed._hessian[0])
+        assert np.allclose(hessian[:6, :6], 0)
+
+    def test_grouping_by_types(self):
+        segments = [
+            [f's{i}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+            for i in range(3)
+        ]
+        symbols_names = [name for segment in segments for name in segment]
+        kernels = [
+            (SegmentsParallel(), segments[0] + segments[1]),
+            (SegmentLengthFixed(5), segments[0]),
+            (SegmentsParallel(), segments[1] + segments[2]),
+            (SegmentLengthFixed(10), segments[2]),
+        ]
+        system = KernelSystem(kernels, symbols_names)
+        assert len(system._groups) == 2
+        assert system.shape == (4, 12)
+
+        # Equations are in order of restrictions
+        x = np.random.RandomState(0).random_sample(12)
+        residuals = system.residuals(x)
+        jacobian = system.jacobian(x)
+        multipliers = np.array([1.0, 2.0, 3.0, 4.0])
+        hessian = system.lagrangian_hessian(x, multipliers)
+        expected_hessian = np.zeros((12, 12))
+        for i, (restriction, names) in enumerate(kernels):
+            indexes = [symbols_names.index(name) for name in names]
+            parameters = np.array(restriction.get_parameters(), dtype=float)
+            assert np.allclose(
+                residuals[i], restriction.residuals(x[indexes], parameters)
+            )
+            assert np.allclose(
+                jacobian[i, indexes],
+                restriction.jacobian(x[indexes], parameters)[0],
+            )
+            expected_hessian[np.ix_(indexes, indexes)] += (
+                multipliers[i]
+                * restriction.hessian(x[indexes], parameters)[0]
+            )
+        assert np.allclose(hessian, expected_hessian)
+
+        assert np.allclose(system.sparse_jacobian(x).toarray(), jacobian)
+        assert np.allclose(
+            system.sparse_lagrangian_hessian(x, multipliers).toarray(),
+            hessian,
+        )
+
+    def test_empty_system(self):
+        system = KernelSystem([], ['p___x', 'p___y'])
+        assert system.shape == (0, 2)
+        assert system.residuals(np.zeros(2)).shape == (0,)
+        assert system.jacobian(np.zeros(2)).shape == (0, 2)
+
+    def test_linear_part(self):
+        segment = ['s___x1', 's___y1', 's___x2', 's___y2']
+        kernels = [
+            (SegmentLengthFixed(5), segment),
+            (PointFixed(1, 2), segment[:2]),
+        ]
+        system = KernelSystem(kernels, segment)
+        assert not system.is_linear
+
+        linear, nonlinear = system.split()
+        assert linear.is_linear and not nonlinear.is_linear
+        assert linear.shape == (2, 4) and nonlinear.shape == (1, 4)
+        assert system.split()[0] is linear  # Parts are built once
+
+        matrix, rhs = linear.linear_form()
+        assert np.allclose(matrix, [[1, 0, 0, 0], [0, 1, 0, 0]])
+        assert np.allclose(rhs, [1, 2])
+        assert np.allclose(
+            linear.linear_form(sparse=True)[0].toarray(), matrix
+        )
+
+        origin, basis = linear.solutions_subspace()
+        assert np.allclose(origin, [1, 2, 0, 0])
+        assert basis.shape == (4, 2)
+        assert np.allclose(matrix.dot(basis), 0)
+        assert np.allclose(basis.T.dot(basis), np.eye(2))
+
+        reduced = ReducedKernelSystem(nonlinear, origin, basis)
+        assert reduced.shape == (1, 2)
+        y = np.array([3.0, -1.0])
+        x = reduced.to_full(y)
+        assert np.allclose(reduced.to_reduced(x), y)
+        assert np.allclose(reduced.residuals(y), nonlinear.residuals(x))
+        assert np.allclose(
+            reduced.jacobian(y), nonlinear.jacobian(x).dot(basis)
+        )
+        multipliers = np.array([2.0])
+        assert np.allclose(
+            reduced.lagrangian_hessian(y, multipliers),
+            basis.T.dot(nonlinear.lagrangian_hessian(x, multipliers)).dot(
+                basis
+            ),
+        )
+
+
+def make_rectangle(with_normals: bool = True):
+    """Kernels of rectangle 10 x 5 with point on its side, other point is
+    free, and values of symbols.
+    """
+    sides = [
+        [f's{i}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+        for i in range(4)
+    ]
+    point, free_point = ['p___x', 'p___y'], ['q___x', 'q___y']
+    kernels = [(SegmentHorizontal(), sides[0])]
+    for i in range(4):
+        kernels.append((SegmentLengthFixed(10 if i % 2 == 0 else 5), sides[i]))
+        next_side = sides[(i + 1) % 4]
+        kernels.append(
+            (SegmentsSpotsJoint('end', 'start'), sides[i] + next_side)
+        )
+        if with_normals and i < 3:
+            kernels.append((SegmentsNormal(), sides[i] + next_side))
+    kernels.append((PointOnSegmentFixed(0.5), point + sides[0]))
+    symbols_names = [n for side in sides for n in side] + point + free_point
+    values = np.array(
+        [0, 0, 10, 0, 10, 0, 10, 5, 10, 5, 0, 5, 0, 5, 0, 0, 5, 0, 1, 1],
+        dtype=float,
+    )
+    return KernelSystem(kernels, symbols_names), values
+
+
+class TestRigidClusters:
+    def test_clusters(self):
+        system, values = make_rectangle()
+        (cluster,) = system.rigid_clusters()
+        assert len(cluster.coordinates) == 9  # 4 sides and point
+        assert system.symbols_names.index('q___x') not in {
+            i for xy in cluster.coordinates for i in xy
+        }
+        # Horizontal is not between figures of cluster
+        assert 0 not in cluster.kernels_ids + [cluster.anchor_id]
+        assert system._kernels[cluster.anchor_id][0].n_equations == 1
+        assert len(cluster.rows) == system.n_equations - 2
+        assert system.rigid_clusters() is system.rigid_clusters()
+
+        # Sides can rotate relative to each other, point is on the first one
+        system, _ = make_rectangle(with_normals=False)
+        (cluster,) = system.rigid_clusters()
+        assert sorted(cluster.coordinates) == [(0, 1), (2, 3), (16, 17)]
+
+    def test_parameterization(self):
+        system, values = make_rectangle()
+        reduced, y = system.rigid_parameterization(values)
+        # Free point and translation, rotation with scale of cluster
+        assert reduced.shape == (2, 6)
+        assert np.allclose(reduced.to_full(y), values)
+        assert np.allclose(reduced.residuals(y), 0)
+
+        # Positions of cluster are rotations and translations
+        angle = 0.3
+        y[2:4] += [1.0, 2.0]
+        y[4:6] = np.cos(angle), np.sin(angle)
+        x = reduced.to_full(y)
+        assert np.allclose(system.residuals(x)[1:], 0)
+        assert np.allclose(x[-2:], values[-2:])
+        assert np.allclose(
+            reduced.jacobian(y), system._rigid[1].jacobian(x).dot(reduced.basis)
+        )
+
+        # Points coincide
+        reduced, y = system.rigid_parameterization(np.zeros(len(values)))
+        assert reduced is None and y is None
+
+    def test_motions(self):
+        system, _ = make_rectangle()
+        # Horizontal side forbids rotation, free point isn't in cluster
+        assert system.invariances() == ('translation',)
+        assert not system.is_rigid()
+
+        sides = system.symbols_names[:16]
+        kernels = [k for k in system._kernels if k[1][0] in sides]
+        rectangle = KernelSystem(kernels[1:], sides)
+        assert rectangle.invariances() == ('translation', 'rotation')
+        assert rectangle.is_rigid()
+
+        segment = sides[:4]
+        assert KernelSystem(
+            [(SegmentLengthFixed(10), segment)], segment
+        ).is_rigid()
+        point = ['p___x', 'p___y']
+        fixed = KernelSystem([(PointFixed(0, 0), point)], point)
+        assert fixed.invariances() == ()
@@ -2,15 +2,26 @@ from restrictions import (
     PointFixed,
     SegmentLengthFixed,
     SegmentSpotFixed,
+    SegmentsSpotsJoint,
+    SegmentsParallel,
+    SegmentsAngleBetweenFixed,
     PointAndSegmentSpotJoint,
 )
 from project import CADProject, ActionImpossible
+from solve import (
+    CannotSolveSystemError,
+    ConflictingRestrictionError,
+    RedundantRestrictionError,
+)
 from figures import Point, Segment
-from bindings import choose_best_bindings
+from bindings import choose_best_bindings, SegmentSpotBinding
 import pytest
 import numpy as np
 from utils import IncorrectParamValue
 import os
+import subprocess
+import sys
+import textwrap
 
 
 def is_equal(v1, v2, equal_type='equal'):
@@ -200,6 +211,274 @@ class TestProject:
         assert self._is_figures_correct(project.figures, correct_figures)
         project.commit()
 
+    def test_drag_session(self):
+        project = CADProject()
+        segment = Segment.from_coordinates(0, 0, 10, 0)
+        segment_name = project.add_figure(segment)
+        project.add_restriction(
+            SegmentSpotFixed(0, 0, 'start'), (segment_name,)
+        )
+        project.add_restriction(SegmentLengthFixed(10), (segment_name,))
+
+        bb = choose_best_bindings(project.bindings, 10, 0)[0]
+        project.begin_drag(bb)
+        for angle in np.linspace(0, np.pi / 2, 10)[1:]:
+            cursor_x, cursor_y = 20 * np.cos(angle), 20 * np.sin(angle)
+            project.drag_to(cursor_x, cursor_y)
+            correct_figures = {
+                segment_name: (
+                    0,
+                    0,
+                    10 * np.cos(angle),
+                    10 * np.sin(angle),
+                )
+            }
+            assert self._is_figures_correct(project.figures, correct_figures)
+
+        # Task is prepared once, solution of previous frame is saved
+        session = project._drag_session
+        assert len(session._tasks) == 1
+        assert session._solutions[0] is not None
+        assert session.figures_names == [segment_name]
+        # Solutions of frames are lost with state on rollback
+        project.rollback()
+        assert project._drag_session is session
+        assert session._solutions == [None] and session._targets is None
+
+        project.end_drag()
+        assert project._drag_session is None
+        with pytest.raises(ActionImpossible):
+            project.drag_to(0, -20)
+        project.move_figure(bb, 0, -20)
+        correct_figures = {segment_name: (0, 0, 0, -10)}
+        assert self._is_figures_correct(project.figures, correct_figures)
+
+        # Final position is polished on the end of moving
+        project.begin_drag(bb)
+        project.drag_to(-20, 0)
+        assert project._drag_target is not None
+        project.end_drag()
+        assert project._drag_target is None
+        segment = project.figures[segment_name]
+        x1, y1, x2, y2 = segment.get_base_representation()
+        assert np.isclose(x2, -10, rtol=0, atol=1e-9)
+        assert np.isclose(y2, 0, rtol=0, atol=1e-9)
+
+        # Position of the last frame is kept if it can't be polished
+        project.begin_drag(bb)
+        project.drag_to(0, 20)
+        frame = project.figures[segment_name].get_base_representation()
+        solve = project._drag_session.solve
+
+        def failing_polish(targets, current_values, precision):
+            if precision == 'polish':
+                raise CannotSolveSystemError('Polish failed.')
+            return solve(targets, current_values, precision)
+
+        project._drag_session.solve = failing_polish
+        with pytest.raises(CannotSolveSystemError):
+            project.end_drag()
+        segment = project.figures[segment_name]
+        assert segment.get_base_representation() == frame
+        assert np.isclose(frame[3], 10, atol=1e-3)
+
+    def test_reproducible_dragging(self):
+        # Results don't depend on hashes of strings (PYTHONHASHSEED)
+        script = textwrap.dedent('''
+            import diagnostic_context
+            import project as project_module
+            from bindings import choose_best_bindings
+            from figures import Segment
+            from project import CADProject
+            from restrictions import (
+                SegmentLengthFixed,
+                SegmentsNormal,
+                SegmentsSpotsJoint,
+            )
+
+            diagnostic_context.VERBOSE = False
+            project_module.SOLUTIONS_MEMOIZATION_QUANTUM = 1e-3
+            project = CADProject()
+            corners = [(0, 0), (40, 2), (41, 31), (1, 30)]
+            names = [
+                project.add_figure(
+                    Segment.from_coordinates(*corners[i - 1], *corners[i])
+                )
+                for i in range(4)
+            ]
+            for i in range(4):
+                project.add_restriction(
+                    SegmentsSpotsJoint('end', 'start'),
+                    (names[i - 1], names[i]),
+                )
+            for i in range(1, 4):
+                project.add_restriction(
+                    SegmentsNormal(), (names[i - 1], names[i])
+                )
+            project.add_restriction(SegmentLengthFixed(40), (names[1],))
+            binding = choose_best_bindings(project.bindings, 40, 2)[0]
+            for frames in [range(1, 8), range(6, -1, -1)]:  # There and back
+                project.begin_drag(binding)
+                for t in frames:
+                    project.drag_to(40 + 3 * t, 2 + 2 * t)
+                project.end_drag()
+                print(
+                    [
+                        figure.get_base_representation()
+                        for figure in project.figures.values()
+                    ]
+                )
+            ''')
+        outputs = set()
+        for seed in ['0', '1', '2', '3']:
+            outputs.add(
+                subprocess.run(
+                    [sys.executable, '-c', script],
+                    cwd=os.path.dirname(os.path.dirname(__file__)),
+                    env=dict(os.environ, PYTHONHASHSEED=seed),
+                    stdout=subprocess.PIPE,
+                    check=True,
+                ).stdout
+            )
+        assert len(outputs) == 1
+
+    def test_moving_rigid_figures(self):
+        from diagnostic_context import DEFAULT_COUNTERS
+
+        results, dragged = [], []
+        for closed_form in (True, False):
+            project = CADProject()
+            segment = Segment.from_coordinates(0, 0, 10, 0)
+            segment_name = project.add_figure(segment)
+            point = Point((10, 0))
+            point_name = project.add_figure(point)
+            project.add_restriction(SegmentLengthFixed(10), (segment_name,))
+            project.add_restriction(
+                PointAndSegmentSpotJoint('end'), (point_name, segment_name)
+            )
+            if not closed_form:
+                project._system._get_motions = lambda component: None
+
+            # Segment with joined point is moved as one body
+            (bb,) = [
+                b
+                for b in project.bindings
+                if isinstance(b, SegmentSpotBinding)
+                and b.spot_type == 'center'
+            ]
+            project.move_figure(bb, 5, 3)
+            results.append(
+                {
+                    name: figure.get_base_representation()
+                    for name, figure in project.figures.items()
+                }
+            )
+
+            # Frames of dragging are moved in closed form too
+            DEFAULT_COUNTERS.reset()
+            project.begin_drag(bb)
+            for x, y in [(6, 4), (8, 5), (10, 3)]:
+                project.drag_to(x, y)
+            project.end_drag()
+            n_motions = 4 if closed_form else 0
+            assert DEFAULT_COUNTERS['closed_form_motions'] == n_motions
+            dragged.append(
+                {
+                    name: figure.get_base_representation()
+                    for name, figure in project.figures.items()
+                }
+            )
+
+        for name, values in results[0].items():
+            assert np.allclose(values, results[1][name])
+        assert self._is_figures_correct(project.figures, dragged[0])
+        for figures, center in [(results, (5, 3)), (dragged, (10, 3))]:
+            x1, y1, x2, y2 = figures[0][segment_name]
+            assert np.isclose(np.hypot(x2 - x1, y2 - y1), 10)
+            assert np.isclose((x1 + x2) / 2, center[0], atol=1e-2)
+            assert np.isclose((y1 + y2) / 2, center[1], atol=1e-2)
+
+    def test_moving_deformable_figures(self):
+        from diagnostic_context import DEFAULT_COUNTERS
+
+        # Joined segments without fixed figures are invariant to
+        # translations, but they are not one rigid body
+        project = CADProject()
+        segment_name = project.add_figure(
+            Segment.from_coordinates(0, 0, 10, 0)
+        )
+        other_name = project.add_figure(
+            Segment.from_coordinates(10, 0, 10, 10)
+        )
+        project.add_restriction(SegmentLengthFixed(10), (segment_name,))
+        project.add_restriction(SegmentLengthFixed(10), (other_name,))
+        project.add_restriction(
+            SegmentsSpotsJoint('end', 'start'), (segment_name, other_name)
+        )
+        (bb,) = [
+            b
+            for b in project.bindings
+            if isinstance(b, SegmentSpotBinding)
+            and b.spot_type == 'center'
+            and b.get_object_names()[0] == segment_name
+        ]
+
+        # Center of segment is dragged by iterative solver, other segment
+        # turns around its end instead of translation
+        DEFAULT_COUNTERS.reset()
+        project.begin_drag(bb)
+        for x, y in [(5, 1), (5, 2), (5, 3)]:
+            project.drag_to(x, y)
+        project.end_drag()
+        assert DEFAULT_COUNTERS['closed_form_motions'] == 0
+        figures = project.figures
+        x1, y1, x2, y2 = figures[segment_name].get_base_representation()
+        assert np.isclose(np.hypot(x2 - x1, y2 - y1), 10)
+        assert np.allclose([(x1 + x2) / 2, (y1 + y2) / 2], [5, 3], atol=1e-2)
+        x3, y3, x4, y4 = figures[other_name].get_base_representation()
+        assert np.allclose([x3, y3], [x2, y2])
+        assert np.isclose(np.hypot(x4 - x3, y4 - y3), 10)
+        # Translation would move free end of other segment by 3
+        assert np.hypot(x4 - 10, y4 - 10) < 3
+
+    def test_rejection_of_restrictions(self):
+        project = CADProject()
+        segment_name = project.add_figure(
+            Segment.from_coordinates(0, 0, 10, 0)
+        )
+        length_name = project.add_restriction(
+            SegmentLengthFixed(10), (segment_name,)
+        )
+
+        # Restrictions are rejected without solving
+        with pytest.raises(RedundantRestrictionError) as error:
+            project.add_restriction(SegmentLengthFixed(10), (segment_name,))
+        assert error.value.restrictions_names == [length_name]
+        with pytest.raises(ConflictingRestrictionError) as error:
+            project.add_restriction(SegmentLengthFixed(5), (segment_name,))
+        assert error.value.restrictions_names == [length_name]
+        assert list(project.restrictions) == [length_name]
+        correct_figures = {segment_name: (0, 0, 10, 0)}
+        assert self._is_figures_correct(project.figures, correct_figures)
+
+    def test_restrictions_of_degenerate_figures(self):
+        project = CADProject()
+        s1 = project.add_figure(
+            Segment.from_coordinates(14.53, 67.3, 14.53, 67.3)
+        )
+        s2 = project.add_figure(Segment.from_coordinates(0, 0, 60, 5))
+        s3 = project.add_figure(Segment.from_coordinates(10, 40, 30, 90))
+        project.add_restriction(SegmentsParallel(), (s1, s2))
+        project.add_restriction(SegmentsAngleBetweenFixed(1.0), (s1, s3))
+
+        # Length of zero length segment depends on other restrictions only
+        # at current values, so it's solved instead of rejected
+        project.add_restriction(SegmentLengthFixed(10), (s1,))
+        x1, y1, x2, y2 = project.figures[s1].get_base_representation()
+        assert np.isclose(np.hypot(x2 - x1, y2 - y1), 10)
+        x3, y3, x4, y4 = project.figures[s2].get_base_representation()
+        assert np.isclose((x2 - x1) * (y4 - y3), (y2 - y1) * (x4 - x3))
+
     def test_addition_and_deletion_restrictions(self):
         project = CADProject()
 
@@ -0,0 +1,95 @@
+from restrictions import *
+
+import numpy as np
+import sympy
+import pytest
+
+
+RESTRICTIONS = [
+    PointFixed(1, 2),
+    PointsJoint(),
+    SegmentFixed(1, 2, 3, 4),
+    SegmentSpotFixed(1, 2, 'start'),
+    SegmentSpotFixed(1, 2, 'end'),
+    SegmentSpotFixed(1, 2, 'center'),
+    SegmentLengthFixed(5),
+    SegmentAngleFixed(np.pi / 3),
+    SegmentHorizontal(),
+    SegmentVertical(),
+    SegmentsAngleBetweenFixed(np.pi / 6),
+    SegmentsParallel(),
+    SegmentsNormal(),
+    SegmentsSpotsJoint('start', 'center'),
+    SegmentsSpotsJoint('end', 'start'),
+    PointOnSegmentFixed(0.3),
+    PointOnSegmentLine(),
+    PointAndSegmentSpotJoint('end'),
+    PointAndSegmentSpotJoint('center'),
+    SegmentSpotAndPointJoint('start'),
+    SegmentSpotAndPointJoint('center'),
+]
+
+
+def get_symbols(restriction):
+    """Symbols of objects of restriction: list of dicts and flat list."""
+    objects_symbols = [
+        {
+            name: sympy.Symbol(f'object_{i}___{name}')
+            for name in object_type.base_parameters
+        }
+        for i, object_type in enumerate(restriction.object_types)
+    ]
+    flat = [sym for symbols in objects_symbols for sym in symbols.values()]
+    return objects_symbols, flat
+
+
+class TestKernels:
+    @pytest.mark.parametrize(
+        'restriction', RESTRICTIONS, ids=lambda r: type(r).__name__
+    )
+    def test_kernels_equal_to_equations(self, restriction):
+        objects_symbols, symbols = get_symbols(restriction)
+        equations = restriction.get_equations(*objects_symbols)
+        assert len(equations) == restriction.n_equations
+
+        canonical = sympy.Matrix([eq.lhs - eq.rhs for eq in equations])
+        residuals = sympy.lambdify([symbols], canonical)
+        jacobian = sympy.lambdify([symbols], canonical.jacobian(symbols))
+        hessian = sympy.lambdify(
+            [symbols], [sympy.hessian(f, symbols) for f in canonical]
+        )
+
+        parameters = np.array(restriction.get_parameters(), dtype=float)
+        values = np.random.RandomState(0).uniform(-10, 10, (5, len(symbols)))
+        for x in values:
+            assert np.allclose(
+                restriction.residuals(x, parameters),
+                np.array(residuals(x), dtype=float).ravel(),
+            )
+            assert np.allclose(
+                restriction.jacobian(x, parameters),
+                np.array(jacobian(x), dtype=float),
+            )
+            assert np.allclose(
+                restriction.hessian(x, parameters),
+                np.array(hessian(x), dtype=float),
+                atol=1e-5,
+            )
+
+        # Many restrictions at once
+        batch_parameters = np.tile(parameters, (len(values), 1))
+        assert restriction.residuals(values, batch_parameters).shape == (
+            len(values),
+            restriction.n_equations,
+        )
+        assert restriction.jacobian(values, batch_parameters).shape == (
+            len(values),
+            restriction.n_equations,
+            len(symbols),
+        )
+        assert restriction.hessian(values, batch_parameters).shape == (
+            len(values),
+            restriction.n_equations,
+            len(symbols),
+            len(symbols),
+        )
@@ -1,6 +1,11 @@
 from solve import *
 from utils import IncorrectParamValue
 
+import os
+import sys
+import pickle
+import subprocess
+import textwrap
 import sympy
 import pytest
 import numpy as np
@@ -68,11 +73,17 @@ class TestBaseFunctions:
         assert_flat_dicts_equal(flatten_, flatten)
 
     def test_getting_equation_symbols(self):
-        symbols_names = ['a', 'b', 'c', 'd']
-        a, b, c, d = sympy.symbols(' '.join(symbols_names))
-        eq = sympy.Eq(a ** 2 + b * b, c - a)
-        eq_symbols_names_ = get_equation_symbols_names(eq, symbols_names)
-        assert eq_symbols_names_ == {'a', 'b', 'c'}
+        system = EquationsSystem()
+        system.add_figure_symbols('figure', ['a', 'b', 'c', 'd'])
+        f_ = system.get_symbols('figure')
+        other = sympy.Symbol('other')
+        eq = sympy.Eq(f_['a'] ** 2 + f_['b'] * f_['b'], f_['c'] - other)
+        eq_symbols_names_ = system._get_equation_symbols_names(eq)
+        assert list(eq_symbols_names_) == [
+            'figure___a',
+            'figure___b',
+            'figure___c',
+        ]
 
 
 class TestSubstitutor:
@@ -120,6 +131,54 @@ class TestSubstitutor:
         # result = substitutor.restore(simplified_answer)
         # assert_flat_dicts_equal(answer, result)
 
+    def test_chains_of_equal_symbols(self):
+        a, b, c, d, e = symbols_ = sympy.symbols('a b c d e')
+        symbols_dict = {str(s): s for s in symbols_}
+        system = [
+            sympy.Eq(a, b),
+            sympy.Eq(5, c),
+            sympy.Eq(b, c),
+            sympy.Eq(d, e),
+            sympy.Eq(a * d + e, 2),
+        ]
+        substitutor = Substitutor().fit(system, symbols_dict)
+        assert substitutor.subs == {'a': 5.0, 'b': 5.0, 'c': 5.0, 'e': d}
+        # The first symbol of chain is kept
+        assert substitutor.sub(system) == [sympy.Eq(6.0 * d, 2)]
+        assert substitutor.restore({'d': 0.5}) == {
+            'a': 5.0,
+            'b': 5.0,
+            'c': 5.0,
+            'd': 0.5,
+            'e': 0.5,
+        }
+
+    @pytest.mark.parametrize(
+        'system',
+        [
+            [sympy.Eq(Symbol('a'), 1), sympy.Eq(2, Symbol('a'))],
+            [
+                sympy.Eq(Symbol('a'), Symbol('b')),
+                sympy.Eq(Symbol('b'), Symbol('a')),
+            ],
+            [
+                sympy.Eq(Symbol('a'), Symbol('b')),
+                sympy.Eq(Symbol('b'), Symbol('c')),
+                sympy.Eq(Symbol('c'), Symbol('a')),
+            ],
+            [
+                sympy.Eq(Symbol('a'), 1),
+                sympy.Eq(Symbol('b'), 2),
+                sympy.Eq(Symbol('a'), Symbol('b')),
+            ],
+        ],
+        ids=['same_keys', 'same_equations', 'cycle', 'overfitted'],
+    )
+    def test_incorrect_systems(self, system):
+        symbols_dict = {name: Symbol(name) for name in ('a', 'b', 'c')}
+        with pytest.raises(SubstitutionError):
+            Substitutor().fit(system, symbols_dict)
+
 
 class TestEquationsSystem:
     def test_addition_and_removing_symbols(self):
@@ -423,3 +482,1077 @@ class TestEquationsSystem:
         # system.add_restriction_equations('fixed_length_2', fixed_length_2)
         # with pytest.raises(CannotSolveSystemError):
         #     system.solve(values)
+
+    def test_compiled_systems_cache(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure', ['x1', 'y1', 'x2', 'y2'])
+        system.add_figure_symbols('point', ['x', 'y'])
+
+        f_ = system.get_symbols('figure')
+        f_x1, f_y1, f_x2, f_y2 = f_['x1'], f_['y1'], f_['x2'], f_['y2']
+
+        values = {
+            'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0},
+            'point': {'x': 1.0, 'y': 1.0},
+        }
+        fixed_start = [sympy.Eq(f_x1, 0.0), sympy.Eq(f_y1, 0.0)]
+        fixed_length = [
+            sympy.Eq((f_x2 - f_x1) ** 2 + (f_y2 - f_y1) ** 2, 5 ** 2)
+        ]
+        system.add_restriction_equations('fixed_start', fixed_start)
+        system.add_restriction_equations('fixed_length', fixed_length)
+        assert len(system._compiled) == 0
+
+        # Moving with other target must reuse compiled system
+        result = system.solve_optimization_task(
+            {'figure': {'x2': 0.0, 'y2': 10.0}}, values
+        )
+        answer = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 0.0, 'y2': 5.0}}
+        assert_2_level_dicts_equal(result, answer, is_close=True)
+        assert len(system._compiled) == 1
+        compiled_before = list(system._compiled._items.values())
+
+        values['figure'].update(result['figure'])
+        result = system.solve_optimization_task(
+            {'figure': {'x2': -10.0, 'y2': 0.0}}, values
+        )
+        answer = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': -5.0, 'y2': 0.0}}
+        assert_2_level_dicts_equal(result, answer, is_close=True)
+        assert list(system._compiled._items.values()) == compiled_before
+
+        # Other components do not invalidate cache
+        system.add_restriction_equations(
+            'fixed_point', [sympy.Eq(system.get_symbols('point', 'x'), 1.0)]
+        )
+        assert len(system._compiled) == 1
+
+        # Changes of component invalidate cache
+        system.remove_restriction_equations('fixed_length')
+        assert len(system._compiled) == 0
+
+    def test_pickling_without_compiled_systems(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure', ['x', 'y'])
+        f_x = system.get_symbols('figure', 'x')
+        system.add_restriction_equations('line', [sympy.Eq(f_x ** 2, 4)])
+        system.solve_optimization_task(
+            {'figure': {'x': 3.0}}, {'figure': {'x': 2.0, 'y': 1.0}}
+        )
+        assert len(system._compiled) == 1
+
+        restored = pickle.loads(pickle.dumps(system))
+        assert len(restored._compiled) == 0
+        result = restored.solve({'figure': {'x': 2.0, 'y': 1.0}})
+        assert_2_level_dicts_equal(
+            result, {'figure': {'x': 2.0}}, is_close=True
+        )
+
+    def test_compiled_jacobian(self):
+        x, y, p = sympy.symbols('x y p')
+        system = [x ** 2 + x * y - p, sympy.sqrt(x ** 2 + y ** 2) - 2 * p]
+        jac = EquationsSystem._system_to_jacobian(system, [x, y], [p])
+
+        point, params = np.array([1.5, -0.5]), np.array([3.0])
+        answer = np.array(
+            [
+                [2 * 1.5 - 0.5, 1.5],
+                [1.5 / np.sqrt(2.5), -0.5 / np.sqrt(2.5)],
+            ]
+        )
+        assert np.allclose(jac(point, params), answer)
+
+    def test_compiled_function(self):
+        x, y, p = sympy.symbols('x y p')
+        length = sympy.sqrt(x ** 2 + y ** 2)
+        system = [length - p, length * x - y]
+        fun = EquationsSystem._system_to_function(system, [x, y], [p])
+
+        res = fun(np.array([3.0, 4.0]), np.array([1.0]))
+        assert isinstance(res, np.ndarray) and res.dtype == float
+        assert np.allclose(res, [4.0, 11.0])
+        with pytest.raises(ValueError):
+            fun(np.array([3.0]), np.array([1.0]))
+
+    def test_incidence(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure1', ['x', 'y'])
+        system.add_figure_symbols('figure2', ['x1', 'y1', 'x2', 'y2'])
+        system.add_figure_symbols('figure3', ['x1', 'y1', 'x2', 'y2'])
+        f1_ = system.get_symbols('figure1')
+        f2_ = system.get_symbols('figure2')
+        f3_ = system.get_symbols('figure3')
+
+        system.add_restriction_equations(
+            'fixed', [sympy.Eq(f1_['x'], 1.0), sympy.Eq(f1_['y'], 2.0)]
+        )
+        system.add_restriction_equations(
+            'joint', [sympy.Eq(f1_['x'], f2_['x1'])]
+        )
+        system.add_restriction_equations(
+            'normal',
+            [
+                sympy.Eq(
+                    (f2_['x2'] - f2_['x1']) * (f3_['x2'] - f3_['x1'])
+                    + (f2_['y2'] - f2_['y1']) * (f3_['y2'] - f3_['y1']),
+                    0,
+                )
+            ],
+        )
+        incidence = system._get_incidence()
+        assert incidence.shape == (4, 10)
+        assert incidence.matrix.nnz == 1 + 1 + 2 + 8  # linear, not 28 edges
+        assert set(incidence.equation_symbols('joint___0')) == {
+            'figure1___x',
+            'figure2___x1',
+        }
+        assert len(system._get_components()) == 2
+
+        system.remove_restriction_equations('joint')
+        assert system._incidence is None
+        assert system._get_incidence().shape == (3, 10)
+        assert len(system._get_components()) == 3
+
+        system.remove_figure_symbols('figure3')
+        incidence = system._get_incidence()
+        assert incidence.shape == (3, 6)
+        assert incidence.matrix.nnz == 1 + 1 + 4
+
+    def test_components_index(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure1', ['x', 'y'])
+        system.add_figure_symbols('figure2', ['x', 'y'])
+        system.add_figure_symbols('figure3', ['x', 'y'])
+        f1_ = system.get_symbols('figure1')
+        f2_ = system.get_symbols('figure2')
+        f3_ = system.get_symbols('figure3')
+
+        system.add_restriction_equations(
+            'joint_12', [sympy.Eq(f1_['x'], f2_['x'])]
+        )
+        system.add_restriction_equations(
+            'joint_23', [sympy.Eq(f2_['y'] * f3_['x'], 1)]
+        )
+        components = system._get_components()
+        assert len(components) == 4  # (x1, x2), (y2, x3), (y1), (y3)
+        component_id = components.component_id('figure1___x')
+        assert component_id == components.component_id('figure2___x')
+        assert set(components[component_id].equations) == {'joint_12___0'}
+
+        system.add_restriction_equations(
+            'joint_all', [sympy.Eq(f1_['x'] + f3_['x'], f3_['y'])]
+        )
+        components = system._get_components()
+        component_id = components.component_id('figure1___x')
+        assert set(components[component_id].symbols) == {
+            'figure1___x',
+            'figure2___x',
+            'figure2___y',
+            'figure3___x',
+            'figure3___y',
+        }
+        assert len(components[component_id].equations) == 3
+
+        # Removing splits components
+        system.remove_restriction_equations('joint_all')
+        assert not system._components.is_valid
+        components = system._get_components()
+        assert components.is_valid
+        assert components.component_id(
+            'figure1___x'
+        ) != components.component_id('figure3___x')
+        assert len(components) == 4
+
+        system.remove_figure_symbols('figure1')
+        components = system._get_components()
+        assert len(components) == 3
+        component_id = components.component_id('figure2___x')
+        assert set(components[component_id].equations) == {'joint_12___0'}
+
+    def test_order_of_components_symbols(self):
+        # Order of symbols doesn't depend on hashes of strings
+        script = textwrap.dedent('''
+            import sympy
+            from solve import EquationsSystem
+
+            system = EquationsSystem()
+            for name in ['figure1', 'figure2', 'figure3']:
+                system.add_figure_symbols(name, ['x1', 'y1', 'x2', 'y2'])
+            f1_ = system.get_symbols('figure1')
+            f2_ = system.get_symbols('figure2')
+            f3_ = system.get_symbols('figure3')
+            system.add_restriction_equations(
+                'joint', [sympy.Eq(f1_['x2'] * f2_['y1'], f3_['x1'])]
+            )
+            system.add_restriction_equations(
+                'normal', [sympy.Eq(f3_['y2'] - f1_['y1'], f2_['x2'])]
+            )
+            print([list(c.symbols) for c in system._get_components()])
+            ''')
+        outputs = set()
+        for seed in ['0', '1', '2', '3']:
+            outputs.add(
+                subprocess.run(
+                    [sys.executable, '-c', script],
+                    cwd=os.path.dirname(os.path.dirname(__file__)),
+                    env=dict(os.environ, PYTHONHASHSEED=seed),
+                    stdout=subprocess.PIPE,
+                    check=True,
+                ).stdout
+            )
+        assert len(outputs) == 1
+
+    def test_drag_session(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure', ['x1', 'y1', 'x2', 'y2'])
+        system.add_figure_symbols('point', ['x', 'y'])
+
+        f_ = system.get_symbols('figure')
+        f_x1, f_y1, f_x2, f_y2 = f_['x1'], f_['y1'], f_['x2'], f_['y2']
+        system.add_restriction_equations(
+            'fixed_start', [sympy.Eq(f_x1, 0.0), sympy.Eq(f_y1, 0.0)]
+        )
+        system.add_restriction_equations(
+            'fixed_length',
+            [sympy.Eq((f_x2 - f_x1) ** 2 + (f_y2 - f_y1) ** 2, 5 ** 2)],
+        )
+
+        session = system.create_drag_session({'figure': ['x2', 'y2']})
+        assert len(session._tasks) == 1  # Point is not in session
+        assert session.figures_names == ['figure']
+        assert len(system._compiled) == 1
+
+        values = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+        for angle in np.linspace(0, np.pi, 7)[1:]:
+            target = {
+                'figure': {'x2': 10 * np.cos(angle), 'y2': 10 * np.sin(angle)}
+            }
+            result = session.solve(target, values)
+            answer = {
+                'figure': {
+                    'x1': 0.0,
+                    'y1': 0.0,
+                    'x2': 5 * np.cos(angle),
+                    'y2': 5 * np.sin(angle),
+                }
+            }
+            assert_2_level_dicts_equal(result, answer, is_close=True)
+            values = result
+
+        # Frames are solved without recompilation
+        assert len(system._compiled) == 1
+
+        # Frames can be solved with coarse precision
+        target = {'figure': {'x2': 0.0, 'y2': -10.0}}
+        result = session.solve(target, values, 'interactive')
+        assert np.isclose(result['figure']['y2'], -5, atol=1e-3)
+        with pytest.raises(IncorrectParamValue):
+            session.solve(target, values, 'unknown')
+
+    def test_continuation_of_frames(self, monkeypatch):
+        from restrictions import SegmentSpotFixed, SegmentLengthFixed
+        from diagnostic_context import DEFAULT_COUNTERS
+
+        def drag(mode, angles):
+            system = EquationsSystem(mode=mode)
+            system.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+            symbols = system.get_symbols('segment')
+            for name, restriction in [
+                ('fixed_start', SegmentSpotFixed(0, 0, 'start')),
+                ('fixed_length', SegmentLengthFixed(5)),
+            ]:
+                system.add_restriction_equations(
+                    name,
+                    restriction.get_equations(symbols),
+                    restriction,
+                    ['segment'],
+                )
+
+            session = system.create_drag_session({'segment': ['x2', 'y2']})
+            values = {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+            for angle in angles:
+                target = {
+                    'segment': {
+                        'x2': 5 * np.cos(angle),
+                        'y2': 5 * np.sin(angle),
+                    }
+                }
+                values = session.solve(target, values, 'interactive')
+            return session.solve(target, values)
+
+        def fail(previous_targets, targets, fraction):
+            if fraction < 1:
+                raise CannotSolveSystemError
+            return targets
+
+        answer = {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 0.0, 'y2': 5.0}}
+        for mode in SOLVER_MODES:
+            # Small motions are solved in one step
+            DEFAULT_COUNTERS.reset()
+            result = drag(mode, np.linspace(0, np.pi / 2, 19)[1:])
+            assert_2_level_dicts_equal(result, answer, is_close=True)
+            assert DEFAULT_COUNTERS['continuation_substeps'] == 0
+
+            # Large motion is split in sub-steps
+            DEFAULT_COUNTERS.reset()
+            result = drag(mode, [np.pi / 2])
+            assert_2_level_dicts_equal(result, answer, is_close=True)
+            assert DEFAULT_COUNTERS['continuation_substeps'] == 3
+            assert DEFAULT_COUNTERS['continuation_failures'] == 0
+
+            # Frame is solved in one step if sub-steps failed
+            DEFAULT_COUNTERS.reset()
+            monkeypatch.setattr(
+                DragSession, '_interpolate', staticmethod(fail)
+            )
+            result = drag(mode, [np.pi / 2])
+            assert_2_level_dicts_equal(result, answer, is_close=True)
+            assert DEFAULT_COUNTERS['continuation_failures'] == 1
+            monkeypatch.undo()
+
+    def test_continuation_steps_number(self):
+        import types
+
+        def get_steps_number(figures, motion, shift=(0, 0)):
+            """Figures are dicts of coordinates, the last coordinate of the
+            last figure is moved by motion, all figures are shifted by shift.
+            """
+            values = {
+                compose_full_name(f'figure_{i}', name): value
+                + shift[name[0] == 'y']
+                for i, figure in enumerate(figures)
+                for name, value in figure.items()
+            }
+            task = types.SimpleNamespace(symbols_names=list(values))
+            name = list(values)[-1]
+            previous = {name: values[name]}
+            optimizing = {name: values[name] + motion}
+            return DragSession._get_steps_number(
+                task, (values, previous), (values, optimizing)
+            )
+
+        segment = {'x1': 0.0, 'y1': 0.0, 'x2': 6.0, 'y2': 8.0}
+        point = {'x': 100.0, 'y': 103.0}
+        diagonal = {'x1': 0.0, 'y1': 0.0, 'x2': 500.0, 'y2': 500.0}
+        for figures, motion, n_steps in [
+            ([segment], 5.0, 2),  # Size is length of segment (10)
+            ([segment], 20.0, 8),
+            ([segment], 100.0, CONTINUATION_MAX_SUBSTEPS),
+            ([point], 10.0, 1),  # Points have no size
+            ([point, segment], 10.0, 4),
+            ([diagonal], 100.0, 1),
+            ([diagonal], 400.0, 3),
+        ]:
+            for shift in [(0, 0), (100, 500), (-300, 20)]:
+                assert get_steps_number(figures, motion, shift) == n_steps
+
+    def test_kernels_mode(self):
+        from restrictions import SegmentSpotFixed, SegmentLengthFixed
+
+        values = {
+            'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0},
+            'point': {'x': 1.0, 'y': 1.0},
+        }
+        targets = [
+            {'segment': {'x2': 0.0, 'y2': 10.0}},
+            {'segment': {'x1': 3.0, 'y1': 4.0}},  # Fixed spot
+            {'point': {'x': 3.0, 'y': 4.0}},  # Without restrictions
+        ]
+        results = []
+        for mode in SOLVER_MODES:
+            system = EquationsSystem(mode=mode)
+            system.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+            system.add_figure_symbols('point', ['x', 'y'])
+            symbols = system.get_symbols('segment')
+            for name, restriction in [
+                ('fixed_start', SegmentSpotFixed(0, 0, 'start')),
+                ('fixed_length', SegmentLengthFixed(5)),
+            ]:
+                system.add_restriction_equations(
+                    name,
+                    restriction.get_equations(symbols),
+                    restriction,
+                    ['segment'],
+                )
+            results.append(
+                [
+                    system.solve_optimization_task(target, values)
+                    for target in targets
+                ]
+            )
+
+            component = system._get_components()[
+                system._get_components().component_id('segment___x2')
+            ]
+            task = system._create_task(component, ['segment___x2'])
+            assert isinstance(task, KernelTask) == (mode == 'kernels')
+
+        for symbolic_result, kernels_result in zip(*results):
+            assert_2_level_dicts_equal(
+                symbolic_result, kernels_result, is_close=True
+            )
+        assert_2_level_dicts_equal(
+            results[1][0],
+            {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 0.0, 'y2': 5.0}},
+            is_close=True,
+        )
+
+        # Restriction without kernel is solved symbolically
+        system = EquationsSystem(mode='kernels')
+        system.add_figure_symbols('point', ['x', 'y'])
+        x = system.get_symbols('point', 'x')
+        system.add_restriction_equations('fixed_x', [sympy.Eq(x, 1.0)])
+        component = system._get_components()[
+            system._get_components().component_id('point___x')
+        ]
+        assert isinstance(
+            system._create_task(component, ['point___x']), OptimizationTask
+        )
+
+        with pytest.raises(IncorrectParamValue):
+            EquationsSystem(mode='unknown')
+
+    def test_rigid_motions(self, monkeypatch):
+        from restrictions import (
+            SegmentLengthFixed,
+            SegmentsNormal,
+            SegmentsSpotsJoint,
+            SegmentHorizontal,
+        )
+
+        # Corner of two joined normal segments with fixed lengths
+        values = {
+            's1': {'x1': 0.0, 'y1': 0.0, 'x2': 10.0, 'y2': 0.0},
+            's2': {'x1': 10.0, 'y1': 0.0, 'x2': 10.0, 'y2': 5.0},
+        }
+        restrictions = [
+            ('length_1', SegmentLengthFixed(10), ['s1']),
+            ('length_2', SegmentLengthFixed(5), ['s2']),
+            ('joint', SegmentsSpotsJoint('end', 'start'), ['s1', 's2']),
+            ('normal', SegmentsNormal(), ['s1', 's2']),
+        ]
+        targets = [
+            # Moving of center of segment and of its end
+            {'s1': {'x1': 3.0, 'y1': 4.0, 'x2': 13.0, 'y2': 4.0}},
+            {'s2': {'x2': 0.0, 'y2': 8.0}},
+        ]
+
+        def create_system(mode, horizontal):
+            system = EquationsSystem(mode=mode)
+            for figure_name in values:
+                system.add_figure_symbols(
+                    figure_name, ['x1', 'y1', 'x2', 'y2']
+                )
+            for name, restriction, figures_names in restrictions + (
+                [('horizontal', SegmentHorizontal(), ['s1'])]
+                if horizontal
+                else []
+            ):
+                symbols = [system.get_symbols(f) for f in figures_names]
+                system.add_restriction_equations(
+                    name,
+                    restriction.get_equations(*symbols),
+                    restriction,
+                    figures_names,
+                )
+            return system
+
+        solve_motion = EquationsSystem._solve_motion
+        motions = []
+
+        def spy(motion, desired_values, high_priority_desired_values):
+            result = solve_motion(
+                motion, desired_values, high_priority_desired_values
+            )
+            motions.append((motion.invariances, result))
+            return result
+
+        monkeypatch.setattr(
+            EquationsSystem, '_solve_motion', staticmethod(spy)
+        )
+        for mode in SOLVER_MODES:
+            for horizontal, invariances in [
+                (False, ('translation', 'rotation')),
+                (True, ('translation',)),
+            ]:
+                system = create_system(mode, horizontal)
+                for target in targets:
+                    result = system.solve_optimization_task(target, values)
+                    assert motions[-1][0] == invariances
+                    assert motions[-1][1] is not None
+
+                    # The same as solution of Lagrange method
+                    full_system = create_system('kernels', horizontal)
+                    monkeypatch.setattr(
+                        full_system, '_get_motions', lambda component: None
+                    )
+                    assert_2_level_dicts_equal(
+                        result,
+                        full_system.solve_optimization_task(target, values),
+                        is_close=True,
+                    )
+                    if horizontal:
+                        assert np.isclose(
+                            result['s1']['y1'], result['s1']['y2']
+                        )
+
+        # Motions are classified once
+        component = system._get_components()[
+            system._get_components().component_id('s1___x1')
+        ]
+        assert system._get_motions(component) is system._get_motions(component)
+
+        # Restrictions aren't satisfied by current values
+        result = system.solve_optimization_task(
+            targets[0], {**values, 's2': {**values['s2'], 'x1': 11.0}}
+        )
+        assert motions[-1][1] is None
+        assert np.isclose(result['s1']['x2'], result['s2']['x1'])
+
+        # Components that can be deformed or parts of figures aren't moved
+        system.remove_restriction_equations('normal')
+        assert system._get_motions(component) is None
+        system = EquationsSystem()
+        system.add_figure_symbols('s1', ['x1', 'y1', 'x2', 'y2'])
+        horizontal = SegmentHorizontal()
+        system.add_restriction_equations(
+            'horizontal',
+            horizontal.get_equations(system.get_symbols('s1')),
+            horizontal,
+            ['s1'],
+        )
+        component = system._get_components()[
+            system._get_components().component_id('s1___y1')
+        ]
+        assert system._get_motions(component) is None
+
+    def test_checking_of_restrictions(self, monkeypatch):
+        from restrictions import (
+            SegmentLengthFixed,
+            SegmentsNormal,
+            SegmentsParallel,
+            SegmentsSpotsJoint,
+        )
+
+        # Corner of two joined segments with fixed lengths
+        values = {
+            's1': {'x1': 0.0, 'y1': 0.0, 'x2': 10.0, 'y2': 0.0},
+            's2': {'x1': 10.0, 'y1': 0.0, 'x2': 10.0, 'y2': 5.0},
+        }
+        system = EquationsSystem(mode='kernels')
+
+        def add(name, restriction, figures_names):
+            symbols = [system.get_symbols(f) for f in figures_names]
+            system.add_restriction_equations(
+                name,
+                restriction.get_equations(*symbols),
+                restriction,
+                figures_names,
+                values,
+            )
+
+        for figure_name in values:
+            system.add_figure_symbols(figure_name, ['x1', 'y1', 'x2', 'y2'])
+        add('length_1', SegmentLengthFixed(10), ['s1'])
+        add('length_2', SegmentLengthFixed(5), ['s2'])
+
+        # Segments can be rotated to be parallel, though it's impossible in
+        # the first order
+        add('parallel', SegmentsParallel(), ['s1', 's2'])
+        system.remove_restriction_equations('parallel')
+
+        add('joint', SegmentsSpotsJoint('end', 'start'), ['s1', 's2'])
+        add('normal', SegmentsNormal(), ['s1', 's2'])
+
+        # Ranks of unchanged components are reused
+        from_kernels = ComponentRank.from_kernels
+        calls = []
+
+        def spy(*args):
+            calls.append(args)
+            return from_kernels(*args)
+
+        monkeypatch.setattr(ComponentRank, 'from_kernels', spy)
+        with pytest.raises(RedundantRestrictionError) as error:
+            add('normal_2', SegmentsNormal(), ['s1', 's2'])
+        assert error.value.restrictions_names == ['normal']
+        assert not calls
+        with pytest.raises(ConflictingRestrictionError) as error:
+            add('length_3', SegmentLengthFixed(7), ['s1'])
+        assert error.value.restrictions_names == ['length_1']
+        assert 'length_3' not in system._restrictions_names
+        with pytest.raises(ConflictingRestrictionError) as error:
+            add('parallel', SegmentsParallel(), ['s1', 's2'])
+        assert 'normal' in error.value.restrictions_names
+        assert isinstance(error.value, SystemIncompatibleError)
+
+        # Without kernels restrictions are checked structurally
+        system.add_figure_symbols('point', ['x', 'y'])
+        x = system.get_symbols('point', 'x')
+        system.add_restriction_equations('fixed_x', [sympy.Eq(x, 1.0)])
+        with pytest.raises(OverconstrainedError) as error:
+            system.add_restriction_equations(
+                'fixed_x_2',
+                [sympy.Eq(x, 2.0)],
+                current_values={**values, 'point': {'x': 1.0, 'y': 0.0}},
+            )
+        assert error.value.restrictions_names == ['fixed_x']
+
+    def test_checking_at_degenerate_values(self):
+        from restrictions import (
+            SegmentLengthFixed,
+            SegmentsAngleBetweenFixed,
+            SegmentsParallel,
+        )
+        from diagnostic_context import DEFAULT_COUNTERS
+
+        # The first segment has zero length, so its direction is arbitrary
+        values = {
+            's1': {'x1': 14.53, 'y1': 67.3, 'x2': 14.53, 'y2': 67.3},
+            's2': {'x1': 0.0, 'y1': 0.0, 'x2': 60.0, 'y2': 5.0},
+            's3': {'x1': 10.0, 'y1': 40.0, 'x2': 30.0, 'y2': 90.0},
+        }
+        system = EquationsSystem(mode='kernels')
+
+        def add(name, restriction, figures_names):
+            symbols = [system.get_symbols(f) for f in figures_names]
+            system.add_restriction_equations(
+                name,
+                restriction.get_equations(*symbols),
+                restriction,
+                figures_names,
+                values,
+            )
+
+        for figure_name in values:
+            system.add_figure_symbols(figure_name, ['x1', 'y1', 'x2', 'y2'])
+        add('parallel', SegmentsParallel(), ['s1', 's2'])
+
+        # Rows of both restrictions vanish at zero length, so length is left
+        # to solving
+        DEFAULT_COUNTERS.reset()
+        add('length_1', SegmentLengthFixed(10), ['s1'])
+        assert DEFAULT_COUNTERS['degenerate_ranks'] == 1
+        assert 'length_1' in system._restrictions_names
+
+        # Restrictions of not degenerate figures are checked near values
+        add('length_2', SegmentLengthFixed(20), ['s2'])
+        with pytest.raises(ConflictingRestrictionError) as error:
+            add('length_3', SegmentLengthFixed(30), ['s2'])
+        assert error.value.restrictions_names == ['length_2']
+
+        # Jacobian of angle isn't defined at zero length
+        add('angle', SegmentsAngleBetweenFixed(1.0), ['s1', 's3'])
+        assert DEFAULT_COUNTERS['degenerate_ranks'] == 2
+
+    def test_sparse_solvers(self, monkeypatch):
+        from restrictions import SegmentSpotFixed, SegmentLengthFixed
+        import solve
+
+        values = {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+        target = {'segment': {'x2': 0.0, 'y2': 10.0}}
+        answer = {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 0.0, 'y2': 5.0}}
+
+        # All systems are large
+        monkeypatch.setattr(solve, 'SPARSE_SOLVER_MIN_SIZE', 1)
+        for mode in SOLVER_MODES:
+            system = EquationsSystem(mode=mode)
+            system.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+            symbols = system.get_symbols('segment')
+            for name, restriction in [
+                ('fixed_start', SegmentSpotFixed(0, 0, 'start')),
+                ('fixed_length', SegmentLengthFixed(5)),
+            ]:
+                system.add_restriction_equations(
+                    name,
+                    restriction.get_equations(symbols),
+                    restriction,
+                    ['segment'],
+                )
+            result = system.solve_optimization_task(target, values)
+            assert_2_level_dicts_equal(result, answer, is_close=True)
+
+            if mode == 'symbolic':
+                compiled = list(system._compiled._items.values())[0]
+                assert compiled.jacobian is None
+                assert compiled.sparsity is not None
+
+    def test_remembered_strategies(self):
+        system = EquationsSystem()
+        system.add_figure_symbols('figure', ['x1', 'y1', 'x2', 'y2'])
+        f_ = system.get_symbols('figure')
+        f_x1, f_y1, f_x2, f_y2 = f_['x1'], f_['y1'], f_['x2'], f_['y2']
+        system.add_restriction_equations(
+            'fixed_length',
+            [sympy.Eq((f_x2 - f_x1) ** 2 + (f_y2 - f_y1) ** 2, 5 ** 2)],
+        )
+        values = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+        system.solve_optimization_task({'figure': {'x2': 10.0}}, values)
+
+        component = list(system._get_components())[0]
+        key = (tuple(component.equations), tuple(component.symbols))
+        assert system._solver.get_successful(key) == 'hybr'
+
+        system.remove_restriction_equations('fixed_length')
+        assert system._solver.get_successful(key) is None
+
+    def test_linear_systems(self):
+        from restrictions import SegmentSpotFixed, SegmentHorizontal
+
+        # Symbolic linear systems are solved without compilation
+        system = EquationsSystem()
+        system.add_figure_symbols('point', ['x', 'y'])
+        x = system.get_symbols('point', 'x')
+        y = system.get_symbols('point', 'y')
+        system.add_restriction_equations('sum', [sympy.Eq(x + y, 2.0)])
+        values = {'point': {'x': 0.0, 'y': 0.0}}
+        result = system.solve_optimization_task({'point': {'x': 5.0}}, values)
+        assert np.isclose(result['point']['x'] + result['point']['y'], 2.0)
+        assert np.isclose(result['point']['x'], 5.0, atol=1e-2)
+        assert_2_level_dicts_equal(
+            system.solve(values), {'point': {'x': 1.0, 'y': 1.0}}, True
+        )
+        assert len(system._compiled) == 0
+
+        system.add_restriction_equations(
+            'double', [sympy.Eq(2 * x + 2 * y, 4)]
+        )
+        with pytest.raises(SystemOverfittedError):
+            system.solve(values)
+        system.remove_restriction_equations('double')
+        system.add_restriction_equations('other', [sympy.Eq(x + y, 3.0)])
+        with pytest.raises(SystemIncompatibleError):
+            system.solve(values)
+
+        # Linear kernel systems
+        system = EquationsSystem(mode='kernels')
+        system.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+        symbols = system.get_symbols('segment')
+        for name, restriction in [
+            ('fixed_center', SegmentSpotFixed(1, 2, 'center')),
+            ('horizontal', SegmentHorizontal()),
+        ]:
+            system.add_restriction_equations(
+                name,
+                restriction.get_equations(symbols),
+                restriction,
+                ['segment'],
+            )
+        values = {'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+        result = system.solve_optimization_task(
+            {'segment': {'x2': 3.0, 'y2': 4.0}}, values
+        )
+        x2 = (2 + 3 * HIGH_PRIORITY_WEIGHT) / (1 + HIGH_PRIORITY_WEIGHT)
+        answer = {'segment': {'x1': 2 - x2, 'y1': 2.0, 'x2': x2, 'y2': 2.0}}
+        assert_2_level_dicts_equal(result, answer, is_close=True)
+
+    def test_linear_equations_elimination(self):
+        from kernels import KernelSystem
+        from restrictions import SegmentLengthFixed, SegmentSpotFixed
+
+        segment = ['s___x1', 's___y1', 's___x2', 's___y2']
+        kernels = [
+            (SegmentSpotFixed(1, 2, 'center'), segment),
+            (SegmentLengthFixed(5), segment),
+        ]
+        system = KernelSystem(kernels, segment)
+        target = np.array([0.0, 0.0, 5.0, 8.0])
+        weights = np.array([1.0, 1.0, HIGH_PRIORITY_WEIGHT, 1.0])
+        init = np.array([0.0, 2.0, 2.0, 2.0])
+
+        x, multipliers = EquationsSystem._solve_closest(
+            system, target, weights, init
+        )
+        expected_x, expected_multipliers = EquationsSystem._solve_lagrange(
+            system, target, weights, init
+        )
+        assert np.allclose(x, expected_x)
+        assert np.allclose(multipliers, expected_multipliers)
+        assert np.allclose(system.residuals(x), 0)
+
+        # Nonlinear equations are incompatible with linear ones
+        kernels.append((SegmentSpotFixed(1, 1, 'start'), segment))
+        with pytest.raises(SystemIncompatibleError):
+            EquationsSystem._solve_closest(
+                KernelSystem(kernels, segment), target, weights, init
+            )
+
+    def test_rigid_clusters(self, monkeypatch):
+        from kernels import KernelSystem
+        from restrictions import (
+            SegmentLengthFixed,
+            SegmentsNormal,
+            SegmentsSpotsJoint,
+        )
+
+        # Square with fixed sides
+        sides = [
+            [f's{i}___{name}' for name in ('x1', 'y1', 'x2', 'y2')]
+            for i in range(4)
+        ]
+        kernels = []
+        for i in range(4):
+            next_side = sides[(i + 1) % 4]
+            kernels.append((SegmentLengthFixed(5), sides[i]))
+            kernels.append(
+                (SegmentsSpotsJoint('end', 'start'), sides[i] + next_side)
+            )
+            kernels.append((SegmentsNormal(), sides[i] + next_side))
+        system = KernelSystem(kernels, [n for side in sides for n in side])
+        init = np.array(
+            [0, 0, 5, 0, 5, 0, 5, 5, 5, 5, 0, 5, 0, 5, 0, 0], dtype=float
+        )
+        target = init.copy()
+        target[2:4] = 10.0, 10.0
+        weights = np.ones(len(init))
+        weights[2:4] = HIGH_PRIORITY_WEIGHT
+
+        rigid_systems = []
+        get_rigid_system = EquationsSystem._get_rigid_system
+
+        def spy(system, x):
+            result = get_rigid_system(system, x)
+            rigid_systems.append(result[0])
+            return result
+
+        monkeypatch.setattr(
+            EquationsSystem, '_get_rigid_system', staticmethod(spy)
+        )
+        x, multipliers = EquationsSystem._solve_closest(
+            system, target, weights, init
+        )
+        assert rigid_systems[-1].shape == (1, 4)
+        assert multipliers.shape == (system.n_equations,)
+        assert np.allclose(system.residuals(x), 0)
+        # The same as solution of full system
+        expected_x, _ = EquationsSystem._solve_closest(
+            system, target, weights, init, sparse=False
+        )
+        assert np.allclose(x, expected_x)
+
+        # Restrictions of cluster are not satisfied
+        init[0] = 1.0
+        x, _ = EquationsSystem._solve_closest(system, target, weights, init)
+        assert rigid_systems[-1] is None
+        assert np.allclose(system.residuals(x), 0)
+
+    def test_solving_by_blocks(self, monkeypatch):
+        system = EquationsSystem()
+        system.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+        system.add_figure_symbols('point', ['x', 'y'])
+        s_ = system.get_symbols('segment')
+        p_ = system.get_symbols('point')
+        system.add_restriction_equations(
+            'fixed_start', [sympy.Eq(s_['x1'], 0.0), sympy.Eq(s_['y1'], 0.0)]
+        )
+        system.add_restriction_equations('fixed_x2', [sympy.Eq(s_['x2'], 3.0)])
+        system.add_restriction_equations(
+            'length',
+            [
+                sympy.Eq(
+                    (s_['x2'] - s_['x1']) ** 2 + (s_['y2'] - s_['y1']) ** 2,
+                    5 ** 2,
+                )
+            ],
+        )
+        system.add_restriction_equations(
+            'line', [sympy.Eq(p_['x'] + p_['y'], s_['y2'])]
+        )
+
+        solved_systems = []
+        solve_system = system._solve_system
+
+        def spy(equations, symbols, desired_values):
+            solved_systems.append(sorted(symbols))
+            return solve_system(equations, symbols, desired_values)
+
+        monkeypatch.setattr(system, '_solve_system', spy)
+
+        values = {
+            'segment': {'x1': 1.0, 'y1': 1.0, 'x2': 5.0, 'y2': 1.0},
+            'point': {'x': 0.0, 'y': 0.0},
+        }
+        result = system.solve(values)
+        answer = {
+            'segment': {'x1': 0.0, 'y1': 0.0, 'x2': 3.0, 'y2': 4.0},
+            'point': {'x': 2.0, 'y': 2.0},
+        }
+        assert_2_level_dicts_equal(result, answer, is_close=True)
+        assert len(solved_systems) == 5  # 4 blocks and underdetermined part
+        assert solved_systems[-1] == ['point___x', 'point___y']
+        # Only incidences of components are built, not of full system
+        assert system._incidence is None
+
+        # Blocks are not solved again until their inputs or values change
+        solved_systems.clear()
+        system.solve(result)
+        assert solved_systems == []
+        result['point'] = {'x': 5.0, 'y': 0.0}
+        result = system.solve(result)
+        assert solved_systems == [['point___x', 'point___y']]
+        assert np.isclose(result['point']['x'], 4.5)
+
+        # Changes of equations of block invalidate its solution
+        solved_systems.clear()
+        system.remove_restriction_equations('fixed_x2')
+        system.add_restriction_equations('fixed_x2', [sympy.Eq(s_['x2'], 4.0)])
+        result = system.solve(result)
+        assert np.isclose(result['segment']['y2'], 3.0)
+        assert ['segment___x2'] in solved_systems
+
+        # Decompositions are kept for components without new equations
+        components = system._get_components()
+        component = components[components.component_id('segment___x1')]
+        decomposition = component.decomposition
+        system.add_figure_symbols('other', ['x', 'y'])
+        o_ = system.get_symbols('other')
+        system.add_restriction_equations(
+            'other_line', [sympy.Eq(o_['x'] + o_['y'], 1.0)]
+        )
+        result['other'] = {'x': 0.0, 'y': 0.0}
+        system.solve(result)
+        assert decomposition is not None
+        assert component.decomposition is decomposition
+        assert system._incidence is None
+
+    def test_parallel_solving(self, monkeypatch):
+        import solve
+
+        def make_system(n_workers):
+            system = EquationsSystem(n_workers=n_workers)
+            for i in range(4):
+                name = f'segment_{i}'
+                system.add_figure_symbols(name, ['x1', 'y1', 'x2', 'y2'])
+                s_ = system.get_symbols(name)
+                system.add_restriction_equations(
+                    f'length_{i}',
+                    [
+                        sympy.Eq(
+                            (s_['x2'] - s_['x1']) ** 2
+                            + (s_['y2'] - s_['y1']) ** 2,
+                            (i + 1) ** 2,
+                        )
+                    ],
+                )
+            return system
+
+        values = {
+            f'segment_{i}': {'x1': 0.0, 'y1': 0.0, 'x2': 1.0, 'y2': 1.0}
+            for i in range(4)
+        }
+        expected = make_system(0).solve(values)
+
+        # Small systems are solved serially
+        system = make_system(2)
+        monkeypatch.setattr(
+            system,
+            '_solve_in_parallel',
+            lambda *args: pytest.fail('Solved in parallel.'),
+        )
+        assert_2_level_dicts_equal(system.solve(values), expected, True)
+
+        monkeypatch.setattr(solve, 'PARALLEL_SOLVING_MIN_EQUATIONS', 1)
+        system = make_system(2)
+        assert_2_level_dicts_equal(system.solve(values), expected, True)
+
+        # Solutions of blocks are returned from processes
+        assert len(system._blocks_solutions) == 4
+
+        # Subsystems are solved with the same settings
+        configured = EquationsSystem(
+            'kernels', 2, 1e-3, initial_guess='least_squares', n_restarts=3
+        )
+        configured.add_figure_symbols('segment', ['x1', 'y1', 'x2', 'y2'])
+        subsystem = configured._get_subsystem(
+            list(configured._get_components())
+        )
+        for name in [
+            '_mode',
+            '_n_workers',
+            '_memoization_quantum',
+            '_initial_guess',
+            '_n_restarts',
+        ]:
+            assert getattr(subsystem, name) == getattr(configured, name)
+
+        # Errors of processes are raised
+        s_ = system.get_symbols('segment_0')
+        system.add_restriction_equations(
+            'incompatible', [sympy.Eq(s_['x1'], 1.0), sympy.Eq(s_['x1'], 2.0)]
+        )
+        with pytest.raises(CannotSolveSystemError):
+            system.solve(values)
+
+        # Pools are shared, they are started again after shutdown
+        executor = get_executor(2)
+        assert get_executor(2) is executor
+        shutdown_executors()
+        assert get_executor(2) is not executor
+
+    def test_initial_guesses(self):
+        results = []
+        for initial_guess in INITIAL_GUESSES:
+            system = EquationsSystem(initial_guess=initial_guess, n_restarts=2)
+            system.add_figure_symbols('figure', ['x1', 'y1', 'x2', 'y2'])
+            f_ = system.get_symbols('figure')
+            f_x1, f_y1, f_x2, f_y2 = f_['x1'], f_['y1'], f_['x2'], f_['y2']
+            system.add_restriction_equations(
+                'fixed_length',
+                [sympy.Eq((f_x2 - f_x1) ** 2 + (f_y2 - f_y1) ** 2, 5 ** 2)],
+            )
+            values = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+            target = {'figure': {'x2': 1.0, 'y2': 10.0}}
+            result = system.solve_optimization_task(target, values)
+            # Solving is deterministic
+            assert system.solve_optimization_task(target, values) == result
+            restored = pickle.loads(pickle.dumps(system))
+            assert restored.solve_optimization_task(target, values) == result
+            results.append(result)
+        assert_2_level_dicts_equal(results[0], results[1], is_close=True)
+
+        with pytest.raises(IncorrectParamValue):
+            EquationsSystem(initial_guess='random')
+
+        # Restarts are tried concurrently by workers
+        system = EquationsSystem(n_workers=2, n_restarts=2)
+        assert system._solver.multi_start.n_workers == 2
+        assert EquationsSystem()._solver.multi_start is None
+
+    def test_solutions_memoization(self):
+        from diagnostic_context import DEFAULT_COUNTERS
+
+        system = EquationsSystem(memoization_quantum=1e-3)
+        system.add_figure_symbols('figure', ['x1', 'y1', 'x2', 'y2'])
+        f_ = system.get_symbols('figure')
+        f_x1, f_y1, f_x2, f_y2 = f_['x1'], f_['y1'], f_['x2'], f_['y2']
+        system.add_restriction_equations(
+            'fixed_length',
+            [sympy.Eq((f_x2 - f_x1) ** 2 + (f_y2 - f_y1) ** 2, 5 ** 2)],
+        )
+        values = {'figure': {'x1': 0.0, 'y1': 0.0, 'x2': 5.0, 'y2': 0.0}}
+        target = {'figure': {'x2': 10.0}}
+
+        DEFAULT_COUNTERS.reset()
+        result = system.solve_optimization_task(target, values)
+        assert DEFAULT_COUNTERS['solutions_memo_misses'] == 1
+        assert DEFAULT_COUNTERS['solutions_memo_hits'] == 0
+
+        # Close values have the same solution
+        target = {'figure': {'x2': 10.0 + 1e-5}}
+        assert system.solve_optimization_task(target, values) == result
+        assert DEFAULT_COUNTERS['solutions_memo_hits'] == 1
+
+        # Frames of moving are memoized too
+        session = system.create_drag_session({'figure': ['x2']})
+        assert session.solve(target, values) == result
+        assert DEFAULT_COUNTERS['solutions_memo_hits'] == 2
+        session.solve({'figure': {'x2': 11.0}}, values)
+        assert DEFAULT_COUNTERS['solutions_memo_misses'] == 2
+        assert len(system._solutions_memo) == 2
+
+        # Changes of component invalidate solutions
+        system.add_restriction_equations('fixed_x1', [sympy.Eq(f_x1, 1.0)])
+        assert len(system._solutions_memo) == 0
+        restored = pickle.loads(pickle.dumps(system))
+        assert len(restored._solutions_memo) == 0
+
+        assert EquationsSystem()._solutions_memo is None
@@ -0,0 +1,288 @@
+from strategies import *
+
+import numpy as np
+import pytest
+import time
+from scipy.sparse import csr_matrix
+
+
+def fun(x, params=()):
+    return np.array([x[0] ** 2 - 4, x[1] - x[0] * params[0]])
+
+
+def jac(x, params=()):
+    return np.array([[2 * x[0], 0], [-params[0], 1]])
+
+
+def sparse_jac(x, params=()):
+    return csr_matrix(jac(x, params))
+
+
+class FailingStrategy(SolverStrategy):
+    name = 'failing'
+
+    def _solve(self, problem, init, precision):
+        raise StrategyFailed('Always fails.')
+
+
+class FailingFromInitStrategy(HybrStrategy):
+    name = 'failing_from_init'
+
+    def _solve(self, problem, init, precision):
+        if np.allclose(init, [1.0, 0.0]):
+            raise StrategyFailed('Bad initial values.')
+        return super()._solve(problem, init, precision)
+
+
+class TestStrategies:
+    @pytest.mark.parametrize(
+        'strategy',
+        [
+            HybrStrategy(),
+            LeastSquaresStrategy('lm'),
+            LeastSquaresStrategy('trf'),
+            DampedNewtonStrategy(),
+        ],
+        ids=lambda s: s.name,
+    )
+    def test_strategies(self, strategy):
+        problem = RootProblem(fun, np.array([3.0]), jac)
+        assert np.allclose(strategy.solve(problem, [1.0, 0.0]), [2, 6])
+
+    def test_sparse_problems(self):
+        problem = RootProblem(fun, np.array([3.0]), sparse_jac, is_sparse=True)
+        assert not HybrStrategy().is_applicable(problem)
+        assert not LeastSquaresStrategy('lm').is_applicable(problem)
+        for strategy in [LeastSquaresStrategy('trf'), DampedNewtonStrategy()]:
+            assert np.allclose(strategy.solve(problem, [1.0, 0.0]), [2, 6])
+
+        # Jacobian is estimated by sparsity
+        problem = RootProblem(fun, np.array([3.0]), sparsity=np.ones((2, 2)))
+        assert problem.is_sparse
+        assert not DampedNewtonStrategy().is_applicable(problem)
+        x = LeastSquaresStrategy('trf').solve(problem, [1.0, 0.0])
+        assert np.allclose(x, [2, 6])
+
+    def test_no_root(self):
+        def no_root(x, params=()):
+            return np.array([x[0] ** 2 + 1, x[1]])
+
+        problem = RootProblem(no_root)
+        with pytest.raises(StrategyFailed):
+            HybrStrategy().solve(problem, [1.0, 1.0])
+        with pytest.raises(StrategyFailed):
+            LeastSquaresStrategy('lm').solve(problem, [1.0, 1.0])
+
+    def test_not_finite_problems(self):
+        def nan_jac(x, params=()):
+            return np.full((2, 2), np.nan)
+
+        def nan_sparse_jac(x, params=()):
+            return csr_matrix(nan_jac(x, params))
+
+        # Jacobian is not finite (e.g. at zero length segment)
+        for problem in [
+            RootProblem(fun, np.array([3.0]), nan_jac),
+            RootProblem(fun, np.array([3.0]), nan_sparse_jac, is_sparse=True),
+        ]:
+            with pytest.raises(StrategyFailed):
+                DampedNewtonStrategy().solve(problem, [1.0, 0.0])
+
+        # Residuals are not finite, all strategies fail and are tried
+        def nan_fun(x, params=()):
+            return np.full(2, np.nan)
+
+        problem = RootProblem(nan_fun, np.array([3.0]), jac)
+        selector = StrategySelector()
+        for strategy in selector.strategies:
+            with pytest.raises(StrategyFailed):
+                strategy.solve(problem, [1.0, 0.0])
+        with pytest.raises(StrategyFailed) as error:
+            selector.solve(problem, [1.0, 0.0])
+        for name in ['hybr', 'damped_newton', 'lm', 'trf']:
+            assert name in str(error.value)
+
+    def test_scale_of_tolerances(self):
+        def multiplier_fun(x, params=()):
+            return np.array([x[0] - 2, x[1] - 1e6])
+
+        # Large multiplier doesn't make tolerance of coordinates loose
+        x = np.array([2 + 1e-3, 1e6])
+        SolverStrategy._check_root(RootProblem(multiplier_fun), x)
+        problem = RootProblem(multiplier_fun, scaled=slice(1))
+        assert problem.scale(x) == pytest.approx(3.001)
+        with pytest.raises(StrategyFailed):
+            SolverStrategy._check_root(problem, x)
+        with pytest.raises(StrategyFailed):
+            SolverStrategy._check_root(StoppableProblem(problem), x)
+
+    @pytest.mark.parametrize(
+        'strategy',
+        [HybrStrategy(), LeastSquaresStrategy('lm'), DampedNewtonStrategy()],
+        ids=lambda s: s.name,
+    )
+    def test_precisions(self, strategy):
+        problem = RootProblem(fun, np.array([3.0]), jac)
+        coarse = Precision('coarse', 1e-2, max_evaluations=5)
+        with pytest.raises(StrategyFailed):
+            strategy.solve(problem, [1.0, 0.0], coarse)
+
+        # Unfinished solution is accepted, if it's close to root
+        coarse.accept_unfinished = True
+        x = strategy.solve(problem, [1.0, 0.0], coarse)
+        assert np.allclose(x, [2, 6], atol=1e-2)
+        assert np.allclose(strategy.solve(problem, x, POLISH), [2, 6])
+        assert coarse.limit(100) == 5 and POLISH.limit(100) == 100
+
+
+class TestInitialGuesses:
+    def test_multipliers(self):
+        jacobian_t = np.array([[1.0, 0.0], [0.0, 2.0], [0.0, 0.0]])
+        gradient = np.array([1.0, 2.0, 0.0])
+        zeros = INITIAL_GUESSES['zeros']
+        assert np.allclose(zeros.multipliers(2, gradient, jacobian_t), 0)
+        assert zeros.multipliers(2, gradient).shape == (2,)
+
+        least_squares = INITIAL_GUESSES['least_squares']
+        multipliers = least_squares.multipliers(2, gradient, jacobian_t)
+        assert np.allclose(multipliers, [-1, -1])
+        assert np.allclose(
+            least_squares.multipliers(2, gradient, csr_matrix(jacobian_t)),
+            multipliers,
+        )
+        assert np.allclose(least_squares.multipliers(2, gradient), 0)
+
+    def test_multi_start(self):
+        multi_start = MultiStart(3, seed=1)
+        starts = list(multi_start.starts([1.0, 0.0]))
+        assert len(starts) == 3
+        assert not np.allclose(starts[0], starts[1])
+        # Starts are reproducible
+        assert np.array_equal(
+            np.array(starts), np.array(list(multi_start.starts([1.0, 0.0])))
+        )
+
+
+class TestStrategySelector:
+    def test_selection(self):
+        selector = StrategySelector()
+        dense = RootProblem(fun, np.array([3.0]), jac)
+        assert [s.name for s in selector.select(dense)] == [
+            'hybr',
+            'damped_newton',
+            'lm',
+            'trf',
+        ]
+        without_jacobian = RootProblem(fun, np.array([3.0]))
+        assert [s.name for s in selector.select(without_jacobian)] == [
+            'hybr',
+            'lm',
+            'trf',
+        ]
+        sparse = RootProblem(fun, np.array([3.0]), sparse_jac, is_sparse=True)
+        assert [s.name for s in selector.select(sparse)] == [
+            'damped_newton',
+            'trf',
+        ]
+
+    def test_fallback_and_memory(self):
+        selector = StrategySelector(
+            [FailingStrategy(), LeastSquaresStrategy('lm'), HybrStrategy()]
+        )
+        problem = RootProblem(fun, np.array([3.0]), jac)
+        x = selector.solve(problem, [1.0, 0.0], key='component')
+        assert np.allclose(x, [2, 6])
+        assert selector.get_successful('component') == 'lm'
+        assert selector.select(problem, 'component')[0].name == 'lm'
+        assert selector.select(problem)[0].name == 'failing'
+
+        selector.forget(lambda key: key == 'component')
+        assert selector.get_successful('component') is None
+
+        selector = StrategySelector([FailingStrategy()])
+        with pytest.raises(StrategyFailed):
+            selector.solve(problem, [1.0, 0.0], key='component')
+        assert selector.get_successful('component') is None
+
+    def test_restarts(self):
+        problem = RootProblem(fun, np.array([3.0]), jac)
+        selector = StrategySelector([FailingFromInitStrategy()])
+        with pytest.raises(StrategyFailed):
+            selector.solve(problem, [1.0, 0.0])
+
+        # Perturbed starts are tried only after failure
+        selector.multi_start = MultiStart(2)
+        assert np.allclose(selector.solve(problem, [1.0, 0.0]), [2, 6])
+        assert np.allclose(selector.solve(problem, [3.0, 0.0]), [2, 6])
+        with pytest.raises(StrategyFailed):
+            StrategySelector(
+                [FailingStrategy()], multi_start=MultiStart(2)
+            ).solve(problem, [1.0, 0.0])
+
+    def test_concurrent_restarts(self):
+        problem = RootProblem(fun, np.array([3.0]), jac)
+        multi_start = MultiStart(4, n_workers=2)
+        selector = StrategySelector(
+            [FailingFromInitStrategy()], multi_start=multi_start
+        )
+        x = selector.solve(problem, [1.0, 0.0], key='component')
+        assert np.allclose(x, [2, 6])
+        assert selector.get_successful('component') == 'failing_from_init'
+        assert get_executor(2) is get_executor(2)
+
+        # The closest to initial values of finished solutions is chosen
+        def any_root(x, params=()):
+            return np.zeros(2)
+
+        class IdentityStrategy(FailingFromInitStrategy):
+            def _solve(self, problem, init, precision):
+                if np.allclose(init, [1.0, 0.0]):
+                    raise StrategyFailed('Bad initial values.')
+                return init
+
+        selector = StrategySelector(
+            [IdentityStrategy()], multi_start=multi_start
+        )
+        x = selector.solve(RootProblem(any_root), [1.0, 0.0])
+        starts = list(multi_start.starts([1.0, 0.0]))
+        assert any(np.array_equal(x, start) for start in starts)
+
+        with pytest.raises(StrategyFailed):
+            StrategySelector(
+                [FailingStrategy()], multi_start=multi_start
+            ).solve(problem, [1.0, 0.0])
+
+        # Running starts are stopped after the first success
+        evaluations = []
+
+        def counted_root(x, params=()):
+            evaluations.append(x)
+            return np.zeros(2)
+
+        first_start = starts[0]
+
+        class EndlessStrategy(FailingFromInitStrategy):
+            def _solve(self, problem, init, precision):
+                if np.allclose(init, [1.0, 0.0]):
+                    raise StrategyFailed('Bad initial values.')
+                if np.array_equal(init, first_start):
+                    return init
+                while True:
+                    problem.fun(init, problem.params)
+
+        selector = StrategySelector(
+            [EndlessStrategy()], multi_start=multi_start
+        )
+        x = selector.solve(RootProblem(counted_root), [1.0, 0.0])
+        assert np.array_equal(x, first_start)
+        n_evaluations = len(evaluations)
+        time.sleep(0.05)
+        assert len(evaluations) == n_evaluations
+
+        stoppable = StoppableProblem(RootProblem(fun, np.array([3.0]), jac))
+        assert np.allclose(stoppable.fun([2.0, 6.0], stoppable.params), 0)
+        stoppable.stop()
+        with pytest.raises(StrategyFailed):
+            stoppable.fun([2.0, 6.0], stoppable.params)
+        with pytest.raises(StrategyFailed):
+            stoppable.jac([2.0, 6.0], stoppable.params)
@@ -0,0 +1,79 @@
+from structure import *
+
+import numpy as np
+
+
+class TestIncidence:
+    equations_symbols = {
+        'eq1': {'a', 'b'},
+        'eq2': {'b', 'c', 'd'},
+        'eq3': {'e'},
+        'eq4': {'zzz'},  # unknown symbol is ignored
+    }
+    symbols_names = ['a', 'b', 'c', 'd', 'e', 'f']
+
+    def test_matrix(self):
+        incidence = Incidence(self.equations_symbols, self.symbols_names)
+        assert incidence.shape == (4, 6)
+        answer = np.array(
+            [
+                [1, 1, 0, 0, 0, 0],
+                [0, 1, 1, 1, 0, 0],
+                [0, 0, 0, 0, 1, 0],
+                [0, 0, 0, 0, 0, 0],
+            ]
+        )
+        assert np.array_equal(incidence.matrix.toarray(), answer)
+        assert incidence.equation_symbols('eq2') == ['b', 'c', 'd']
+
+    def test_connected_components(self):
+        incidence = Incidence(self.equations_symbols, self.symbols_names)
+        components = sorted(
+            (sorted(symbols), sorted(equations))
+            for symbols, equations in incidence.connected_components()
+        )
+        assert components == [
+            ([], ['eq4']),
+            (['a', 'b', 'c', 'd'], ['eq1', 'eq2']),
+            (['e'], ['eq3']),
+            (['f'], []),
+        ]
+
+    def test_block_triangular(self):
+        equations_symbols = {
+            'fixed_a': {'a'},
+            'ab': {'a', 'b'},
+            'bcd_1': {'b', 'c', 'd'},
+            'bcd_2': {'b', 'c', 'd'},
+            'dfg': {'d', 'f', 'g'},
+            'xy_1': {'x', 'y'},
+            'xy_2': {'x', 'y'},
+            'x_1': {'x'},
+        }
+        incidence = Incidence(equations_symbols, list('abcdfgxy'))
+        underdetermined, blocks, overdetermined = incidence.block_triangular()
+        assert underdetermined == (['f', 'g'], ['dfg'])
+        assert overdetermined == (['x', 'y'], ['xy_1', 'xy_2', 'x_1'])
+        assert [
+            (sorted(symbols), sorted(equations))
+            for symbols, equations in blocks
+        ] == [
+            (['a'], ['fixed_a']),
+            (['b'], ['ab']),
+            (['c', 'd'], ['bcd_1', 'bcd_2']),
+        ]
+
+        # Blocks of independent chains are ordered by dependencies only
+        incidence = Incidence(
+            {'e1': {'a', 'b'}, 'e2': {'b'}, 'e3': {'c'}, 'e4': {'c', 'd'}},
+            list('abcd'),
+        )
+        underdetermined, blocks, overdetermined = incidence.block_triangular()
+        assert underdetermined == ([], []) and overdetermined == ([], [])
+        order = [equations[0] for _, equations in blocks]
+        assert sorted(order) == ['e1', 'e2', 'e3', 'e4']
+        assert order.index('e2') < order.index('e1')
+        assert order.index('e3') < order.index('e4')
+
+        empty = Incidence({}, ['a'])
+        assert empty.block_triangular() == ((['a'], []), [], ([], []))
@@ -88,3 +88,48 @@ def test_stack():
         s.pop()
     with pytest.raises(EmptyStackError):
         s.get_head()
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'a' is recently used now
+    cache.put('c', 3)  # 'b' is evicted
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('b', 0) == 0
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    assert cache.items() == [('a', 1), ('c', 3)]
+    assert cache.items(lambda key: key == 'c') == [('c', 3)]
+    cache.get('a')
+    assert cache.items() == [('c', 3), ('a', 1)]
+
+    cache.remove_if(lambda key: key == 'a')
+    assert 'a' not in cache and 'c' in cache
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_union_find():
+    uf = UnionFind()
+    for item in 'abcde':
+        uf.add(item)
+    uf.add('a')  # nothing happens
+    assert len(uf) == 5 and 'a' in uf and 'z' not in uf
+
+    uf.union('a', 'b')
+    uf.union('c', 'd')
+    assert uf.find('a') == uf.find('b')
+    assert uf.find('a') != uf.find('c')
+
+    root = uf.union('b', 'd')
+    assert all(uf.find(item) == root for item in 'abcd')
+    assert uf.find('e') == 'e'
+
+    groups = sorted(sorted(group) for group in uf.groups().values())
+    assert groups == [['a', 'b', 'c', 'd'], ['e']]
@@ -1,4 +1,5 @@
 from contracts import contract
+from collections import OrderedDict
 import numpy as np
 
 BIG_DISTANCE = 10000
@@ -87,6 +88,106 @@ class Stack:
         return len(self._arr)
 
 
+class LRUCache:
+    """Mapping with bounded size that evicts least recently used items."""
+
+    @contract(maxsize='int, >0')
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._items = OrderedDict()
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    def get(self, key, default=None):
+        """Return value for key (and mark it as recently used) or default."""
+        try:
+            value = self._items[key]
+        except KeyError:
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Save value, evict least recently used items if cache is full."""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def remove_if(self, condition: callable):
+        """Remove all items which keys satisfy condition."""
+        for key in [key for key in self._items if condition(key)]:
+            del self._items[key]
+
+    def items(self, condition: callable = None) -> list:
+        """Items (key, value) which keys satisfy condition (all items if it's
+        None), they are not marked as recently used.
+        """
+        return [
+            (key, value)
+            for key, value in self._items.items()
+            if condition is None or condition(key)
+        ]
+
+    def clear(self):
+        """Delete all items."""
+        self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class UnionFind:
+    """Disjoint sets of hashable items (union by size, path halving)."""
+
+    def __init__(self):
+        self._parents = dict()
+        self._sizes = dict()
+
+    def add(self, item):
+        """Add item as a new set (nothing happens if item already exists)."""
+        if item not in self._parents:
+            self._parents[item] = item
+            self._sizes[item] = 1
+
+    def find(self, item):
+        """Return root item of set that contains given item."""
+        parents = self._parents
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    def union(self, item1, item2):
+        """Merge sets of two items, return root of merged set."""
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 == root2:
+            return root1
+        if self._sizes[root1] < self._sizes[root2]:
+            root1, root2 = root2, root1
+        self._parents[root2] = root1
+        self._sizes[root1] += self._sizes.pop(root2)
+        return root1
+
+    def groups(self) -> dict:
+        """Return dict root -> list of items of set."""
+        result = dict()
+        for item in self._parents:
+            result.setdefault(self.find(item), []).append(item)
+        return result
+
+    def __contains__(self, item):
+        return item in self._parents
+
+    def __len__(self):
+        return len(self._parents)
+
+
 class ReferencedToObjects:
     """Interface for objects that are referenced to other object"""
 
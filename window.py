@@ -788,9 +788,11 @@ class WindowContent(QOpenGLWidget, Ui_window):
                 if len(bindings) > 0:
                     if self.action_st == ActionSt.NOTHING:
                         self._moved_binding = bindings[0]
+                        self._project.begin_drag(self._moved_binding)
                         self.action_st = ActionSt.BINDING_PRESSED
                     if self.action_st == ActionSt.SELECTED:
                         self._moved_binding = bindings[0]
+                        self._project.begin_drag(self._moved_binding)
                         self.action_st = (
                             ActionSt.BINDING_PRESSED_WHILE_SELECTED
                         )
@@ -818,7 +820,7 @@ class WindowContent(QOpenGLWidget, Ui_window):
         ):
 
             try:
-                self._project.move_figure(self._moved_binding, x, y)
+                self._project.drag_to(x, y)
                 self._update_fields()
             except CannotSolveSystemError:
                 self._project.rollback()
@@ -841,6 +843,10 @@ class WindowContent(QOpenGLWidget, Ui_window):
     def mouseReleaseEvent(self, event):
         self._logger.debug('mouseReleaseEvent: start')
         if event.button() == Qt.LeftButton:
+            try:
+                self._project.end_drag()
+            except CannotSolveSystemError:
+                pass  # Position of the last frame is kept without polish
 
             if self.action_st == ActionSt.MOVE:
                 self._project.commit()